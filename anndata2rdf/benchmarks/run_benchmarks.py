@@ -0,0 +1,224 @@
+import argparse
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+from importlib import metadata
+from typing import Dict, List, Optional
+
+BENCHMARK_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCHMARK_DIRECTORY), "src"))
+
+from generate_rdf import generate_rdf_graph  # noqa: E402
+from process import collect_worker, start_worker  # noqa: E402
+from synthetic_h5ad import write_synthetic_h5ad  # noqa: E402
+
+logging.basicConfig(level=logging.WARNING)
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Timings depend on the machine, so the baseline is not versioned but written by the
+# first run on each machine
+BASELINE = os.path.join(BENCHMARK_DIRECTORY, "baseline.json")
+# A run is a regression if it is slower or larger than the baseline by more than this
+TOLERANCE = 0.25
+# Differences below these are noise, whatever their ratio
+MIN_TIME_DIFFERENCE = 0.5  # seconds
+MIN_MEMORY_DIFFERENCE = 64 * 1024**2  # bytes
+
+
+def get_environment() -> Dict:
+    def _version(package):
+        try:
+            return metadata.version(package)
+        except metadata.PackageNotFoundError:
+            return None
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        **{
+            package: _version(package)
+            for package in ["pandasaurus-cxg", "pandas", "numpy", "anndata", "rdflib"]
+        },
+    }
+
+
+def get_case_name(case: Dict) -> str:
+    return (
+        f"cells={case['n_cells']},fields={case['n_author_fields']},"
+        f"clusters={case['n_clusters']},depth={case['depth']}"
+    )
+
+
+def run_case(case: Dict, work_directory: str, output_format: str) -> Dict:
+    """
+    Convert the synthetic dataset of a grid point in a fresh subprocess.
+
+    Args:
+        case: The parameters of `make_synthetic_obs`.
+        work_directory: The directory of the synthetic h5ad files and the graphs.
+        output_format: The output format of `generate_rdf_graph`.
+
+    Returns:
+        The case with its status, wall time, peak RSS, stage timings and counters.
+    """
+    name = get_case_name(case)
+    h5ad_path = os.path.join(work_directory, f"{name.replace(',', '_')}.h5ad")
+    author_fields_path = f"{h5ad_path}.fields.json"
+    if not os.path.exists(h5ad_path):
+        logger.info(f"Generating {h5ad_path}...")
+        author_fields = write_synthetic_h5ad(h5ad_path, **case)
+        with open(author_fields_path, "w") as author_fields_file:
+            json.dump(author_fields, author_fields_file)
+    with open(author_fields_path, "r") as author_fields_file:
+        author_fields = json.load(author_fields_file)
+
+    output_rdf_path = os.path.join(work_directory, f"{name.replace(',', '_')}_graph")
+    context = multiprocessing.get_context("spawn")
+    start = time.perf_counter()
+    process, receiver = start_worker(
+        context,
+        generate_rdf_graph,
+        (h5ad_path, author_fields, output_rdf_path, output_format),
+        f"benchmark-{name}",
+        name,
+    )
+    status, reason, metrics = collect_worker(process, receiver)
+    elapsed = time.perf_counter() - start
+    logger.info(f"{name}: {status} in {elapsed:.1f}s")
+    for extension in (".owl", ".nt.gz", ".nq.gz"):
+        if os.path.exists(output_rdf_path + extension):
+            os.remove(output_rdf_path + extension)
+    return {
+        "name": name,
+        **case,
+        "status": status,
+        "reason": reason,
+        # The conversion itself, without starting the subprocess
+        "wall_time_seconds": metrics.get("wall_time_seconds"),
+        "peak_rss_bytes": metrics.get("peak_rss_bytes"),
+        "stages": metrics.get("stages", {}),
+        "counters": metrics.get("counters", {}),
+    }
+
+
+def compare_with_baseline(
+    results: List[Dict], baseline: Dict, tolerance: float = TOLERANCE
+) -> List[str]:
+    """
+    Compare the time and memory of each case with the baseline run.
+
+    Args:
+        results: The results of `run_case`.
+        baseline: A previous output of this harness.
+        tolerance: The allowed relative increase.
+
+    Returns:
+        A description of each regression.
+    """
+    baseline_results = {result["name"]: result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        reference = baseline_results.get(result["name"])
+        if reference is None or reference["status"] != "succeeded":
+            continue
+        if result["status"] != "succeeded":
+            regressions.append(f"{result['name']}: {result['reason']}")
+            continue
+        for key, minimum_difference in [
+            ("wall_time_seconds", MIN_TIME_DIFFERENCE),
+            ("peak_rss_bytes", MIN_MEMORY_DIFFERENCE),
+        ]:
+            value, reference_value = result[key], reference[key]
+            ratio = value / reference_value if reference_value else 1.0
+            logger.info(
+                f"{result['name']:<50} {key:<18} {reference_value:>14} -> {value:>14}"
+                f" ({ratio:.2f}x)"
+            )
+            if ratio > 1 + tolerance and value - reference_value > minimum_difference:
+                regressions.append(
+                    f"{result['name']}: {key} {reference_value} -> {value} "
+                    f"({ratio:.2f}x)"
+                )
+    return regressions
+
+
+def parse_arguments(arguments: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Benchmark generate_rdf_graph on a grid of synthetic datasets."
+    )
+    parser.add_argument("--cells", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--author-fields", type=int, nargs="+", default=[2, 4])
+    parser.add_argument("--clusters", type=int, nargs="+", default=[50, 500])
+    parser.add_argument("--depth", type=int, nargs="+", default=[2])
+    parser.add_argument("--output-format", default="owl", choices=["owl", "nt", "nq"])
+    parser.add_argument(
+        "--work-directory",
+        help="Where the synthetic h5ad files are kept. Defaults to a temporary directory.",
+    )
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="Store the results as the new baseline instead of comparing with it. "
+        "The first run stores them when there is no baseline yet.",
+    )
+    return parser.parse_args(arguments)
+
+
+def main(arguments: Optional[List[str]] = None) -> int:
+    args = parse_arguments(arguments)
+    grid = [
+        {
+            "n_cells": n_cells,
+            "n_author_fields": n_author_fields,
+            "n_clusters": n_clusters,
+            "depth": depth,
+        }
+        for n_cells, n_author_fields, n_clusters, depth in itertools.product(
+            args.cells, args.author_fields, args.clusters, args.depth
+        )
+    ]
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        work_directory = args.work_directory or temporary_directory
+        os.makedirs(work_directory, exist_ok=True)
+        results = [run_case(case, work_directory, args.output_format) for case in grid]
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "output_format": args.output_format,
+        "environment": get_environment(),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+    if args.update_baseline or not os.path.exists(args.baseline):
+        with open(args.baseline, "w") as baseline_file:
+            json.dump(report, baseline_file, indent=2)
+        logger.info(f"Baseline written to {args.baseline}")
+        return 0
+    with open(args.baseline, "r") as baseline_file:
+        baseline = json.load(baseline_file)
+    if baseline.get("output_format") != args.output_format:
+        logger.warning(
+            f"The baseline was measured with the '{baseline.get('output_format')}' "
+            f"output format."
+        )
+    regressions = compare_with_baseline(results, baseline, args.tolerance)
+    for regression in regressions:
+        logger.error(f"Regression: {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+import uuid
+from typing import Dict, List
+
+import anndata
+import numpy as np
+import pandas as pd
+
+CELL_TYPES = [
+    ("CL:0000084", "T cell"),
+    ("CL:0000236", "B cell"),
+    ("CL:0000576", "monocyte"),
+    ("CL:0000623", "natural killer cell"),
+    ("CL:0000115", "endothelial cell"),
+    ("CL:0000066", "epithelial cell"),
+    ("CL:0000057", "fibroblast"),
+    ("CL:0000235", "macrophage"),
+]
+# The share of the cells of a noisy cluster that get a random label
+NOISY_CELLS = 0.05
+# Values of the metadata fields of generate_rdf.METADATA_FIELDS
+METADATA_VALUES: Dict[str, List[tuple]] = {
+    "tissue": [
+        ("UBERON:0002048", "lung"),
+        ("UBERON:0002113", "kidney"),
+        ("UBERON:0002107", "liver"),
+        ("UBERON:0000948", "heart"),
+        ("UBERON:0000955", "brain"),
+    ],
+    "disease": [("PATO:0000461", "normal"), ("MONDO:0005148", "type 2 diabetes")],
+    "development_stage": [
+        ("HsapDv:0000087", "human adult stage"),
+        ("HsapDv:0000088", "human late adulthood stage"),
+    ],
+    "organism": [("NCBITaxon:9606", "Homo sapiens")],
+    "sex": [("PATO:0000384", "male"), ("PATO:0000383", "female")],
+    "assay": [("EFO:0009922", "10x 3' v3"), ("EFO:0009899", "10x 3' v2")],
+    "self_reported_ethnicity": [
+        ("HANCESTRO:0005", "European"),
+        ("HANCESTRO:0008", "Asian"),
+        ("unknown", "unknown"),
+    ],
+}
+
+
+def make_synthetic_obs(
+    n_cells: int,
+    n_author_fields: int = 2,
+    n_clusters: int = 50,
+    depth: int = 2,
+    noise: float = 0.1,
+    seed: int = 0,
+) -> pd.DataFrame:
+    """
+    Generate the obs of a CxG dataset with hierarchical author annotations.
+
+    The finest hierarchy level has `n_clusters` clusters, and each level above it merges
+    clusters of the level below, `depth` levels in total. Author fields
+    are spread over the levels, so fields on the same level match each other and
+    fields on different levels form subcluster relations. In a `noise` fraction of the
+    clusters of each field, some cells are relabelled at random, which turns the
+    relations of these clusters into overlaps.
+
+    Args:
+        n_cells: The number of cells.
+        n_author_fields: The number of author cell type fields.
+        n_clusters: The number of clusters of the finest level.
+        depth: The number of hierarchy levels.
+        noise: The fraction of clusters with relabelled cells in each field.
+        seed: The random seed.
+
+    Returns:
+        The obs DataFrame, with categorical author, cell type and metadata columns.
+    """
+    rng = np.random.default_rng(seed)
+    branching = max(round(n_clusters ** (1 / depth)), 2)
+    leaves = rng.integers(0, n_clusters, n_cells)
+    levels = [leaves // branching**level for level in range(depth)]
+
+    columns = {}
+    for field in range(n_author_fields):
+        level = field % depth
+        labels = levels[level].copy()
+        noisy_clusters = rng.random(labels.max() + 1) < noise
+        relabelled = noisy_clusters[labels] & (rng.random(n_cells) < NOISY_CELLS)
+        labels[relabelled] = rng.integers(0, labels.max() + 1, relabelled.sum())
+        columns[f"author_level{level}_{field}"] = pd.Categorical.from_codes(
+            labels, [f"level {level} cluster {i}" for i in range(labels.max() + 1)]
+        )
+
+    cell_types = levels[-1] % len(CELL_TYPES)
+    columns["cell_type_ontology_term_id"] = pd.Categorical.from_codes(
+        cell_types, [curie for curie, _ in CELL_TYPES]
+    )
+    columns["cell_type"] = pd.Categorical.from_codes(
+        cell_types, [label for _, label in CELL_TYPES]
+    )
+    for field, values in METADATA_VALUES.items():
+        codes = rng.integers(0, len(values), n_cells)
+        columns[f"{field}_ontology_term_id"] = pd.Categorical.from_codes(
+            codes, [curie for curie, _ in values]
+        )
+        columns[field] = pd.Categorical.from_codes(
+            codes, [label for _, label in values]
+        )
+    return pd.DataFrame(columns, index=[f"cell_{i}" for i in range(n_cells)])
+
+
+def write_synthetic_h5ad(file_path: str, seed: int = 0, **parameters) -> List[str]:
+    """
+    Write a synthetic h5ad file with the obs of `make_synthetic_obs` and no matrix.
+
+    Args:
+        file_path: The path of the h5ad file.
+        seed: The random seed.
+        **parameters: The parameters of `make_synthetic_obs`.
+
+    Returns:
+        The names of the author cell type fields.
+    """
+    obs = make_synthetic_obs(seed=seed, **parameters)
+    dataset_id = uuid.UUID(int=seed)
+    uns = {
+        "title": "Synthetic benchmark dataset",
+        "schema_version": "5.0.0",
+        "citation": (
+            "Publication: https://doi.org/10.0000/synthetic Dataset Version: "
+            f"https://datasets.cellxgene.cziscience.com/{dataset_id}.h5ad curated and "
+            "distributed by CZ CELLxGENE Discover in Collection: "
+            "https://cellxgene.cziscience.com/collections/synthetic"
+        ),
+    }
+    anndata.AnnData(obs=obs, uns=uns).write_h5ad(file_path)
+    return [column for column in obs.columns if column.startswith("author_")]
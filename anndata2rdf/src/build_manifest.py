@@ -0,0 +1,158 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from functools import lru_cache
+from importlib import metadata
+from typing import Dict, List, Optional
+
+logging.basicConfig(level=logging.WARNING)
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Kept next to the curated configuration rather than in graph/, which the downstream
+# pipeline reads as a directory of ontologies
+BUILD_MANIFEST = os.path.join("config", "build_manifest.json")
+# The extensions of the rdf_writer output formats
+GRAPH_FILE_EXTENSIONS = (".owl", ".nt.gz", ".nq.gz")
+# The obs metadata fields added to every graph. Part of the input hash, and defined
+# here so that planning does not import the graph generation stack.
+METADATA_FIELDS = [
+    "tissue",
+    "disease",
+    "development_stage",
+    "organism",
+    "sex",
+    "assay",
+    "self_reported_ethnicity",
+]
+
+
+def get_manifest_path() -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), BUILD_MANIFEST)
+
+
+@lru_cache(maxsize=None)
+def get_pandasaurus_cxg_version() -> str:
+    try:
+        return metadata.version("pandasaurus-cxg")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def compute_input_hash(
+    matrix_id: str,
+    download_id: str,
+    author_cell_type_list: List[str],
+    metadata_fields: List[str],
+    tool_version: Optional[str] = None,
+) -> str:
+    """
+    Hash everything a dataset's RDF graph is generated from.
+
+    Args:
+        matrix_id: The CxG dataset identifier.
+        download_id: The identifier of the downloaded dataset version.
+        author_cell_type_list: The author cell type fields of the dataset.
+        metadata_fields: The obs metadata fields added to the graph.
+        tool_version: The pandasaurus-cxg version. Defaults to the installed version.
+
+    Returns:
+        A hex SHA-256 digest of the inputs.
+    """
+    inputs = {
+        "matrix_id": matrix_id,
+        "download_id": download_id,
+        "author_cell_type_list": list(author_cell_type_list),
+        "metadata_fields": list(metadata_fields),
+        "pandasaurus_cxg": tool_version or get_pandasaurus_cxg_version(),
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+
+def load_manifest(manifest_path: Optional[str] = None) -> Dict:
+    """Load the build manifest, or return an empty one if it is missing or invalid."""
+    manifest_path = manifest_path or get_manifest_path()
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, "r") as manifest_file:
+            return json.load(manifest_file)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable build manifest '{manifest_path}': {e}")
+        return {}
+
+
+def save_manifest(manifest: Dict, manifest_path: Optional[str] = None):
+    """Atomically write the build manifest."""
+    manifest_path = manifest_path or get_manifest_path()
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def record_build(manifest: Dict, job: Dict, output_path: str):
+    """Record a successfully generated graph in the manifest."""
+    manifest[job["matrix_id"]] = {
+        "input_hash": job["input_hash"],
+        "download_id": job["download_id"],
+        "output": os.path.basename(output_path),
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def index_graph_directory(directory: str) -> Dict[str, List[str]]:
+    """
+    List the generated graphs of a directory in a single scan.
+
+    Args:
+        directory: The directory of '<matrix_id>__<download_id>.<extension>' graphs.
+
+    Returns:
+        A dictionary mapping each matrix_id to the paths of its graphs.
+    """
+    graph_index: Dict[str, List[str]] = {}
+    if not os.path.isdir(directory):
+        return graph_index
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if not entry.is_file() or not entry.name.endswith(GRAPH_FILE_EXTENSIONS):
+                continue
+            matrix_id, separator, _ = entry.name.partition("__")
+            if separator:
+                graph_index.setdefault(matrix_id, []).append(entry.path)
+    return graph_index
+
+
+def is_up_to_date(
+    manifest: Dict,
+    graph_index: Dict[str, List[str]],
+    matrix_id: str,
+    input_hash: str,
+    output_name: Optional[str] = None,
+) -> bool:
+    """
+    Check whether the graph of a dataset exists and was built from the same inputs.
+
+    Args:
+        manifest: The build manifest.
+        graph_index: The output of `index_graph_directory`.
+        matrix_id: The CxG dataset identifier.
+        input_hash: The output of `compute_input_hash` for the dataset.
+        output_name: The expected file name of the graph, if its format matters.
+
+    Returns:
+        True if the recorded graph can be reused.
+    """
+    entry = manifest.get(matrix_id)
+    if not entry or entry.get("input_hash") != input_hash:
+        return False
+    if output_name is not None and entry.get("output") != output_name:
+        return False
+    return any(
+        os.path.basename(path) == entry.get("output")
+        for path in graph_index.get(matrix_id, [])
+    )
@@ -0,0 +1,239 @@
+import logging
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+logging.basicConfig(level=logging.WARNING)
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+REPORT_COLUMNS = [
+    "field_name1",
+    "value1",
+    "predicate",
+    "field_name2",
+    "value2",
+    "field_name1_cell_count",
+    "field_name2_cell_count",
+]
+# Contingency tables up to this many cells are counted with np.bincount, larger ones
+# are reduced to their non-zero cells with np.unique
+CONTINGENCY_TABLE_MAX_SIZE = 1 << 22
+
+
+def encode_column(column: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Encode an obs column as integer codes.
+
+    Missing values get a code of their own, the last one, because the co-annotation
+    report treats them as a value when it counts the partners of a cluster.
+
+    Args:
+        column: An obs column.
+
+    Returns:
+        The codes of the cells, and the values of the codes with NaN as the last one.
+    """
+    codes, uniques = pd.factorize(column, use_na_sentinel=True)
+    values = np.append(np.asarray(uniques, dtype=object), np.nan)
+    codes = np.where(codes < 0, len(values) - 1, codes).astype(np.int64)
+    return codes, values
+
+
+def count_pairs(
+    codes1: np.ndarray, size1: int, codes2: np.ndarray, size2: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Count the cells of each pair of codes that occur together.
+
+    Args:
+        codes1: The codes of the first column.
+        size1: The number of codes of the first column.
+        codes2: The codes of the second column.
+        size2: The number of codes of the second column.
+
+    Returns:
+        The codes of the first and the second column of each distinct pair, and the
+        number of cells of the pair.
+    """
+    keys = codes1 * size2 + codes2
+    if size1 * size2 <= CONTINGENCY_TABLE_MAX_SIZE:
+        counts = np.bincount(keys, minlength=size1 * size2)
+        keys = np.flatnonzero(counts)
+        counts = counts[keys]
+    else:
+        keys, counts = np.unique(keys, return_counts=True)
+    pairs1, pairs2 = np.divmod(keys, size2)
+    return pairs1, pairs2, counts
+
+
+def assign_predicates(
+    pairs1: np.ndarray,
+    pairs2: np.ndarray,
+    size1: int,
+    size2: int,
+) -> np.ndarray:
+    """
+    Assign the co-annotation predicate of each distinct pair.
+
+    A value whose cells all share a single partner value is a subcluster of it, and two
+    values that are each other's only partner match. Pairs with a missing value always
+    overlap.
+
+    Args:
+        pairs1: The first column codes of the distinct pairs.
+        pairs2: The second column codes of the distinct pairs.
+        size1: The number of codes of the first column, the last one being NaN.
+        size2: The number of codes of the second column, the last one being NaN.
+
+    Returns:
+        The predicate of each pair.
+    """
+    single_partner1 = (np.bincount(pairs1, minlength=size1) == 1)[pairs1]
+    single_partner2 = (np.bincount(pairs2, minlength=size2) == 1)[pairs2]
+    predicates = np.select(
+        [
+            single_partner1 & single_partner2,
+            single_partner1,
+            single_partner2,
+        ],
+        ["cluster_matches", "subcluster_of", "supercluster_of"],
+        default="cluster_overlaps",
+    ).astype(object)
+    predicates[(pairs1 == size1 - 1) | (pairs2 == size2 - 1)] = "cluster_overlaps"
+    return predicates
+
+
+def build_co_annotation_report(
+    obs: pd.DataFrame, cell_type_fields: List[str]
+) -> pd.DataFrame:
+    """
+    Build the co-annotation report of AnndataAnalyzer with NumPy.
+
+    Each column is encoded once, and each pair of columns is reduced to its distinct
+    value pairs in a single pass over the cells. Both directions of a pair are derived
+    from the same distinct pairs.
+
+    Args:
+        obs: The obs DataFrame of the dataset.
+        cell_type_fields: The author cell type fields followed by 'cell_type', as in
+            AnndataAnalyzer.all_cell_type_identifiers.
+
+    Returns:
+        The report as AnndataAnalyzer._generate_co_annotation_dataframe returns it.
+    """
+    encoded: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+    for field in dict.fromkeys(cell_type_fields):
+        if field in obs.columns:
+            codes, values = encode_column(obs[field])
+            counts = np.bincount(codes, minlength=len(values)).astype(float)
+            counts[-1] = np.nan
+            encoded[field] = (codes, values, counts)
+
+    pairs: Dict[Tuple[str, str], Tuple[np.ndarray, np.ndarray]] = {}
+    frames = []
+    for field_name_2 in cell_type_fields:
+        for field_name_1 in cell_type_fields:
+            if (
+                field_name_1 == field_name_2
+                or field_name_1 not in encoded
+                or field_name_2 not in encoded
+            ):
+                continue
+            codes1, values1, counts1 = encoded[field_name_1]
+            codes2, values2, counts2 = encoded[field_name_2]
+            if (field_name_1, field_name_2) not in pairs:
+                reverse = pairs.get((field_name_2, field_name_1))
+                pairs[(field_name_1, field_name_2)] = (
+                    reverse[::-1]
+                    if reverse is not None
+                    else count_pairs(codes1, len(values1), codes2, len(values2))[:2]
+                )
+            pairs1, pairs2 = pairs[(field_name_1, field_name_2)]
+            frames.append(
+                pd.DataFrame(
+                    {
+                        "field_name1": field_name_1,
+                        "value1": values1[pairs1],
+                        "predicate": assign_predicates(
+                            pairs1, pairs2, len(values1), len(values2)
+                        ),
+                        "field_name2": field_name_2,
+                        "value2": values2[pairs2],
+                        "field_name1_cell_count": counts1[pairs1],
+                        "field_name2_cell_count": counts2[pairs2],
+                    },
+                    columns=REPORT_COLUMNS,
+                )
+            )
+
+    if not frames:
+        return pd.DataFrame(columns=REPORT_COLUMNS)
+    report_df = pd.concat(frames, ignore_index=True)
+    for count_column in ["field_name1_cell_count", "field_name2_cell_count"]:
+        if report_df[count_column].notna().all():
+            report_df[count_column] = report_df[count_column].astype(np.int64)
+    return report_df.sort_values(
+        ["field_name1", "value1", "predicate", "field_name2", "value2"]
+    ).reset_index(drop=True)
+
+
+def metadata_percentage_table(
+    obs: pd.DataFrame, author_cell_types: List[str], metadata_fields: List[str]
+) -> pd.DataFrame:
+    """
+    Tabulate the share of each metadata value among the cells of each author cluster.
+
+    Every column is encoded once and each (author field, metadata field) pair is counted
+    in a single pass over the cells. Cells without a metadata value are left out of the
+    shares, as in `Series.value_counts(normalize=True)`.
+
+    Args:
+        obs: The obs DataFrame of the dataset.
+        author_cell_types: The author cell type fields. Fields that are not in obs are
+            skipped.
+        metadata_fields: The metadata fields, such as 'tissue'.
+
+    Returns:
+        A DataFrame with the 'author_field', 'author_value', 'metadata_field',
+        'metadata_value' and 'percentage' of every non-zero share.
+    """
+    encoded_metadata = {field: encode_column(obs[field]) for field in metadata_fields}
+    frames = []
+    for author_field in dict.fromkeys(author_cell_types):
+        # A curated field that is missing from the file has no clusters
+        if author_field not in obs.columns:
+            continue
+        author_codes, author_values = encode_column(obs[author_field])
+        for metadata_field, (codes, values) in encoded_metadata.items():
+            pairs1, pairs2, counts = count_pairs(
+                author_codes, len(author_values), codes, len(values)
+            )
+            # The last codes stand for missing values
+            known = (pairs1 < len(author_values) - 1) & (pairs2 < len(values) - 1)
+            pairs1, pairs2, counts = pairs1[known], pairs2[known], counts[known]
+            totals = np.bincount(pairs1, weights=counts, minlength=len(author_values))
+            frames.append(
+                pd.DataFrame(
+                    {
+                        "author_field": author_field,
+                        "author_value": author_values[pairs1],
+                        "metadata_field": metadata_field,
+                        "metadata_value": values[pairs2],
+                        "percentage": counts / totals[pairs1] * 100,
+                    }
+                )
+            )
+    if not frames:
+        return pd.DataFrame(
+            columns=[
+                "author_field",
+                "author_value",
+                "metadata_field",
+                "metadata_value",
+                "percentage",
+            ]
+        )
+    return pd.concat(frames, ignore_index=True)
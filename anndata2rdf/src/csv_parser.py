@@ -1,7 +1,10 @@
+import hashlib
+import json
 import logging
 import os
 import time
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
 
 import pandas as pd
 import requests
@@ -9,6 +12,17 @@ import yaml
 
 MAX_RETRIES = 3
 RETRY_DELAY = 2
+MAX_WORKERS = 8  # concurrent requests to the CxG curation API
+
+CXG_VERSIONS_URL = (
+    "https://api.cellxgene.cziscience.com/curation/v1/datasets/{matrix_id}/versions"
+)
+CXG_VERSIONS_CACHE = os.path.join("config", "cxg_versions_cache.json")
+CXG_VERSIONS_CACHE_TTL = 24 * 60 * 60  # seconds
+
+# The only curated sheet columns the configuration is generated from
+CURATED_COLUMNS = ["content", "cxg link", "author category cell type field name"]
+CURATED_CACHE_DIRECTORY = os.path.join("config", "curated_cache")
 
 logging.basicConfig(level=logging.WARNING)
 
@@ -22,26 +36,88 @@ class DatasetNotFoundException(Exception):
     pass
 
 
-def generate_yaml_data(data):
-    filtered_df = data[data["Content"].str.strip().str.lower() == "cell types"]
-    filtered_df.columns = filtered_df.columns.str.lower()  # Normalize to lowercase
+def generate_yaml_data(
+    data, offline: bool = False, max_workers: int = MAX_WORKERS
+) -> List[Dict]:
+    """
+    Build the author cell type configuration entries of a single curated sheet.
+
+    Args:
+        data: The curated sheet as a DataFrame.
+        offline: If True, CxG versions are only read from the on-disk cache.
+        max_workers: The maximum number of concurrent requests to the CxG API.
+
+    Returns:
+        A list of configuration entries, one per CxG dataset with a resolved download URL.
+    """
+    return resolve_cell_type_groups(
+        group_cell_type_fields(data), offline=offline, max_workers=max_workers
+    )
+
+
+def group_cell_type_fields(data) -> List[Dict]:
+    """
+    Group the author cell type field names of a curated sheet by CxG link.
+
+    Args:
+        data: The curated sheet as a DataFrame.
+
+    Returns:
+        A list of dictionaries with the 'CxG_link' and its 'author_cell_type_list'.
+    """
+    # Normalize to lowercase
+    data = data.rename(columns=lambda col: col.strip().lower())
+    filtered_df = data[data["content"].str.strip().str.lower() == "cell types"]
     grouped_data = filtered_df.groupby("cxg link")
-    _yaml_data = []
+    return [
+        {
+            "CxG_link": link,
+            "author_cell_type_list": [
+                col.strip()
+                for col in group_df["author category cell type field name"].tolist()
+            ],
+        }
+        for link, group_df in grouped_data
+    ]
+
+
+def resolve_cell_type_groups(
+    groups: List[Dict], offline: bool = False, max_workers: int = MAX_WORKERS
+) -> List[Dict]:
+    """
+    Resolve the latest H5AD download URL of each grouped CxG link.
+
+    Links are resolved concurrently over a pooled session, using the versions cache for
+    entries that are still fresh. The updated cache is written back once all links are
+    resolved.
+
+    Args:
+        groups: The output of `group_cell_type_fields`.
+        offline: If True, no request is sent and only cached versions are used.
+        max_workers: The maximum number of concurrent requests to the CxG API.
+
+    Returns:
+        The groups that could be resolved, each with an additional 'download_url'.
+    """
+    cache = load_versions_cache()
+    links = [group["CxG_link"] for group in groups]
+    download_urls = fetch_latest_cxg_dataset_links(
+        links, cache=cache, offline=offline, max_workers=max_workers
+    )
+    if not offline:
+        save_versions_cache(cache)
 
-    for link, group_df in grouped_data:
-        author_cell_type_list = [
-            col.strip()
-            for col in group_df["author category cell type field name"].tolist()
-        ]
+    _yaml_data = []
+    for group in groups:
+        link = group["CxG_link"]
         try:
-            # Fetch the latest dataset link
-            latest_cxg_dataset = fetch_latest_cxg_dataset_link(link)
+            latest_cxg_dataset = download_urls.get(link)
             if latest_cxg_dataset:
                 _yaml_data.append(
                     {
                         "CxG_link": link,
                         "download_url": latest_cxg_dataset,
-                        "author_cell_type_list": author_cell_type_list,
+                        "author_cell_type_list": group["author_cell_type_list"],
                     }
                 )
             else:
@@ -57,46 +133,161 @@ def generate_yaml_data(data):
     return _yaml_data
 
 
-def fetch_latest_cxg_dataset_link(link: str) -> Optional[str]:
+def fetch_latest_cxg_dataset_links(
+    links: List[str],
+    cache: Optional[Dict] = None,
+    offline: bool = False,
+    max_workers: int = MAX_WORKERS,
+) -> Dict[str, Optional[str]]:
+    """
+    Retrieve the latest CXG dataset download links for several CxG links concurrently.
+
+    Args:
+        links: The CxG links to resolve. Duplicates are resolved once.
+        cache: The versions cache, updated in place with fetched responses.
+        offline: If True, only cached versions are used.
+        max_workers: The maximum number of concurrent requests to the CxG API.
+
+    Returns:
+        A dictionary mapping each link to its latest H5AD URL, or None if it could not be
+            resolved.
+    """
+    unique_links = list(dict.fromkeys(links))
+    if not unique_links:
+        return {}
+
+    def _fetch(link):
+        # A failing link must not abort the resolution of the other links
+        try:
+            return fetch_latest_cxg_dataset_link(
+                link, session=session, cache=cache, offline=offline
+            )
+        except Exception as e:
+            logger.error(f"Unexpected error while processing link {link}: {e}")
+            return None
+
+    with requests.Session() as session:
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=max_workers, pool_maxsize=max_workers
+        )
+        session.mount("https://", adapter)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return dict(zip(unique_links, executor.map(_fetch, unique_links)))
+
+
+def fetch_latest_cxg_dataset_link(
+    link: str,
+    session: Optional[requests.Session] = None,
+    cache: Optional[Dict] = None,
+    offline: bool = False,
+) -> Optional[str]:
     """
     Retrieve the latest CXG dataset download link for the given matrix_id.
 
-    This method extracts the `matrix_id` from the provided URL and sends a GET request
-    to the CXG API to fetch dataset versions. It then parses the response to find the
-    URL of the latest dataset file with the file type "H5AD".
+    This method extracts the `matrix_id` from the provided URL and gets the dataset
+    versions, either from the versions cache or from the CXG API. It then parses the
+    versions to find the URL of the latest dataset file with the file type "H5AD".
 
     Args:
         link (str): The URL containing the matrix_id to be extracted. The matrix_id is
                     used to query the CXG API for dataset versions.
+        session (Optional[requests.Session]): The session used to send the request.
+        cache (Optional[Dict]): The versions cache. Fresh entries are used instead of
+                    sending a request, and fetched versions are stored in it.
+        offline (bool): If True, the cached versions are used regardless of their age
+                    and no request is sent.
 
     Returns:
         Optional[str]: The URL of the latest H5AD dataset file if successful, or None if
                        the request fails or the desired dataset is not found.
     """
+    matrix_id = link.split("/")[-2].split(".")[0]
+    data = fetch_cxg_dataset_versions(
+        matrix_id, session=session, cache=cache, offline=offline
+    )
+    if data is None:
+        return None
+    if not isinstance(data, list) or not data:
+        logger.error("Unexpected API response format or empty dataset list.")
+        return None
+
+    # Find the latest H5AD dataset link
+    for asset in data[0].get("assets", []):
+        if asset.get("filetype") == "H5AD":
+            return asset.get("url")
+
+    logger.warning(f"No H5AD file found in assets for matrix_id {matrix_id}.")
+    return None
+
+
+def get_cached_versions(
+    cache: Optional[Dict], matrix_id: str, offline: bool, ttl: int
+) -> Optional[Dict]:
+    """
+    Get the cached versions response of a dataset if it is still fresh.
+
+    An entry written by another version of this module or edited by hand may lack its
+    'fetched_at' or 'versions', so a malformed entry is treated as a cache miss.
+
+    Returns:
+        The cached response, or None if it is missing, stale or malformed.
+    """
+    entry = cache.get(matrix_id) if cache is not None else None
+    if not entry:
+        return None
+    try:
+        if offline or time.time() - entry["fetched_at"] < ttl:
+            return entry["versions"]
+    except (KeyError, TypeError) as e:
+        logger.warning(f"Ignoring malformed versions cache entry of {matrix_id}: {e!r}")
+    return None
+
+
+def fetch_cxg_dataset_versions(
+    matrix_id: str,
+    session: Optional[requests.Session] = None,
+    cache: Optional[Dict] = None,
+    offline: bool = False,
+    ttl: int = CXG_VERSIONS_CACHE_TTL,
+):
+    """
+    Get the `/curation/v1/datasets/{matrix_id}/versions` response of a dataset.
+
+    Cached responses younger than `ttl` are returned without a request. Otherwise, the
+    CXG API is queried with exponential backoff between retries, and the response is
+    stored in the cache.
+
+    Args:
+        matrix_id: The CxG dataset identifier.
+        session: The session used to send the request.
+        cache: The versions cache, keyed by matrix_id.
+        offline: If True, the cached response is returned regardless of its age.
+        ttl: The maximum age of a cached response in seconds.
+
+    Returns:
+        The decoded API response, or None if it could not be retrieved.
+    """
+    cached = get_cached_versions(cache, matrix_id, offline, ttl)
+    if cached is not None:
+        return cached
+    if offline:
+        logger.error(f"No cached dataset versions for matrix_id {matrix_id}.")
+        return None
+
+    http = session if session is not None else requests
+    request_url = CXG_VERSIONS_URL.format(matrix_id=matrix_id)
     retries = 0
     while retries < MAX_RETRIES:
         try:
-            matrix_id = link.split("/")[-2].split(".")[0]
-            request_url = f"https://api.cellxgene.cziscience.com/curation/v1/datasets/{matrix_id}/versions"
-
-            response = requests.get(request_url)
+            response = http.get(request_url)
             response.raise_for_status()
-
             data = response.json()
-            if not isinstance(data, list) or not data:
-                logger.error("Unexpected API response format or empty dataset list.")
-                return None
+            if cache is not None:
+                cache[matrix_id] = {"fetched_at": time.time(), "versions": data}
+            return data
 
-            # Find the latest H5AD dataset link
-            for asset in data[0].get("assets", []):
-                if asset.get("filetype") == "H5AD":
-                    return asset.get("url")
-
-            logger.warning(f"No H5AD file found in assets for matrix_id {matrix_id}.")
-            return None
-
-        except (requests.exceptions.RequestException, ValueError, KeyError) as e:
-            logger.error(f"Error fetching dataset versions using {link}: {e}")
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.error(f"Error fetching dataset versions of {matrix_id}: {e}")
 
         retries += 1
         if retries < MAX_RETRIES:
@@ -104,37 +295,159 @@ def fetch_latest_cxg_dataset_link(link: str) -> Optional[str]:
                 f"Retrying dataset version retrieval... Attempt {retries + 1} of"
                 f" {MAX_RETRIES}"
             )
-            time.sleep(RETRY_DELAY)
+            time.sleep(RETRY_DELAY * 2 ** (retries - 1))
         else:
             logger.error("Max retries reached. Dataset version retrieval.")
             return None
 
 
+def get_versions_cache_path() -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), CXG_VERSIONS_CACHE)
+
+
+def load_versions_cache(cache_path: Optional[str] = None) -> Dict:
+    """Load the CxG versions cache, or return an empty cache if it is missing or invalid."""
+    cache_path = cache_path or get_versions_cache_path()
+    if not os.path.exists(cache_path):
+        return {}
+    try:
+        with open(cache_path, "r") as cache_file:
+            return json.load(cache_file)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable versions cache '{cache_path}': {e}")
+        return {}
+
+
+def save_versions_cache(cache: Dict, cache_path: Optional[str] = None):
+    """Atomically write the CxG versions cache."""
+    cache_path = cache_path or get_versions_cache_path()
+    tmp_path = f"{cache_path}.tmp"
+    with open(tmp_path, "w") as cache_file:
+        json.dump(cache, cache_file)
+    os.replace(tmp_path, cache_path)
+
+
 def write_yaml_file(yaml_data, file_path):
     with open(file_path, "w") as yaml_file:
         yaml.dump(yaml_data, yaml_file)
         logger.info(f"{file_path} written")
 
 
-def generate_author_cell_type_config(curated_data_folder: str = "curated_data"):
-    all_yaml_data = []
-    data_folder = os.path.join(
-        os.path.dirname(os.path.abspath(__file__)), curated_data_folder
-    )
-    for file_name in os.listdir(data_folder):
+def read_curated_sheet(file_path: str) -> pd.DataFrame:
+    """
+    Read the columns and rows of a curated sheet that the configuration is built from.
+
+    Only the CURATED_COLUMNS are parsed, and only the 'cell types' rows are kept.
+
+    Args:
+        file_path: The path to a CSV or Excel curated sheet.
+
+    Returns:
+        The pruned sheet with lowercase column names.
+    """
+
+    def _use_column(column) -> bool:
+        return str(column).strip().lower() in CURATED_COLUMNS
+
+    if file_path.endswith(".csv"):
+        df = pd.read_csv(file_path, usecols=_use_column, dtype=str)
+    else:
+        df = pd.read_excel(file_path, usecols=_use_column, dtype=str)
+    df = df.rename(columns=lambda col: col.strip().lower())
+    df = df[df["content"].str.strip().str.lower() == "cell types"]
+    return df.reset_index(drop=True)
+
+
+def _hash_file(file_path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def load_curated_sheet(file_path: str, cache_directory: str) -> pd.DataFrame:
+    """
+    Read a curated sheet through a Parquet cache of its pruned content.
+
+    The cache entry of a sheet is reused as long as the sheet's modification time and
+    size are unchanged. If they changed, the content hash decides whether the sheet is
+    parsed again.
+
+    Args:
+        file_path: The path to a CSV or Excel curated sheet.
+        cache_directory: The directory of the cached sheets and their index.
+
+    Returns:
+        The output of `read_curated_sheet`.
+    """
+    index_path = os.path.join(cache_directory, "index.json")
+    index = {}
+    if os.path.exists(index_path):
+        try:
+            with open(index_path, "r") as index_file:
+                index = json.load(index_file)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable curated data cache index: {e}")
+
+    file_name = os.path.basename(file_path)
+    stat = os.stat(file_path)
+    entry = index.get(file_name, {})
+    cache_path = os.path.join(cache_directory, entry.get("cache_file", ""))
+    if entry and os.path.isfile(cache_path):
+        if entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+            return pd.read_parquet(cache_path)
+        file_hash = _hash_file(file_path)
+        if entry["sha256"] == file_hash:
+            entry.update(mtime=stat.st_mtime, size=stat.st_size)
+            _write_cache_index(index, index_path)
+            return pd.read_parquet(cache_path)
+    else:
+        file_hash = _hash_file(file_path)
+
+    df = read_curated_sheet(file_path)
+    cache_file = f"{hashlib.sha256(file_name.encode()).hexdigest()[:16]}.parquet"
+    df.to_parquet(os.path.join(cache_directory, cache_file), index=False)
+    index[file_name] = {
+        "mtime": stat.st_mtime,
+        "size": stat.st_size,
+        "sha256": file_hash,
+        "cache_file": cache_file,
+    }
+    _write_cache_index(index, index_path)
+    return df
+
+
+def _write_cache_index(index: Dict, index_path: str):
+    tmp_path = f"{index_path}.tmp"
+    with open(tmp_path, "w") as index_file:
+        json.dump(index, index_file, indent=2)
+    os.replace(tmp_path, index_path)
+
+
+def generate_author_cell_type_config(
+    curated_data_folder: str = "curated_data",
+    offline: bool = False,
+    max_workers: int = MAX_WORKERS,
+):
+    all_groups = []
+    source_folder = os.path.dirname(os.path.abspath(__file__))
+    data_folder = os.path.join(source_folder, curated_data_folder)
+    cache_directory = os.path.join(source_folder, CURATED_CACHE_DIRECTORY)
+    os.makedirs(cache_directory, exist_ok=True)
+    for file_name in sorted(os.listdir(data_folder)):
         file_path = os.path.join(data_folder, file_name)
 
-        if file_name.endswith(".csv"):
-            df = pd.read_csv(file_path)
-        elif file_name.endswith(".xlsx") or file_name.endswith(".xls"):
-            df = pd.read_excel(file_path)
-        else:
+        if not file_name.endswith((".csv", ".xlsx", ".xls")):
             logger.info(f"Skipping file '{file_name}' with unsupported format.")
             continue
 
-        yaml_data = generate_yaml_data(df)
-        all_yaml_data.extend(yaml_data)
-    return all_yaml_data
+        df = load_curated_sheet(file_path, cache_directory)
+        all_groups.extend(group_cell_type_fields(df))
+    # Resolve the links of all sheets at once to make the most of the concurrency
+    return resolve_cell_type_groups(
+        all_groups, offline=offline, max_workers=max_workers
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,165 @@
+import logging
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import requests
+
+from pull_anndata import get_remote_file_size
+
+logging.basicConfig(level=logging.WARNING)
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Disk space shared by the downloaded h5ad files. Defaults to 90% of the free space of
+# the dataset directory when the run starts.
+DISK_BUDGET_GB = os.getenv("ANNDATA2RDF_DISK_BUDGET_GB")
+FREE_SPACE_SHARE = 0.9
+SIZING_WORKERS = 8
+
+
+def get_disk_budget(directory: str) -> int:
+    if DISK_BUDGET_GB:
+        return int(float(DISK_BUDGET_GB) * 1024**3)
+    os.makedirs(directory, exist_ok=True)
+    return int(FREE_SPACE_SHARE * shutil.disk_usage(directory).free)
+
+
+def add_download_sizes(jobs: List[Dict], max_workers: int = SIZING_WORKERS):
+    """
+    Set the 'download_size' of each job, sizing remote files with HEAD requests.
+
+    Files that are already downloaded are sized on disk. A file whose size is unknown
+    is assumed to be as large as the largest known file, so it is not admitted next to
+    other large files by mistake.
+
+    Args:
+        jobs: The output of `process.plan_jobs`.
+        max_workers: The number of HEAD requests sent at the same time.
+    """
+
+    def _size(job):
+        if os.path.exists(job["h5ad_path"]):
+            return os.path.getsize(job["h5ad_path"])
+        return get_remote_file_size(job["download_url"], session=session)
+
+    with requests.Session() as session, ThreadPoolExecutor(max_workers) as executor:
+        sizes = list(executor.map(_size, jobs))
+    largest = max((size for size in sizes if size is not None), default=0)
+    for job, size in zip(jobs, sizes):
+        if size is None:
+            logger.warning(
+                f"The size of '{job['matrix_id']}' is unknown. Assuming {largest} bytes."
+            )
+        job["download_size"] = size if size is not None else largest
+
+
+def order_by_size(jobs: List[Dict]) -> List[Dict]:
+    """
+    Order jobs from the largest download to the smallest.
+
+    Starting with the largest files finds a volume that is too small at the start of a
+    run rather than hours into it, and leaves the short jobs to fill the gaps at the
+    end.
+    """
+    return sorted(jobs, key=lambda job: job.get("download_size", 0), reverse=True)
+
+
+def project_peak_disk_bytes(sizes: List[int], budget: int, slots: int) -> int:
+    """
+    Project the peak disk use of downloading files in order under a disk budget.
+
+    Files are admitted in order while fewer than `slots` are on disk and they fit into
+    the budget, and are removed in the order they were admitted. A file larger than
+    the whole budget is admitted once the disk is empty.
+
+    Args:
+        sizes: The sizes of the files in download order.
+        budget: The disk budget in bytes.
+        slots: The maximum number of files on disk at the same time.
+
+    Returns:
+        The largest total size of the files on disk at the same time.
+    """
+    on_disk: List[int] = []
+    used = peak = 0
+    for size in sizes:
+        while on_disk and (len(on_disk) >= max(slots, 1) or used + size > budget):
+            used -= on_disk.pop(0)
+        on_disk.append(size)
+        used += size
+        peak = max(peak, used)
+    return peak
+
+
+def log_disk_plan(jobs: List[Dict], budget: int, slots: int) -> int:
+    """
+    Report the download sizes and the projected peak disk use before the run starts.
+
+    Returns:
+        The projected peak disk use in bytes.
+    """
+    sizes = [job.get("download_size", 0) for job in jobs]
+    peak = project_peak_disk_bytes(sizes, budget, slots)
+    gigabyte = 1024**3
+    logger.info(
+        f"{len(jobs)} datasets to download, {sum(sizes) / gigabyte:.1f} GB in total, "
+        f"largest {max(sizes, default=0) / gigabyte:.1f} GB. Projected peak disk use "
+        f"{peak / gigabyte:.1f} GB of a {budget / gigabyte:.1f} GB budget."
+    )
+    if peak > budget:
+        logger.warning(
+            "Some datasets are larger than the disk budget. They are downloaded alone, "
+            "but may still fill the volume."
+        )
+    return peak
+
+
+class DiskBudget:
+    """
+    Admits downloads while their total size fits into a disk budget.
+
+    A download larger than the whole budget is admitted once no other file is on disk,
+    so it runs alone instead of blocking forever.
+    """
+
+    def __init__(self, budget: int):
+        """
+        Args:
+            budget: The disk space shared by the downloads in bytes.
+        """
+        self.budget = budget
+        self.reserved = 0
+        self._condition = threading.Condition()
+
+    def fits(self, size: int) -> bool:
+        return self.reserved == 0 or self.reserved + size <= self.budget
+
+    def try_acquire(self, size: int) -> bool:
+        """Reserve `size` bytes if they fit into the budget, without waiting."""
+        with self._condition:
+            if not self.fits(size):
+                return False
+            self.reserved += size
+            return True
+
+    def acquire(self, size: int, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until `size` bytes fit into the budget and reserve them.
+
+        Returns:
+            False if the timeout expired first.
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self.fits(size), timeout):
+                return False
+            self.reserved += size
+            return True
+
+    def release(self, size: int):
+        with self._condition:
+            self.reserved = max(self.reserved - size, 0)
+            self._condition.notify_all()
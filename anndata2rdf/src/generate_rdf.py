@@ -1,10 +1,26 @@
 import logging
 import os
-from typing import List
+import uuid
+from typing import Callable, Dict, List, Optional
 import yaml
 
-from pandasaurus_cxg.enrichment_analysis import AnndataEnrichmentAnalyzer
 from pandasaurus_cxg.graph_generator.graph_generator import GraphGenerator
+from pandasaurus_cxg.graph_generator.graph_generator_utils import ncname_safe
+from pandasaurus_cxg.graph_generator.graph_namespaces import prefixes
+from pandasaurus_cxg.graph_generator.graph_predicates import CLUSTER
+from rdflib import OWL, RDF, RDFS, BNode, Literal, Namespace, URIRef
+
+from build_manifest import METADATA_FIELDS
+from co_annotation import build_co_annotation_report, metadata_percentage_table
+from obs_loader import ObsEnrichmentAnalyzer
+from rdf_writer import (
+    DATASET_GRAPH_NAMESPACE,
+    OUTPUT_FORMAT,
+    STREAMING_FORMATS,
+    StreamingRDFWriter,
+    get_output_extension,
+)
+from run_report import count, stage
 
 logging.basicConfig(level=logging.WARNING)
 
@@ -12,32 +28,158 @@ logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 
-def generate_rdf_graph(
-    anndata_file_path: str, author_cell_type_list: List[str], output_rdf_path: str
+def add_metadata_nodes(
+    gg: GraphGenerator, metadata_fields: List[str], add: Callable[[tuple], None]
 ):
+    """
+    Add the metadata nodes of GraphGenerator.add_metadata_nodes through a triple sink.
+
+    Each metadata value is linked to the clusters it occurs in by an OWL axiom annotated
+    with the percentage of the cluster's cells that have the value. The percentages of
+    all clusters come from a single `metadata_percentage_table`. The triples are
+    passed to `add` instead of being added to `gg.graph`, so they can be streamed to a
+    file without holding them in memory.
+
+    Args:
+        gg: A GraphGenerator whose cluster graph has been generated.
+        metadata_fields: Metadata fields that exist in obs together with their
+            '<field>_ontology_term_id' columns.
+        add: Called with each triple, such as `Graph.add` or `StreamingRDFWriter.add`.
+    """
+    obs = gg.ea.enricher_manager.anndata.obs
+    ns = gg.ns
+    # all_cell_type_identifiers ends with 'cell_type'
+    author_cell_types = list(gg.ea.analyzer_manager.all_cell_type_identifiers)[:-1]
+    clusters: Dict[tuple, List[URIRef]] = {}
+    for cluster in gg.graph.subjects(RDF.type, URIRef(CLUSTER.get("iri"))):
+        for a_cell_type in author_cell_types:
+            literal = gg.graph.value(cluster, ns[ncname_safe(a_cell_type)])
+            if literal is not None:
+                clusters.setdefault((a_cell_type, str(literal)), []).append(cluster)
+    percentage_annotation_property = ns["percentage"]
+    add((percentage_annotation_property, RDF.type, OWL.AnnotationProperty))
+    ontology_term_id_mappings = {
+        metadata: obs[[metadata, f"{metadata}_ontology_term_id"]]
+        .drop_duplicates()
+        .set_index(metadata)
+        .to_dict()[f"{metadata}_ontology_term_id"]
+        for metadata in metadata_fields
+    }
+    percentage_table = metadata_percentage_table(
+        obs, author_cell_types, metadata_fields
+    )
+    labelled_targets = set()
+    typed_targets = set()
+    for a_cell_type, literal, metadata, label, percentage in zip(
+        percentage_table["author_field"],
+        percentage_table["author_value"],
+        percentage_table["metadata_field"],
+        percentage_table["metadata_value"],
+        percentage_table["percentage"],
+    ):
+        for cluster in clusters.get((a_cell_type, str(literal)), []):
+            ontology_term_id = ontology_term_id_mappings[metadata].get(label)
+            if isinstance(ontology_term_id, str) and ":" in ontology_term_id:
+                ontology_term_id = ontology_term_id.split(":")
+                annotated_target = Namespace(prefixes.get(ontology_term_id[0]))[
+                    ontology_term_id[-1]
+                ]
+            else:
+                annotated_target = URIRef(ns[str(uuid.uuid4())])
+            # A streamed triple is not deduplicated, so each one is only added once
+            if (annotated_target, label) not in labelled_targets:
+                labelled_targets.add((annotated_target, label))
+                add((annotated_target, RDFS.label, Literal(label)))
+            if annotated_target not in typed_targets:
+                typed_targets.add(annotated_target)
+                add((annotated_target, RDF.type, OWL.Class))
+            bnode_axiom = BNode()
+            add((bnode_axiom, RDF.type, OWL.Axiom))
+            add((bnode_axiom, OWL.annotatedSource, cluster))
+            add((bnode_axiom, OWL.annotatedProperty, ns[metadata]))
+            add((bnode_axiom, OWL.annotatedTarget, annotated_target))
+            add(
+                (
+                    bnode_axiom,
+                    percentage_annotation_property,
+                    Literal("{:.2f}".format(percentage)),
+                )
+            )
+
+
+def generate_rdf_graph(
+    anndata_file_path: str,
+    author_cell_type_list: List[str],
+    output_rdf_path: str,
+    output_format: str = OUTPUT_FORMAT,
+    graph_name: Optional[URIRef] = None,
+) -> str:
+    """
+    Generate the RDF graph of a dataset.
+
+    With the 'owl' format the whole graph is built in memory and saved as RDF/XML. With
+    'nt' and 'nq' the cluster graph is written as gzip-compressed N-Triples or N-Quads
+    and the metadata nodes, which make up most of the triples, are streamed after it.
+
+    Args:
+        anndata_file_path: The path to the h5ad file.
+        author_cell_type_list: Names of the free text cell type fields.
+        output_rdf_path: The path of the output file without its extension.
+        output_format: One of 'owl', 'nt' or 'nq'. Defaults to OUTPUT_FORMAT.
+        graph_name: The named graph of the 'nq' output. Defaults to a graph named
+            after the output file.
+
+    Returns:
+        The path of the generated file.
+    """
+    output_path = output_rdf_path + get_output_extension(output_format)
     logger.info(f"Generating RDF graph using {anndata_file_path}...")
-    aea = AnndataEnrichmentAnalyzer(anndata_file_path, author_cell_type_list)
-    aea.analyzer_manager.co_annotation_report()
-    gg = GraphGenerator(aea)
-    gg.generate_rdf_graph(merge=True)
-    gg.set_label_adding_priority(author_cell_type_list)
-    gg.add_label_to_terms()
+    # Only the obs columns used below are read, never the expression matrix
+    with stage("read_obs"):
+        aea = ObsEnrichmentAnalyzer(
+            anndata_file_path, author_cell_type_list, METADATA_FIELDS
+        )
+    count("cells", aea.enricher_manager.anndata.n_obs)
+    # Same report as aea.analyzer_manager.co_annotation_report(), built with NumPy
+    with stage("co_annotation"):
+        aea.analyzer_manager.report_df = build_co_annotation_report(
+            aea.enricher_manager.anndata.obs,
+            aea.analyzer_manager.all_cell_type_identifiers,
+        )
+    with stage("cluster_graph"):
+        gg = GraphGenerator(aea)
+        gg.generate_rdf_graph(merge=True)
+        gg.set_label_adding_priority(author_cell_type_list)
+        gg.add_label_to_terms()
+    count(
+        "clusters",
+        sum(1 for _ in gg.graph.subjects(RDF.type, URIRef(CLUSTER.get("iri")))),
+    )
+    obs_columns = aea.enricher_manager.anndata.obs.columns
     metadata_field_list = [
-        "tissue",
-        "disease",
-        "development_stage",
-        "organism",
-        "sex",
-        "assay",
-        "self_reported_ethnicity",
+        field_name
+        for field_name in METADATA_FIELDS
+        if field_name in obs_columns and f"{field_name}_ontology_term_id" in obs_columns
     ]
-    for field_name in metadata_field_list:
-        if field_name in aea.enricher_manager.anndata.obs.columns:
-            continue
-        metadata_field_list.remove(field_name)
-    gg.add_metadata_nodes(metadata_fields=metadata_field_list)
-    gg.save_rdf_graph(file_name=output_rdf_path)
+    if output_format in STREAMING_FORMATS:
+        graph_name = graph_name or URIRef(
+            DATASET_GRAPH_NAMESPACE + os.path.basename(output_rdf_path)
+        )
+        with StreamingRDFWriter(output_path, output_format, graph_name) as writer:
+            with stage("serialisation"):
+                writer.add_graph(gg.graph)
+            # The metadata triples are written as they are generated
+            with stage("metadata"):
+                add_metadata_nodes(gg, metadata_field_list, writer.add)
+        count("triples", writer.triple_count)
+    else:
+        with stage("metadata"):
+            add_metadata_nodes(gg, metadata_field_list, gg.graph.add)
+        with stage("serialisation"):
+            gg.save_rdf_graph(file_name=output_rdf_path)
+        count("triples", len(gg.graph))
     logger.info(f"RDF graph has been generated for {anndata_file_path}...")
+    return output_path
 
 
 if __name__ == "__main__":
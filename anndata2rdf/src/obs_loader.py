@@ -0,0 +1,155 @@
+import logging
+import warnings
+from typing import Dict, List, Optional
+
+import anndata
+import h5py
+import pandas as pd
+from anndata.experimental import read_elem
+from pandasaurus_cxg.anndata_analyzer import AnndataAnalyzer
+
+logging.basicConfig(level=logging.WARNING)
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+CELL_TYPE_FIELDS = ["cell_type", "cell_type_ontology_term_id"]
+
+
+def read_obs_shape(h5ad_path: str) -> Optional[tuple]:
+    """Read the (cells, columns) shape of obs from the h5ad file without loading it."""
+    try:
+        with h5py.File(h5ad_path, "r") as h5ad_file:
+            obs = h5ad_file["obs"]
+            index = obs[obs.attrs["_index"]]
+            return index.shape[0], len(obs.attrs["column-order"])
+    except (OSError, KeyError) as e:
+        logger.warning(f"Could not read the obs shape of '{h5ad_path}': {e}")
+        return None
+
+
+def _read_array(dataset: h5py.Dataset):
+    if dataset.attrs.get("encoding-type") == "string-array":
+        return dataset.asstr()[:]
+    return dataset[:]
+
+
+def read_obs_columns(h5ad_path: str, columns: List[str]) -> pd.DataFrame:
+    """
+    Read selected obs columns of an h5ad file without loading the rest of the file.
+
+    Categorical columns are built from their integer codes and categories, so memory
+    grows with the number of cells times the number of requested columns only. Columns
+    of other encodings, such as nullable integers, are read by anndata. Columns that do
+    not exist in the file are skipped.
+
+    Args:
+        h5ad_path: The path to the h5ad file.
+        columns: The names of the obs columns to read.
+
+    Returns:
+        A DataFrame with the requested columns that exist in obs.
+    """
+    with h5py.File(h5ad_path, "r") as h5ad_file:
+        obs = h5ad_file["obs"]
+        n_obs = obs[obs.attrs["_index"]].shape[0]
+        data = {}
+        for column in dict.fromkeys(columns):
+            if column not in obs:
+                continue
+            element = obs[column]
+            encoding = element.attrs.get("encoding-type")
+            if encoding == "categorical":
+                data[column] = pd.Categorical.from_codes(
+                    element["codes"][:],
+                    categories=_read_array(element["categories"]),
+                    ordered=bool(element.attrs.get("ordered", False)),
+                )
+            elif encoding in ("array", "string-array"):
+                data[column] = _read_array(element)
+            else:
+                # Such as 'nullable-integer', read the way read_h5ad reads it
+                data[column] = read_elem(element)
+    return pd.DataFrame(data, index=pd.RangeIndex(n_obs).astype(str))
+
+
+def read_uns_strings(h5ad_path: str) -> Dict[str, str]:
+    """Read the top-level string values of uns, such as the citation and title."""
+    with h5py.File(h5ad_path, "r") as h5ad_file:
+        uns = h5ad_file.get("uns", {})
+        return {
+            key: value.asstr()[()]
+            for key, value in uns.items()
+            if isinstance(value, h5py.Dataset)
+            and value.attrs.get("encoding-type") == "string"
+        }
+
+
+def build_seed_dict(
+    obs: pd.DataFrame, cell_type_field: str = "cell_type_ontology_term_id"
+) -> Dict[str, str]:
+    """Map cell type CURIEs to labels the same way AnndataEnricher does."""
+    seed_dict = dict(
+        obs.drop_duplicates(subset=[cell_type_field, "cell_type"])
+        .dropna(subset=[cell_type_field, "cell_type"])[[cell_type_field, "cell_type"]]
+        .values
+    )
+    # "unknown" patch
+    if "unknown" in seed_dict:
+        del seed_dict["unknown"]
+        seed_dict["CL:0000000"] = "cell"
+    return seed_dict
+
+
+class ObsEnricher:
+    """
+    Provides the parts of AnndataEnricher that GraphGenerator uses.
+
+    AnndataEnricher validates its seed terms and loads slim lists from Ubergraph when it
+    is created, none of which is used to generate the graphs. This class only keeps the
+    AnnData object and the seed dictionary, so it needs no network access.
+    """
+
+    def __init__(self, anndata_obj: anndata.AnnData):
+        self.anndata = anndata_obj
+        self.seed_dict = build_seed_dict(anndata_obj.obs)
+
+
+class ObsEnrichmentAnalyzer:
+    """An AnndataEnrichmentAnalyzer built from selected obs columns of an h5ad file."""
+
+    def __init__(
+        self,
+        file_path: str,
+        author_cell_type_list: List[str],
+        metadata_fields: Optional[List[str]] = None,
+    ):
+        """
+        Reads the obs columns needed to generate the RDF graph.
+
+        Args:
+            file_path: The path to the h5ad file.
+            author_cell_type_list: Names of the free text cell type fields.
+            metadata_fields: Metadata fields, such as 'tissue', read together with their
+                '<field>_ontology_term_id' columns.
+        """
+        metadata_fields = metadata_fields or []
+        columns = (
+            list(author_cell_type_list)
+            + CELL_TYPE_FIELDS
+            + [
+                column
+                for field in metadata_fields
+                for column in (field, f"{field}_ontology_term_id")
+            ]
+        )
+        with warnings.catch_warnings():
+            warnings.simplefilter(
+                "ignore", category=anndata.ImplicitModificationWarning
+            )
+            anndata_obj = anndata.AnnData(
+                obs=read_obs_columns(file_path, columns),
+                uns=read_uns_strings(file_path),
+            )
+        self.enricher_manager = ObsEnricher(anndata_obj)
+        self.analyzer_manager = AnndataAnalyzer(anndata_obj, author_cell_type_list)
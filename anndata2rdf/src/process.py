@@ -1,15 +1,45 @@
+import argparse
 import logging
+import multiprocessing
 import os
+import queue
 import sys
+import threading
+import time
+from multiprocessing.connection import wait
+from typing import Callable, Dict, List, Optional
 
-from csv_parser import generate_author_cell_type_config, write_yaml_file
+from build_manifest import (
+    METADATA_FIELDS,
+    compute_input_hash,
+    index_graph_directory,
+    is_up_to_date,
+    load_manifest,
+    record_build,
+    save_manifest,
+)
+from download_scheduler import (
+    DiskBudget,
+    add_download_sizes,
+    get_disk_budget,
+    log_disk_plan,
+    order_by_size,
+)
 from pull_anndata import (
     get_dataset_dict,
     download_dataset_with_url,
     get_dataset_id_from_link,
     delete_file,
+    read_yaml_config,
 )
-from generate_rdf import generate_rdf_graph
+from rdf4j_loader import LOAD_TRIPLESTORE, TriplestoreLoader
+from rdf_writer import (
+    OUTPUT_FORMAT,
+    dataset_graph_iri,
+    dataset_graph_name,
+    get_output_extension,
+)
+from run_report import DatasetMetrics, RunReport, profile, track_dataset
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.WARNING)
@@ -28,40 +58,750 @@ GRAPH_DIRECTORY = "graph"
 CXG_AUTHOR_CELL_TYPE_CONFIG = "cxg_author_cell_type.yaml"
 GENERATE_RDF_CONFIG = "generate_rdf_config.yaml"
 
-cxg_author_cell_type_yaml = generate_author_cell_type_config()
-output_file_path = os.path.join(
-    os.path.join(os.path.dirname(os.path.abspath(__file__)), CONFIG_DIRECTORY),
-    CXG_AUTHOR_CELL_TYPE_CONFIG,
-)
-write_yaml_file(cxg_author_cell_type_yaml, output_file_path)
-datasets = get_dataset_dict(cxg_author_cell_type_yaml)
-for dataset in datasets.items():
-    matrix_id = dataset[0]
-    dataset_url = dataset[1].get("download_url")
-    author_cell_types = dataset[1].get("author_cell_type_list")
-    download_id = get_dataset_id_from_link(dataset_url)
-
-    rdf_output_path = os.path.join(
-        os.path.join(os.path.dirname(os.path.abspath(__file__)), GRAPH_DIRECTORY),
-        f"{matrix_id}__{download_id}",
-    )
-    h5ad_output_path = os.path.join(
-        os.path.join(os.path.dirname(os.path.abspath(__file__)), DATASET_DIRECTORY),
-        f"{matrix_id}",
+# Resolve CxG dataset versions from the on-disk cache only, without network access
+CXG_OFFLINE = os.getenv("CXG_OFFLINE", "false").lower() == "true"
+# "pool" converts datasets in parallel, "pipeline" overlaps downloads with conversions
+MODE = os.getenv("ANNDATA2RDF_MODE", "pool")
+# Number of h5ad files downloaded ahead of the conversion in pipeline mode
+PREFETCH = int(os.getenv("ANNDATA2RDF_PREFETCH", "2"))
+# Seconds between the checks of the pipeline producer for the end of the run
+STOP_POLL_SECONDS = 0.5
+# Number of datasets converted at the same time, each in its own subprocess
+WORKERS = int(os.getenv("ANNDATA2RDF_WORKERS", "1"))
+# RAM shared by the conversion subprocesses. Defaults to 80% of the physical memory.
+MEMORY_BUDGET_GB = os.getenv("ANNDATA2RDF_MEMORY_BUDGET_GB")
+
+# Heuristics for the peak memory of a single conversion. Only obs is read from the h5ad
+# file, so the estimate grows with the number of obs values when the file is available
+# locally, and with the size of the remote file otherwise.
+BASE_MEMORY_BYTES = 1024**3
+MEMORY_PER_OBS_VALUE = 64
+MEMORY_PER_FILE_BYTE = 0.5
+
+
+def get_memory_budget() -> int:
+    if MEMORY_BUDGET_GB:
+        return int(float(MEMORY_BUDGET_GB) * 1024**3)
+    return int(0.8 * os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES"))
+
+
+def estimate_memory_bytes(
+    h5ad_path: Optional[str] = None, file_size: Optional[int] = None
+) -> int:
+    """
+    Estimate the peak memory needed to convert a dataset.
+
+    Args:
+        h5ad_path: The path of the h5ad file if it is already downloaded.
+        file_size: The size of the h5ad file in bytes, if known.
+
+    Returns:
+        The estimated peak memory in bytes.
+    """
+    from obs_loader import read_obs_shape
+
+    obs_shape = read_obs_shape(h5ad_path) if h5ad_path else None
+    if obs_shape:
+        n_obs, n_columns = obs_shape
+        return BASE_MEMORY_BYTES + n_obs * n_columns * MEMORY_PER_OBS_VALUE
+    if file_size:
+        return BASE_MEMORY_BYTES + int(file_size * MEMORY_PER_FILE_BYTE)
+    return BASE_MEMORY_BYTES
+
+
+def get_source_path(directory: str) -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), directory)
+
+
+def plan_jobs(
+    datasets: Dict, manifest: Optional[Dict] = None, graph_index: Optional[Dict] = None
+) -> List[Dict]:
+    """
+    Build the conversion jobs of the datasets whose RDF graph is missing or stale.
+
+    A graph is up to date if the build manifest records the same input hash for it,
+    which covers the dataset version, the author cell type fields, the metadata fields
+    and the pandasaurus-cxg version. Graphs that exist but are not in the manifest yet
+    are recorded as up to date if their dataset version is current.
+
+    Args:
+        datasets: The output of `get_dataset_dict`.
+        manifest: The build manifest, updated in place with adopted graphs.
+        graph_index: The output of `index_graph_directory` for the graph directory.
+
+    Returns:
+        A list of jobs, one dictionary per dataset to convert.
+    """
+    manifest = manifest if manifest is not None else {}
+    graph_index = (
+        graph_index
+        if graph_index is not None
+        else index_graph_directory(get_source_path(GRAPH_DIRECTORY))
     )
-    logger.info(rdf_output_path)
-    if os.path.exists(rdf_output_path + ".owl"):
-        logger.info(f"RDF graph '{rdf_output_path}' already exists. Skipping process.")
-    else:
-        dataset_path = download_dataset_with_url(matrix_id, dataset_url)
-        if dataset_path is None:
-            logger.error(
-                f"Failed to download dataset '{matrix_id}'. Skipping this dataset."
+    output_extension = get_output_extension(OUTPUT_FORMAT)
+    jobs = []
+    for matrix_id, dataset in datasets.items():
+        dataset_url = dataset.get("download_url")
+        download_id = get_dataset_id_from_link(dataset_url)
+        author_cell_types = dataset.get("author_cell_type_list")
+        input_hash = compute_input_hash(
+            matrix_id, download_id, author_cell_types, METADATA_FIELDS
+        )
+        rdf_output_path = os.path.join(
+            get_source_path(GRAPH_DIRECTORY), f"{matrix_id}__{download_id}"
+        )
+        output_path = rdf_output_path + output_extension
+        existing_outputs = graph_index.get(matrix_id, [])
+        if is_up_to_date(
+            manifest,
+            graph_index,
+            matrix_id,
+            input_hash,
+            os.path.basename(output_path),
+        ):
+            logger.info(
+                f"RDF graph '{rdf_output_path}' is up to date. Skipping process."
+            )
+            continue
+        if matrix_id not in manifest and output_path in existing_outputs:
+            job = {"matrix_id": matrix_id, "download_id": download_id}
+            record_build(manifest, dict(job, input_hash=input_hash), output_path)
+            logger.info(
+                f"RDF graph '{rdf_output_path}' already exists. Recording it in the "
+                f"build manifest and skipping process."
             )
             continue
+        logger.info(f"RDF graph '{rdf_output_path}' will be generated.")
+        stale_outputs = [path for path in existing_outputs if path != output_path]
+        jobs.append(
+            {
+                "matrix_id": matrix_id,
+                "download_url": dataset_url,
+                "download_id": download_id,
+                "author_cell_type_list": author_cell_types,
+                "input_hash": input_hash,
+                "rdf_output_path": rdf_output_path,
+                "output_format": OUTPUT_FORMAT,
+                "output_path": output_path,
+                "stale_outputs": stale_outputs,
+                "graph_name": dataset_graph_iri(matrix_id, download_id),
+                "replaced_graphs": get_replaced_graphs(
+                    matrix_id, download_id, manifest, stale_outputs
+                ),
+                "h5ad_path": os.path.join(
+                    get_source_path(DATASET_DIRECTORY),
+                    f"{matrix_id}__{download_id}.h5ad",
+                ),
+            }
+        )
+    return jobs
+
+
+def get_replaced_graphs(
+    matrix_id: str, download_id: str, manifest: Dict, stale_outputs: List[str]
+) -> List[str]:
+    """
+    Return the named graphs of the previous versions of a dataset.
+
+    Args:
+        matrix_id: The CxG dataset identifier.
+        download_id: The identifier of the current dataset version.
+        manifest: The build manifest, which records the last built version.
+        stale_outputs: The graph files of other versions of the dataset.
+
+    Returns:
+        The names of the graphs that the current version replaces in the triplestore.
+    """
+    previous_download_ids = [manifest.get(matrix_id, {}).get("download_id")]
+    for stale_output in stale_outputs:
+        file_name = os.path.basename(stale_output)
+        previous_download_ids.append(
+            file_name.partition("__")[2].split(".", 1)[0] or None
+        )
+    return [
+        dataset_graph_iri(matrix_id, previous_download_id)
+        for previous_download_id in dict.fromkeys(previous_download_ids)
+        if previous_download_id and previous_download_id != download_id
+    ]
+
+
+def record_result(manifest: Dict, job: Dict, result: Dict):
+    """Record a generated graph in the build manifest and remove its previous versions."""
+    if result["status"] != "succeeded":
+        return
+    record_build(manifest, job, job["output_path"])
+    save_manifest(manifest)
+    for stale_output in job["stale_outputs"]:
+        delete_file(stale_output)
+        logger.info(
+            f"Dataset with ID {job['matrix_id']} has a new version. The previous RDF "
+            f"graph at {stale_output} has been replaced with the latest version."
+        )
+
+
+def add_memory_estimates(jobs: List[Dict]):
+    """Set the 'memory_estimate' of each job from its file or its 'download_size'."""
+    for job in jobs:
+        if os.path.exists(job["h5ad_path"]):
+            job["memory_estimate"] = estimate_memory_bytes(h5ad_path=job["h5ad_path"])
+        else:
+            job["memory_estimate"] = estimate_memory_bytes(
+                file_size=job.get("download_size")
+            )
+
+
+def download_job(job: Dict) -> str:
+    """Download the h5ad file of a job if it is not on disk yet and return its path."""
+    # Downloads are renamed into place once verified, so an existing file is complete
+    if os.path.exists(job["h5ad_path"]):
+        return job["h5ad_path"]
+    dataset_path = download_dataset_with_url(
+        job["matrix_id"], job["download_url"], replace_previous_graph=False
+    )
+    if dataset_path is None:
+        raise RuntimeError(f"Failed to download dataset '{job['matrix_id']}'.")
+    return dataset_path
+
+
+def convert_downloaded_dataset(job: Dict, dataset_path: str):
+    """Generate the RDF graph of a downloaded dataset and delete the h5ad file."""
+    # pandasaurus-cxg takes seconds to import, so only the conversion subprocesses do
+    from generate_rdf import generate_rdf_graph
+
+    try:
         generate_rdf_graph(
             dataset_path,
-            author_cell_types,
-            rdf_output_path,
+            job["author_cell_type_list"],
+            job["rdf_output_path"],
+            output_format=job["output_format"],
+            graph_name=dataset_graph_name(job["matrix_id"], job["download_id"]),
         )
+    finally:
         delete_file(dataset_path)
+
+
+def convert_dataset(job: Dict):
+    """Download a dataset, generate its RDF graph and delete the downloaded file."""
+    convert_downloaded_dataset(job, download_job(job))
+
+
+def _worker(function, args, connection, profile_name):
+    metrics = DatasetMetrics()
+    try:
+        with track_dataset(metrics), profile(profile_name):
+            function(*args)
+        status, reason = "succeeded", None
+    except BaseException as e:
+        status, reason = "failed", f"{type(e).__name__}: {e}"
+    try:
+        metrics.finish()
+        connection.send((status, reason, metrics.to_dict()))
+    finally:
+        connection.close()
+
+
+def describe_exit_code(exit_code: int) -> str:
+    if exit_code == -9:
+        return "Worker was killed by SIGKILL, most likely out of memory."
+    if exit_code < 0:
+        return f"Worker was killed by signal {-exit_code}."
+    return f"Worker exited with code {exit_code} without reporting a result."
+
+
+def start_worker(context, function, args: tuple, name: str, profile_name: str):
+    """
+    Run `function(*args)` in a subprocess and return the process and its result pipe.
+
+    The stage timings and counters recorded by the function are sent back with its
+    result, and a cProfile named `profile_name` is dumped if profiling is enabled.
+    """
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(
+        target=_worker, args=(function, args, sender, profile_name), name=name
+    )
+    process.start()
+    sender.close()
+    return process, receiver
+
+
+def collect_worker(process, receiver) -> tuple:
+    """Wait for a worker subprocess and return its (status, reason, metrics) result."""
+    process.join()
+    try:
+        # A worker that died closed the pipe without sending anything
+        status, reason, metrics = receiver.recv()
+    except EOFError:
+        status, reason, metrics = "failed", describe_exit_code(process.exitcode), {}
+    receiver.close()
+    return status, reason, metrics
+
+
+def run_worker_pool(
+    jobs: List[Dict],
+    workers: int = WORKERS,
+    memory_budget: Optional[int] = None,
+    on_result: Optional[Callable[[Dict, Dict], None]] = None,
+    disk_budget: Optional[DiskBudget] = None,
+) -> List[Dict]:
+    """
+    Convert datasets in parallel, each one in its own subprocess.
+
+    A job is started only while a worker is free and its memory estimate fits into what
+    is left of the memory budget, and its download into what is left of the disk
+    budget. A job that is larger than the whole budget is started once no other job is
+    running. A crashed or killed subprocess only fails its own dataset.
+
+    Args:
+        jobs: The output of `plan_jobs`, optionally with a 'memory_estimate' and a
+            'download_size' per job.
+        workers: The maximum number of concurrent conversions.
+        memory_budget: The RAM shared by the conversions in bytes. Defaults to
+            `get_memory_budget()`.
+        on_result: Called with each job and its result as soon as the job ends.
+        disk_budget: The disk space shared by the downloaded files, if limited.
+
+    Returns:
+        A list with the 'matrix_id', 'status', failure 'reason' and 'metrics' of each
+        job.
+    """
+    memory_budget = memory_budget if memory_budget else get_memory_budget()
+    context = multiprocessing.get_context("spawn")
+    pending = list(jobs)
+    running = {}
+    reserved = 0
+    results = []
+    while pending or running:
+        while pending and len(running) < max(workers, 1):
+            available = memory_budget - reserved
+            job = next(
+                (
+                    j
+                    for j in pending
+                    if j.get("memory_estimate", 0) <= available
+                    and (
+                        disk_budget is None
+                        or disk_budget.fits(j.get("download_size", 0))
+                    )
+                ),
+                None if running else pending[0],
+            )
+            if job is None:
+                break
+            # Only fails if the budget is held outside the pool. The job then waits for
+            # a running one, or runs alone like a job larger than the budget.
+            disk_reserved = disk_budget is not None and disk_budget.try_acquire(
+                job.get("download_size", 0)
+            )
+            if disk_budget is not None and not disk_reserved and running:
+                break
+            pending.remove(job)
+            process, receiver = start_worker(
+                context,
+                convert_dataset,
+                (job,),
+                f"anndata2rdf-{job['matrix_id']}",
+                job["matrix_id"],
+            )
+            running[process.sentinel] = (job, process, receiver, disk_reserved)
+            reserved += job.get("memory_estimate", 0)
+            logger.info(
+                f"Started converting '{job['matrix_id']}' "
+                f"({len(running)} running, {len(pending)} pending)."
+            )
+
+        for sentinel in wait(list(running)):
+            job, process, receiver, disk_reserved = running.pop(sentinel)
+            status, reason, metrics = collect_worker(process, receiver)
+            reserved -= job.get("memory_estimate", 0)
+            if disk_reserved:
+                disk_budget.release(job.get("download_size", 0))
+            results.append(
+                {
+                    "matrix_id": job["matrix_id"],
+                    "status": status,
+                    "reason": reason,
+                    "metrics": metrics,
+                }
+            )
+            if on_result:
+                on_result(job, results[-1])
+            log = logger.info if status == "succeeded" else logger.error
+            log(f"Converting '{job['matrix_id']}' {status}.")
+    return results
+
+
+def run_pipeline(
+    jobs: List[Dict],
+    prefetch: int = PREFETCH,
+    on_result: Optional[Callable[[Dict, Dict], None]] = None,
+    disk_budget: Optional[DiskBudget] = None,
+) -> List[Dict]:
+    """
+    Overlap downloads with conversions.
+
+    A producer thread downloads the h5ad files ahead of the conversion, which runs in a
+    subprocess per dataset. A download slot and the file's share of the disk budget are
+    taken before each download and released once the converted file is deleted, so at
+    most `prefetch` files wait on disk besides the one being converted, and only as
+    many as fit into the budget.
+
+    Args:
+        jobs: The output of `plan_jobs`, optionally with a 'download_size' per job.
+        prefetch: The number of h5ad files downloaded ahead of the conversion.
+        on_result: Called with each job and its result as soon as the job ends.
+        disk_budget: The disk space shared by the downloaded files, if limited.
+
+    Returns:
+        A list with the 'matrix_id', 'status', failure 'reason' and 'metrics' of each
+        job.
+    """
+    total = len(jobs)
+    downloaded = queue.Queue(maxsize=max(prefetch, 1))
+    slots = threading.BoundedSemaphore(max(prefetch, 1) + 1)
+    # Set when the conversion loop ends, so the producer does not wait for it forever
+    stop = threading.Event()
+
+    def _wait_for(acquire: Callable[[], bool]) -> bool:
+        while not stop.is_set():
+            if acquire():
+                return True
+        return False
+
+    def _put(item) -> bool:
+        try:
+            downloaded.put(item, timeout=STOP_POLL_SECONDS)
+        except queue.Full:
+            return False
+        return True
+
+    def _producer():
+        for position, job in enumerate(jobs, start=1):
+            if not _wait_for(lambda: slots.acquire(timeout=STOP_POLL_SECONDS)):
+                return
+            if disk_budget is not None and not _wait_for(
+                lambda: disk_budget.acquire(
+                    job.get("download_size", 0), timeout=STOP_POLL_SECONDS
+                )
+            ):
+                slots.release()
+                return
+            start = time.time()
+            metrics = DatasetMetrics()
+            try:
+                with track_dataset(metrics):
+                    dataset_path, reason = download_job(job), None
+            except Exception as e:
+                dataset_path, reason = None, f"{type(e).__name__}: {e}"
+            # This process downloads every dataset, so its peak RSS is not recorded
+            metrics.finish(record_peak_rss=False)
+            logger.info(
+                f"[download {position}/{total}] '{job['matrix_id']}' "
+                f"{'done' if dataset_path else 'failed'} in {time.time() - start:.1f}s "
+                f"({downloaded.qsize()} waiting for conversion)."
+            )
+            if not _wait_for(lambda: _put((job, dataset_path, reason, metrics))):
+                return
+        _wait_for(lambda: _put(None))
+
+    def _release(job: Dict):
+        if disk_budget is not None:
+            disk_budget.release(job.get("download_size", 0))
+        slots.release()
+
+    producer = threading.Thread(target=_producer, name="anndata2rdf-download")
+    producer.start()
+    context = multiprocessing.get_context("spawn")
+    results = []
+    try:
+        for position in range(1, total + 1):
+            job, dataset_path, reason, metrics = downloaded.get()
+            status = "failed"
+            if dataset_path is not None:
+                start = time.time()
+                process, receiver = start_worker(
+                    context,
+                    convert_downloaded_dataset,
+                    (job, dataset_path),
+                    f"anndata2rdf-{job['matrix_id']}",
+                    job["matrix_id"],
+                )
+                status, reason, conversion_metrics = collect_worker(process, receiver)
+                metrics.merge(conversion_metrics)
+                # The worker deletes the file unless it was killed
+                if os.path.exists(dataset_path):
+                    delete_file(dataset_path)
+                logger.info(
+                    f"[convert {position}/{total}] '{job['matrix_id']}' {status} in "
+                    f"{time.time() - start:.1f}s."
+                )
+            _release(job)
+            results.append(
+                {
+                    "matrix_id": job["matrix_id"],
+                    "status": status,
+                    "reason": reason,
+                    "metrics": metrics.to_dict(),
+                }
+            )
+            if on_result:
+                on_result(job, results[-1])
+    finally:
+        stop.set()
+        # Downloads that were not converted keep their files for the next run
+        while True:
+            try:
+                item = downloaded.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                _release(item[0])
+        producer.join()
+    return results
+
+
+def log_summary(results: List[Dict], skipped: int = 0):
+    succeeded = [result for result in results if result["status"] == "succeeded"]
+    failed = [result for result in results if result["status"] != "succeeded"]
+    logger.info(
+        f"Run finished: {len(succeeded)} succeeded, {len(failed)} failed, "
+        f"{skipped} skipped."
+    )
+    for result in succeeded:
+        logger.info(f"  succeeded: {result['matrix_id']}")
+    for result in failed:
+        logger.error(f"  failed: {result['matrix_id']} - {result['reason']}")
+
+
+def resolve_datasets() -> Dict:
+    """Regenerate the CxG author cell type configuration and return its datasets."""
+    # Parsing the curated sheets needs pandas, which only this step uses
+    from csv_parser import generate_author_cell_type_config, write_yaml_file
+
+    cxg_author_cell_type_yaml = generate_author_cell_type_config(offline=CXG_OFFLINE)
+    output_file_path = os.path.join(
+        get_source_path(CONFIG_DIRECTORY), CXG_AUTHOR_CELL_TYPE_CONFIG
+    )
+    write_yaml_file(cxg_author_cell_type_yaml, output_file_path)
+    return get_dataset_dict(cxg_author_cell_type_yaml)
+
+
+def load_datasets() -> Dict:
+    """Return the datasets of the last resolved configuration, or resolve them."""
+    config_path = os.path.join(
+        get_source_path(CONFIG_DIRECTORY), CXG_AUTHOR_CELL_TYPE_CONFIG
+    )
+    if not os.path.exists(config_path):
+        logger.info(f"'{config_path}' does not exist yet. Resolving the datasets.")
+        return resolve_datasets()
+    return get_dataset_dict(read_yaml_config(config_path) or [])
+
+
+def plan_run(datasets: Dict, report: RunReport, downloaded_only: bool = False) -> tuple:
+    """
+    Plan the jobs of a run, size their downloads and project their disk use.
+
+    Args:
+        datasets: The dataset configuration.
+        report: The report of the run.
+        downloaded_only: Only plan the datasets that are already downloaded, which are
+            sized on disk without sending HEAD requests.
+
+    Returns:
+        The build manifest, the jobs ordered by size and the disk budget.
+    """
+    with report.stage("plan"):
+        manifest = load_manifest()
+        jobs = plan_jobs(datasets, manifest)
+        save_manifest(manifest)
+        if downloaded_only:
+            downloaded_jobs = [job for job in jobs if os.path.exists(job["h5ad_path"])]
+            logger.info(
+                f"Converting {len(downloaded_jobs)} downloaded datasets, "
+                f"{len(jobs) - len(downloaded_jobs)} are not downloaded yet."
+            )
+            jobs = downloaded_jobs
+        add_download_sizes(jobs)
+        jobs = order_by_size(jobs)
+        if MODE == "pool" and WORKERS > 1:
+            add_memory_estimates(jobs)
+        disk_budget = DiskBudget(get_disk_budget(get_source_path(DATASET_DIRECTORY)))
+        report.settings["disk_budget_bytes"] = disk_budget.budget
+        report.settings["projected_peak_disk_bytes"] = log_disk_plan(
+            jobs,
+            disk_budget.budget,
+            PREFETCH + 1 if MODE == "pipeline" else max(WORKERS, 1),
+        )
+    report.skipped = len(datasets) - len(jobs)
+    return manifest, jobs, disk_budget
+
+
+def convert_jobs(
+    jobs: List[Dict], manifest: Dict, disk_budget: DiskBudget, report: RunReport
+) -> List[Dict]:
+    """Convert the jobs and load their graphs into the triplestore if enabled."""
+    # Graphs are loaded into the triplestore while the next datasets are converted
+    loader = TriplestoreLoader() if LOAD_TRIPLESTORE else None
+    loads = []
+
+    def _on_result(job, result):
+        record_result(manifest, job, result)
+        report.add_dataset(result)
+        if loader and result["status"] == "succeeded":
+            loads.append(
+                loader.submit(
+                    job["matrix_id"],
+                    job["output_path"],
+                    job["graph_name"],
+                    job["replaced_graphs"],
+                )
+            )
+
+    try:
+        with report.stage("convert"):
+            if MODE == "pipeline":
+                results = run_pipeline(
+                    jobs,
+                    prefetch=PREFETCH,
+                    on_result=_on_result,
+                    disk_budget=disk_budget,
+                )
+            else:
+                results = run_worker_pool(
+                    jobs,
+                    workers=WORKERS,
+                    on_result=_on_result,
+                    disk_budget=disk_budget,
+                )
+        with report.stage("load"):
+            for load in loads:
+                report.add_load(load.result())
+    finally:
+        if loader:
+            loader.close()
+    log_summary(results, skipped=report.skipped)
+    return results
+
+
+def command_resolve(args: argparse.Namespace):
+    datasets = resolve_datasets()
+    logger.info(f"Resolved {len(datasets)} datasets.")
+
+
+def command_plan(args: argparse.Namespace):
+    datasets = load_datasets()
+    # Only a preview, so graphs adopted by the planner are not recorded
+    jobs = plan_jobs(datasets, load_manifest())
+    if args.sizes:
+        add_download_sizes(jobs)
+        jobs = order_by_size(jobs)
+        log_disk_plan(
+            jobs,
+            get_disk_budget(get_source_path(DATASET_DIRECTORY)),
+            PREFETCH + 1 if MODE == "pipeline" else max(WORKERS, 1),
+        )
+    for job in jobs:
+        downloaded = " (downloaded)" if os.path.exists(job["h5ad_path"]) else ""
+        logger.info(f"{job['matrix_id']} {job['download_id']}{downloaded}")
+    logger.info(
+        f"{len(jobs)} of {len(datasets)} datasets would be converted, "
+        f"{len(datasets) - len(jobs)} are up to date."
+    )
+
+
+def command_download(args: argparse.Namespace):
+    report = RunReport({"command": "download"})
+    _, jobs, disk_budget = plan_run(load_datasets(), report)
+    with report.stage("download"):
+        for job in jobs:
+            # The files stay on disk for the convert command, so the budget is not
+            # released
+            if not disk_budget.try_acquire(job.get("download_size", 0)):
+                logger.warning(
+                    f"'{job['matrix_id']}' does not fit into the disk budget. "
+                    f"Skipping download."
+                )
+                continue
+            try:
+                download_job(job)
+            except RuntimeError as e:
+                logger.error(str(e))
+    report.write()
+
+
+def command_convert(args: argparse.Namespace):
+    report = RunReport({"command": "convert", "mode": MODE, "workers": WORKERS})
+    manifest, jobs, disk_budget = plan_run(
+        load_datasets(), report, downloaded_only=True
+    )
+    convert_jobs(jobs, manifest, disk_budget, report)
+    report.write()
+
+
+def command_all(args: argparse.Namespace):
+    report = RunReport(
+        {
+            "command": "all",
+            "mode": MODE,
+            "workers": WORKERS,
+            "prefetch": PREFETCH,
+            "output_format": OUTPUT_FORMAT,
+            "offline": CXG_OFFLINE,
+            "load_triplestore": LOAD_TRIPLESTORE,
+        }
+    )
+    with report.stage("resolve"):
+        datasets = resolve_datasets()
+    manifest, jobs, disk_budget = plan_run(datasets, report)
+    convert_jobs(jobs, manifest, disk_budget, report)
+    report.write()
+
+
+COMMANDS = {
+    "resolve": (
+        command_resolve,
+        "Regenerate the dataset configuration from the curated sheets and CxG.",
+    ),
+    "plan": (
+        command_plan,
+        "List the datasets whose graphs are missing or stale, without network access "
+        "unless the configuration was never resolved.",
+    ),
+    "download": (
+        command_download,
+        "Download the h5ad files of the planned datasets within the disk budget.",
+    ),
+    "convert": (
+        command_convert,
+        "Convert the planned datasets that are already downloaded.",
+    ),
+    "all": (command_all, "Resolve, download and convert the datasets (default)."),
+}
+
+
+def parse_arguments(arguments: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="anndata2rdf",
+        description="Generate RDF graphs of the CxG datasets of the curated sheets.",
+    )
+    subparsers = parser.add_subparsers(dest="command")
+    for name, (_, help_text) in COMMANDS.items():
+        subparser = subparsers.add_parser(name, help=help_text, description=help_text)
+        if name == "plan":
+            subparser.add_argument(
+                "--sizes",
+                action="store_true",
+                help="Size the downloads with HEAD requests and project the disk use.",
+            )
+    args = parser.parse_args(arguments)
+    args.command = args.command or "all"
+    return args
+
+
+def main(arguments: Optional[List[str]] = None):
+    args = parse_arguments(arguments)
+    command, _ = COMMANDS[args.command]
+    command(args)
+
+
+if __name__ == "__main__":
+    main()
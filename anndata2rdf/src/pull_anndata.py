@@ -1,16 +1,24 @@
+import contextvars
 import logging
 import os
-import glob
+import re
+import shutil
 import time
-from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
 
 import requests
 from tqdm import tqdm
 import yaml
 
+from build_manifest import index_graph_directory
+from run_report import count, stage
+
 CHUNK_SIZE = 8 * 1024 * 1024  # 8 MB per chunk
 MAX_RETRIES = 3
 RETRY_DELAY = 2
+# Number of byte ranges of a single file fetched in parallel
+DOWNLOAD_SEGMENTS = int(os.getenv("ANNDATA2RDF_DOWNLOAD_SEGMENTS", "1"))
 
 logging.basicConfig(level=logging.WARNING)
 
@@ -47,14 +55,19 @@ def download_dataset_with_id(dataset_id: str, file_path: Optional[str] = None) -
 
 
 def download_dataset_with_url(
-    matrix_id: str, dataset_download_url: str, file_path: Optional[str] = None
+    matrix_id: str,
+    dataset_download_url: str,
+    file_path: Optional[str] = None,
+    segments: int = DOWNLOAD_SEGMENTS,
+    replace_previous_graph: bool = True,
 ) -> Optional[str]:
     """
     Download an AnnData dataset from the specified URL in chunks with retry logic.
 
     This function downloads large AnnData datasets in 8 MB chunks to avoid memory overflow issues.
-    If the download is interrupted, the function retries up to a maximum number of attempts.
-    Incomplete files are deleted before retrying to ensure data integrity. If a file path is not specified,
+    The data is written to a '.part' file first. If the download is interrupted, it is resumed
+    from the last received byte with a Range request, and the complete file is verified against
+    the Content-Length before it is moved into place. If a file path is not specified,
     the dataset ID is used as the file name, and the file saved in the 'dataset' directory.
     The function checks if a file with the same prefix already exists in the 'graph' directory. If an older version is
     found, it is deleted and replaced with the new download.
@@ -64,6 +77,10 @@ def download_dataset_with_url(
         dataset_download_url: The URL from which the dataset will be downloaded.
         file_path: The file path to save the downloaded AnnData.
             If not provided, the dataset ID will be used as the file name. Defaults to None.
+        segments: The number of byte ranges fetched in parallel. Defaults to
+            DOWNLOAD_SEGMENTS.
+        replace_previous_graph: Whether to look up and replace the existing graph of the
+            dataset. Disable it if the caller manages the 'graph' directory itself.
 
     Returns:
         The path to the downloaded file if successful, or None if the
@@ -83,7 +100,11 @@ def download_dataset_with_url(
     )
 
     # Check if any owl file with the prefix exists
-    matching_files = check_file_exists_based_on_prefix(directory, matrix_id)
+    matching_files = (
+        check_file_exists_based_on_prefix(directory, matrix_id)
+        if replace_previous_graph
+        else []
+    )
 
     if matching_files:
         rdf_graph_path = matching_files[0]
@@ -104,57 +125,261 @@ def download_dataset_with_url(
         f"Downloading dataset from URL '{dataset_download_url}' to '{anndata_file_path}'..."
     )
 
+    with stage("download"):
+        downloaded = download_file(
+            dataset_download_url, anndata_file_path, segments=segments
+        )
+    if downloaded:
+        logger.info(f"Download complete. File saved at '{anndata_file_path}'.")
+        return anndata_file_path
+    return None
+
+
+def download_file(
+    url: str,
+    file_path: str,
+    segments: int = 1,
+    session: Optional[requests.Session] = None,
+) -> bool:
+    """
+    Download a file with resumable Range requests.
+
+    The content is written to '<file_path>.part', or to one '.part<i>' file per segment
+    when the file is fetched in several parallel byte ranges. Partial files are kept
+    between attempts and between runs, so an interrupted download continues from the
+    last received byte. The complete file is verified against the Content-Length
+    before it is renamed to `file_path`.
+
+    Args:
+        url: The URL of the file.
+        file_path: The path to save the file to.
+        segments: The number of byte ranges fetched in parallel. Segmented fetching is
+            only used if the server reports the file size and accepts Range requests.
+        session: The session used to send the requests.
+
+    Returns:
+        True if the file was downloaded and verified, False otherwise.
+    """
+    own_session = session is None
+    session = requests.Session() if own_session else session
+    try:
+        total_size, accepts_ranges = _probe_remote_file(url, session)
+        if total_size is not None:
+            logger.info(f"Total file size: {total_size / (1024 ** 3):.2f} GB")
+        if segments > 1 and total_size and accepts_ranges:
+            bounds = _segment_bounds(total_size, segments)
+            part_paths = [f"{file_path}.part{i}" for i in range(len(bounds))]
+        else:
+            bounds = [(0, total_size - 1 if total_size else None)]
+            part_paths = [f"{file_path}.part"]
+
+        with tqdm(
+            total=total_size,
+            unit="B",
+            unit_scale=True,
+            unit_divisor=1024,
+            desc="Downloading",
+        ) as progress_bar:
+            if len(bounds) == 1:
+                completed = [
+                    _fetch_range(url, part_paths[0], *bounds[0], session, progress_bar)
+                ]
+            else:
+                # Each segment runs in a copy of this context to keep the run metrics
+                contexts = [contextvars.copy_context() for _ in bounds]
+                with ThreadPoolExecutor(max_workers=len(bounds)) as executor:
+                    completed = list(
+                        executor.map(
+                            lambda args: args[0].run(
+                                _fetch_range,
+                                url,
+                                args[1],
+                                *args[2],
+                                session,
+                                progress_bar,
+                            ),
+                            zip(contexts, part_paths, bounds),
+                        )
+                    )
+        if not all(completed):
+            logger.error("Max retries reached. Download failed.")
+            return False
+
+        if len(part_paths) > 1:
+            with open(part_paths[0], "ab") as merged:
+                for part_path in part_paths[1:]:
+                    with open(part_path, "rb") as part:
+                        shutil.copyfileobj(part, merged, CHUNK_SIZE)
+                    os.remove(part_path)
+        downloaded_size = os.path.getsize(part_paths[0])
+        if total_size is not None and downloaded_size != total_size:
+            logger.error(
+                f"Downloaded {downloaded_size} bytes but expected {total_size} bytes. "
+                f"Deleting incomplete file: {part_paths[0]}"
+            )
+            os.remove(part_paths[0])
+            return False
+        os.replace(part_paths[0], file_path)
+        return True
+    finally:
+        if own_session:
+            session.close()
+
+
+def _probe_remote_file(
+    url: str, session: requests.Session
+) -> Tuple[Optional[int], bool]:
+    """Return the size of a remote file and whether the server accepts Range requests."""
+    try:
+        response = session.head(url, allow_redirects=True)
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"Could not get the size of '{url}': {e}")
+        return None, False
+    content_length = response.headers.get("content-length")
+    accepts_ranges = response.headers.get("accept-ranges", "").lower() == "bytes"
+    return (int(content_length) if content_length else None), accepts_ranges
+
+
+def _segment_bounds(total_size: int, segments: int) -> List[Tuple[int, int]]:
+    """Split [0, total_size) into inclusive byte ranges of (almost) equal size."""
+    segment_size = -(-total_size // segments)
+    return [
+        (start, min(start + segment_size, total_size) - 1)
+        for start in range(0, total_size, segment_size)
+    ]
+
+
+def _fetch_range(
+    url: str,
+    part_path: str,
+    start: int,
+    end: Optional[int],
+    session: requests.Session,
+    progress_bar: Optional[tqdm] = None,
+) -> bool:
+    """
+    Download the inclusive byte range [start, end] of a file into `part_path`.
+
+    Bytes already in `part_path` are kept and only the rest of the range is requested.
+    The number of retries is reset whenever an attempt makes progress.
+
+    Args:
+        url: The URL of the file.
+        part_path: The partial file to append to.
+        start: The first byte of the range.
+        end: The last byte of the range, or None for the end of the file.
+        session: The session used to send the requests.
+        progress_bar: A progress bar updated with the received bytes.
+
+    Returns:
+        True if the whole range was received, False otherwise.
+    """
+    expected = end - start + 1 if end is not None else None
+    existing = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    if expected is not None and existing > expected:
+        logger.warning(f"Deleting oversized partial file: {part_path}")
+        os.remove(part_path)
+        existing = 0
+    if progress_bar is not None:
+        progress_bar.update(existing)
+
     retries = 0
     while retries < MAX_RETRIES:
+        if expected is not None and existing == expected:
+            return True
+        headers = {}
+        if existing or start or end is not None:
+            headers["Range"] = f"bytes={start + existing}-{'' if end is None else end}"
+        received = 0
         try:
-            with requests.get(dataset_download_url, stream=True) as response:
+            with session.get(url, stream=True, headers=headers) as response:
                 if response.status_code == 200:
-                    total_size = int(response.headers.get("content-length", 0))
-                    logger.info(f"Total file size: {total_size / (1024 ** 3):.2f} GB")
-
-                    with tqdm(
-                        total=total_size,
-                        unit="B",
-                        unit_scale=True,
-                        unit_divisor=1024,
-                        desc="Downloading",
-                    ) as progress_bar, open(anndata_file_path, "wb") as file:
-                        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
-                            if chunk:  # filter out keep-alive new chunks
-                                file.write(chunk)
-                                progress_bar.update(len(chunk))
-
-                    logger.info(
-                        f"Download complete. File saved at '{anndata_file_path}'."
-                    )
-                    return anndata_file_path
+                    if start:
+                        logger.error(
+                            f"The server ignored the Range request for '{url}'."
+                        )
+                        return False
+                    # The whole file is sent again, so start over
+                    if existing:
+                        logger.warning(f"Server does not resume, restarting: {url}")
+                        if progress_bar is not None:
+                            progress_bar.update(-existing)
+                        existing = 0
+                    mode = "wb"
+                elif response.status_code == 206:
+                    content_range = response.headers.get("content-range", "")
+                    match = re.match(r"bytes (\d+)-", content_range)
+                    if match and int(match.group(1)) != start + existing:
+                        logger.error(f"Unexpected Content-Range '{content_range}'.")
+                        return False
+                    mode = "ab"
+                elif response.status_code == 416 and expected is None:
+                    # The partial file of an unknown size cannot be checked, start over
+                    logger.warning(f"Deleting unresumable partial file: {part_path}")
+                    os.remove(part_path)
+                    existing = 0
+                    continue
                 else:
                     logger.error(
                         f"Failed to download the dataset. Status code: {response.status_code}"
                     )
-                    break
+                    return False
+
+                with open(part_path, mode) as file:
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        if chunk:  # filter out keep-alive new chunks
+                            file.write(chunk)
+                            received += len(chunk)
+                            count("bytes_downloaded", len(chunk))
+                            if progress_bar is not None:
+                                progress_bar.update(len(chunk))
+            existing += received
+            if expected is None:
+                return True
+            if existing != expected:
+                raise IOError(f"Connection closed after {existing} of {expected} bytes")
         except Exception as e:
+            existing = os.path.getsize(part_path) if os.path.exists(part_path) else 0
             logger.error(
-                f"Error occurred while downloading the dataset: {e}. Retrying..."
+                f"Error occurred while downloading the dataset: {e}. "
+                f"Resuming from byte {start + existing}..."
             )
-            # Delete the incomplete file if an exception occurs
-            if os.path.exists(anndata_file_path):
-                logger.warning(f"Deleting incomplete file: {anndata_file_path}")
-                os.remove(anndata_file_path)
 
-        retries += 1
-        if retries < MAX_RETRIES:
+        retries = 0 if received else retries + 1
+        if retries < MAX_RETRIES and (expected is None or existing != expected):
             logger.info(f"Retrying download... Attempt {retries + 1} of {MAX_RETRIES}")
-            time.sleep(RETRY_DELAY)
-        else:
-            logger.error("Max retries reached. Download failed.")
-            return None
+            time.sleep(RETRY_DELAY * 2 ** (retries - 1) if retries else 0)
+    return expected is not None and existing == expected
+
+
+def get_remote_file_size(
+    url: str, session: Optional[requests.Session] = None
+) -> Optional[int]:
+    """
+    Get the size of a remote file from the Content-Length header of a HEAD request.
+
+    Args:
+        url: The URL of the file.
+        session: The session used to send the request.
+
+    Returns:
+        The size of the file in bytes, or None if it could not be determined.
+    """
+    http = session if session is not None else requests
+    try:
+        response = http.head(url, allow_redirects=True)
+        response.raise_for_status()
+        content_length = response.headers.get("content-length")
+        return int(content_length) if content_length is not None else None
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logger.warning(f"Could not get the size of '{url}': {e}")
+        return None
 
 
 def check_file_exists_based_on_prefix(directory, prefix):
-    # Construct a search pattern for files that start with the prefix
-    pattern = os.path.join(directory, f"{prefix}__*.owl")
-    return glob.glob(pattern)  # Returns a list of matching files
+    # Look up the graphs of the prefix in a single scan of the directory
+    return index_graph_directory(directory).get(prefix, [])
 
 
 def get_dataset_id_from_h5ad_link(dataset_url):
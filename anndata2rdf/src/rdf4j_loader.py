@@ -0,0 +1,349 @@
+import gzip
+import logging
+import os
+import re
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logging.basicConfig(level=logging.WARNING)
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Load the generated graphs straight into the triplestore after they are converted
+LOAD_TRIPLESTORE = os.getenv("ANNDATA2RDF_LOAD_TRIPLESTORE", "false").lower() == "true"
+RDF4J_REPOSITORY_URL = os.getenv(
+    "RDF4J_REPOSITORY_URL", "http://triplestore:8080/rdf4j-server/repositories/obask"
+)
+# Statements sent per request, and datasets loaded at the same time
+LOAD_CHUNK_STATEMENTS = int(os.getenv("ANNDATA2RDF_LOAD_CHUNK_STATEMENTS", "50000"))
+LOAD_CONNECTIONS = int(os.getenv("ANNDATA2RDF_LOAD_CONNECTIONS", "4"))
+# Chunks are compressed for the transfer only, so speed matters more than size
+LOAD_COMPRESS_LEVEL = 1
+REQUEST_TIMEOUT = 600  # seconds
+
+# A blank node term, such as '_:N1f3', which starts a line or follows a space. A
+# literal that holds ' _:' only makes its statement join a group it need not join.
+BLANK_NODE_PATTERN = re.compile(rb"(?:^|(?<=\s))_:(\S+)")
+
+CONTENT_TYPES = {
+    ".owl": "application/rdf+xml",
+    ".nt.gz": "application/n-triples",
+    ".nq.gz": "application/n-quads",
+}
+
+
+class TriplestoreError(Exception):
+    """Raised when the triplestore rejects a transaction request."""
+
+    def __init__(self, action: str, response: requests.Response):
+        self.status_code = response.status_code
+        super().__init__(
+            f"{action} failed with status {response.status_code}: {response.text[:500]}"
+        )
+
+
+def get_content_type(graph_path: str) -> str:
+    for extension, content_type in CONTENT_TYPES.items():
+        if graph_path.endswith(extension):
+            return content_type
+    raise ValueError(f"Unsupported graph file: {graph_path}")
+
+
+def get_blank_nodes(line: bytes) -> List[bytes]:
+    """Return the blank node labels of an N-Triples or N-Quads statement."""
+    return [label.rstrip(b".") for label in BLANK_NODE_PATTERN.findall(line)]
+
+
+def iter_statement_groups(lines: Iterable[bytes]) -> Iterator[List[bytes]]:
+    """
+    Group the statements that share blank nodes as they are read.
+
+    `rdf_writer.StreamingRDFWriter` writes the statements linked by blank nodes one
+    after the other, each sharing a blank node with an earlier one. A group is
+    therefore complete at the first statement that shares no blank node with it, and
+    only the open group is held in memory.
+
+    Args:
+        lines: N-Triples or N-Quads statements.
+
+    Yields:
+        Each statement without blank nodes on its own, and each group of statements
+        linked by blank nodes, such as an OWL axiom or a restriction, as a whole.
+    """
+    group: List[bytes] = []
+    group_labels: Set[bytes] = set()
+    for line in lines:
+        labels = get_blank_nodes(line) if b"_:" in line else []
+        if group and group_labels.isdisjoint(labels):
+            yield group
+            group, group_labels = [], set()
+        if labels:
+            group.append(line)
+            group_labels.update(labels)
+        else:
+            yield [line]
+    if group:
+        yield group
+
+
+def iter_chunks(
+    graph_path: str, chunk_statements: int = LOAD_CHUNK_STATEMENTS
+) -> Iterator[Tuple[bytes, Optional[int]]]:
+    """
+    Read a generated graph in chunks that can be loaded one after the other.
+
+    N-Triples and N-Quads files are streamed in chunks of up to `chunk_statements`
+    lines. RDF4J parses each request on its own, so a blank node label names a
+    different node in every chunk. A group of statements linked by blank nodes is
+    therefore never split, and a group larger than `chunk_statements` is sent as a
+    chunk of its own. RDF/XML cannot be split, so an '.owl' file is a single chunk.
+
+    Args:
+        graph_path: The path of an '.owl', '.nt.gz' or '.nq.gz' graph.
+        chunk_statements: The maximum number of statements of a chunk.
+
+    Yields:
+        The data of each chunk and its number of statements, None for RDF/XML.
+    """
+    if not graph_path.endswith((".nt.gz", ".nq.gz")):
+        with open(graph_path, "rb") as graph_file:
+            yield graph_file.read(), None
+        return
+    lines: List[bytes] = []
+    with gzip.open(graph_path, "rb") as graph_file:
+        statements = (
+            line for line in graph_file if line.strip() and not line.startswith(b"#")
+        )
+        for group in iter_statement_groups(statements):
+            if lines and len(lines) + len(group) > chunk_statements:
+                yield b"".join(lines), len(lines)
+                lines = []
+            lines.extend(group)
+    if lines:
+        yield b"".join(lines), len(lines)
+
+
+class RDF4JTransaction:
+    """
+    An RDF4J REST API transaction, committed when the block ends without an error.
+
+    If the block raises, the transaction is rolled back, so a dataset is either loaded
+    completely or not at all.
+    """
+
+    def __init__(
+        self,
+        session: requests.Session,
+        repository_url: str = RDF4J_REPOSITORY_URL,
+        timeout: float = REQUEST_TIMEOUT,
+    ):
+        self.session = session
+        self.repository_url = repository_url.rstrip("/")
+        self.timeout = timeout
+        self.url = None
+
+    def __enter__(self) -> "RDF4JTransaction":
+        response = self.session.post(
+            f"{self.repository_url}/transactions", timeout=self.timeout
+        )
+        if response.status_code != 201:
+            raise TriplestoreError("Starting a transaction", response)
+        self.url = response.headers["Location"]
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self._send("COMMIT", "Committing the transaction")
+            return False
+        try:
+            response = self.session.delete(self.url, timeout=self.timeout)
+            if response.status_code != 204:
+                logger.error(f"Rolling back {self.url} failed: {response.status_code}")
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Rolling back {self.url} failed: {e}")
+        return False
+
+    def add(
+        self,
+        data: bytes,
+        content_type: str,
+        compress: bool = True,
+        context: Optional[str] = None,
+    ):
+        """
+        Add RDF data to the transaction.
+
+        Args:
+            data: The serialised statements.
+            content_type: The MIME type of the data, such as 'application/n-triples'.
+            compress: Whether to send the data with gzip Content-Encoding.
+            context: The named graph of the triples. N-Quads carry their own graph.
+        """
+        headers = {"Content-Type": f"{content_type}; charset=utf-8"}
+        if compress:
+            data = gzip.compress(data, compresslevel=LOAD_COMPRESS_LEVEL)
+            headers["Content-Encoding"] = "gzip"
+        params = {"context": f"<{context}>"} if context else {}
+        self._send("ADD", "Adding statements", params, data=data, headers=headers)
+
+    def clear_graphs(self, graph_names: Iterable[str]):
+        """Remove all statements of the named graphs, which may not exist."""
+        update = " ;\n".join(f"CLEAR SILENT GRAPH <{name}>" for name in graph_names)
+        if update:
+            self._send("UPDATE", "Clearing graphs", {"update": update})
+
+    def _send(
+        self, action: str, description: str, params: Optional[Dict] = None, **kwargs
+    ):
+        response = self.session.put(
+            self.url,
+            params={"action": action, **(params or {})},
+            timeout=self.timeout,
+            **kwargs,
+        )
+        if response.status_code not in (200, 204):
+            raise TriplestoreError(description, response)
+
+
+class TriplestoreLoader:
+    """
+    Loads generated graphs into an RDF4J repository over a pool of connections.
+
+    Each graph is loaded in its own transaction, one chunk after the other, while
+    several graphs are loaded at the same time. A dataset version is loaded into its
+    own named graph, and the same transaction clears the graphs of the versions it
+    replaces, so updating a dataset never touches the rest of the repository.
+    """
+
+    def __init__(
+        self,
+        repository_url: str = RDF4J_REPOSITORY_URL,
+        connections: int = LOAD_CONNECTIONS,
+        chunk_statements: int = LOAD_CHUNK_STATEMENTS,
+        compress: bool = True,
+    ):
+        """
+        Args:
+            repository_url: The URL of the RDF4J repository.
+            connections: The number of graphs loaded at the same time.
+            chunk_statements: The number of statements sent per request.
+            compress: Whether to gzip the chunks. It is turned off if the server
+                does not accept compressed requests.
+        """
+        self.repository_url = repository_url
+        self.chunk_statements = chunk_statements
+        self.compress = compress
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(connections, 1))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.executor = ThreadPoolExecutor(
+            max_workers=max(connections, 1), thread_name_prefix="anndata2rdf-load"
+        )
+
+    def __enter__(self) -> "TriplestoreLoader":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.session.close()
+
+    def submit(
+        self,
+        matrix_id: str,
+        graph_path: str,
+        graph_name: Optional[str] = None,
+        replaced_graphs: Iterable[str] = (),
+    ) -> Future:
+        """Load a graph in the background and return the future of `load_graph`."""
+        return self.executor.submit(
+            self.load_graph, matrix_id, graph_path, graph_name, replaced_graphs
+        )
+
+    def load_graph(
+        self,
+        matrix_id: str,
+        graph_path: str,
+        graph_name: Optional[str] = None,
+        replaced_graphs: Iterable[str] = (),
+    ) -> Dict:
+        """
+        Load a generated graph in a single transaction.
+
+        The named graph is cleared first, so loading the same dataset version again
+        does not duplicate its blank nodes.
+
+        Args:
+            matrix_id: The CxG dataset identifier of the graph.
+            graph_path: The path of an '.owl', '.nt.gz' or '.nq.gz' graph.
+            graph_name: The named graph of the dataset version, usually
+                `rdf_writer.dataset_graph_name`. Defaults to the default graph.
+            replaced_graphs: The named graphs of the previous versions of the
+                dataset, cleared in the same transaction.
+
+        Returns:
+            A dictionary with the 'matrix_id', 'status', failure 'reason', number of
+            'statements' and 'seconds' of the load.
+        """
+        start = time.perf_counter()
+        statements = 0
+        try:
+            content_type = get_content_type(graph_path)
+            # N-Quads name their graph in every statement
+            context = graph_name if not graph_path.endswith(".nq.gz") else None
+            cleared_graphs = list(dict.fromkeys([*replaced_graphs, graph_name]))
+            with RDF4JTransaction(self.session, self.repository_url) as transaction:
+                transaction.clear_graphs(name for name in cleared_graphs if name)
+                for data, chunk_statements in iter_chunks(
+                    graph_path, self.chunk_statements
+                ):
+                    self._add(transaction, data, content_type, context)
+                    statements += chunk_statements or 0
+            status, reason = "succeeded", None
+        except (requests.exceptions.RequestException, TriplestoreError, OSError) as e:
+            status, reason = "failed", f"{type(e).__name__}: {e}"
+        seconds = time.perf_counter() - start
+        log = logger.info if status == "succeeded" else logger.error
+        log(
+            f"Loading '{matrix_id}' into the triplestore {status} in {seconds:.1f}s "
+            f"({statements} statements)."
+        )
+        return {
+            "matrix_id": matrix_id,
+            "status": status,
+            "reason": reason,
+            "statements": statements,
+            "seconds": round(seconds, 3),
+        }
+
+    def _add(
+        self,
+        transaction: RDF4JTransaction,
+        data: bytes,
+        content_type: str,
+        context: Optional[str] = None,
+    ):
+        if not self.compress:
+            transaction.add(data, content_type, compress=False, context=context)
+            return
+        try:
+            transaction.add(data, content_type, compress=True, context=context)
+        except TriplestoreError as e:
+            # A server that does not decode the request fails to parse or accept it
+            if e.status_code not in (400, 415):
+                raise
+            transaction.add(data, content_type, compress=False, context=context)
+            logger.warning(
+                "The triplestore does not accept compressed requests. "
+                "Sending uncompressed chunks."
+            )
+            self.compress = False
@@ -0,0 +1,166 @@
+import gzip
+import logging
+import os
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Optional, Tuple
+
+# rdflib is imported where it is used, as planning a run imports this module too
+if TYPE_CHECKING:
+    from rdflib import Graph, URIRef
+
+logging.basicConfig(level=logging.WARNING)
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# "owl" serialises an in-memory graph to RDF/XML, "nt" and "nq" stream the triples to
+# gzip-compressed N-Triples or N-Quads
+OUTPUT_FORMAT = os.getenv("ANNDATA2RDF_OUTPUT_FORMAT", "owl")
+OUTPUT_EXTENSIONS = {"owl": ".owl", "nt": ".nt.gz", "nq": ".nq.gz"}
+STREAMING_FORMATS = ("nt", "nq")
+# gzip level 6 compresses N-Triples about as well as 9 at a fraction of the CPU time
+COMPRESS_LEVEL = 6
+DATASET_GRAPH_NAMESPACE = "urn:cl_kg:dataset:"
+
+
+def get_output_extension(output_format: str = OUTPUT_FORMAT) -> str:
+    """Return the file extension of an output format, such as '.nt.gz' for 'nt'."""
+    if output_format not in OUTPUT_EXTENSIONS:
+        raise ValueError(
+            f"Unsupported RDF output format '{output_format}'. "
+            f"Valid formats are: {', '.join(OUTPUT_EXTENSIONS)}"
+        )
+    return OUTPUT_EXTENSIONS[output_format]
+
+
+def dataset_graph_iri(matrix_id: str, download_id: str) -> str:
+    """Return the IRI of the named graph of a dataset version."""
+    return f"{DATASET_GRAPH_NAMESPACE}{matrix_id}:{download_id}"
+
+
+def dataset_graph_name(matrix_id: str, download_id: str) -> "URIRef":
+    """Return the named graph of a dataset version."""
+    from rdflib import URIRef
+
+    return URIRef(dataset_graph_iri(matrix_id, download_id))
+
+
+def iter_blank_node_groups(triples: Iterable[Tuple]) -> Iterator[List[Tuple]]:
+    """
+    Group triples that share blank nodes, directly or through other triples.
+
+    Each group is ordered so that every triple shares a blank node with an earlier
+    one, which lets a reader find the end of a group without looking further ahead.
+
+    Args:
+        triples: Triples that each hold a blank node.
+
+    Yields:
+        The groups of triples, in the order of their first triple.
+    """
+    from rdflib import BNode
+
+    triples = list(triples)
+    triples_by_node = {}
+    for triple in triples:
+        for term in triple:
+            if isinstance(term, BNode):
+                triples_by_node.setdefault(term, []).append(triple)
+    grouped = set()
+    for first in triples:
+        if first in grouped:
+            continue
+        grouped.add(first)
+        group = []
+        pending = [first]
+        while pending:
+            triple = pending.pop()
+            group.append(triple)
+            for term in triple:
+                for linked in triples_by_node.pop(term, ()):
+                    if linked not in grouped:
+                        grouped.add(linked)
+                        pending.append(linked)
+        yield group
+
+
+class StreamingRDFWriter:
+    """
+    Writes triples to a gzip-compressed N-Triples or N-Quads file as they are added.
+
+    The triples are written to a temporary file that replaces the output file only when
+    the writer is closed without an error, so an interrupted conversion never leaves a
+    truncated graph behind. Duplicate triples are not filtered.
+
+    The triples linked by blank nodes are written one after the other, so that
+    `rdf4j_loader.iter_chunks` can load the file in chunks without splitting a blank
+    node. `add_graph` groups them itself, and callers of `add` add them in groups,
+    as `generate_rdf.add_metadata_nodes` does with each axiom.
+    """
+
+    def __init__(
+        self,
+        output_path: str,
+        output_format: str = "nt",
+        graph_name: Optional["URIRef"] = None,
+    ):
+        """
+        Args:
+            output_path: The path of the output file, including its extension.
+            output_format: Either 'nt' or 'nq'.
+            graph_name: The named graph of the quads. Required for 'nq'.
+        """
+        if output_format not in STREAMING_FORMATS:
+            raise ValueError(
+                f"Unsupported streaming format '{output_format}'. "
+                f"Valid formats are: {', '.join(STREAMING_FORMATS)}"
+            )
+        if output_format == "nq" and graph_name is None:
+            raise ValueError("A graph name is required to write N-Quads.")
+        self.output_path = output_path
+        self.output_format = output_format
+        self.graph_name = graph_name
+        self.triple_count = 0
+        if output_format == "nq":
+            from rdflib.plugins.serializers.nquads import _nq_row
+
+            self._row = lambda triple: _nq_row(triple, graph_name)
+        else:
+            from rdflib.plugins.serializers.nt import _nt_row
+
+            self._row = _nt_row
+        self._tmp_path = f"{output_path}.tmp"
+        self._file = None
+
+    def __enter__(self) -> "StreamingRDFWriter":
+        self._file = gzip.open(
+            self._tmp_path, "wt", encoding="utf-8", compresslevel=COMPRESS_LEVEL
+        )
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._file.close()
+        if exc_type is None:
+            os.replace(self._tmp_path, self.output_path)
+            logger.info(f"{self.triple_count} triples written to {self.output_path}")
+        elif os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+        return False
+
+    def add(self, triple: Tuple):
+        """Write a triple, the same call as `Graph.add`."""
+        self._file.write(self._row(triple))
+        self.triple_count += 1
+
+    def add_graph(self, graph: "Graph"):
+        """Write the triples of a graph, each group linked by blank nodes as a whole."""
+        from rdflib import BNode
+
+        blank_node_triples = []
+        for triple in graph:
+            if any(isinstance(term, BNode) for term in triple):
+                blank_node_triples.append(triple)
+            else:
+                self.add(triple)
+        for group in iter_blank_node_groups(blank_node_triples):
+            for triple in group:
+                self.add(triple)
@@ -0,0 +1,225 @@
+import cProfile
+import json
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+logging.basicConfig(level=logging.WARNING)
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+RUN_REPORT_DIRECTORY = os.path.join("config", "run_reports")
+# Dump a cProfile of each dataset next to the run reports
+PROFILE = os.getenv("ANNDATA2RDF_PROFILE", "false").lower() == "true"
+
+# The metrics of the dataset processed by the current thread or task
+_current_metrics: ContextVar[Optional["DatasetMetrics"]] = ContextVar(
+    "dataset_metrics", default=None
+)
+
+
+def get_report_directory() -> str:
+    return os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), RUN_REPORT_DIRECTORY
+    )
+
+
+def get_peak_rss_bytes() -> int:
+    """Return the peak resident set size of the current process."""
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak_rss if sys.platform == "darwin" else peak_rss * 1024
+
+
+class DatasetMetrics:
+    """Stage timings and counters of a single dataset."""
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+        self.wall_time = 0.0
+        self.peak_rss_bytes = 0
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add_stage_time(self, name: str, seconds: float):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def count(self, name: str, value: int):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def finish(self, record_peak_rss: bool = True):
+        """
+        Record the wall time since creation and the peak RSS of this process.
+
+        Args:
+            record_peak_rss: Disable it if the process is shared with other datasets.
+        """
+        self.wall_time += time.perf_counter() - self._started
+        if record_peak_rss:
+            self.peak_rss_bytes = max(self.peak_rss_bytes, get_peak_rss_bytes())
+
+    def merge(self, metrics: Dict):
+        """Add the output of `to_dict` of another part of the same dataset's run."""
+        for name, seconds in metrics.get("stages", {}).items():
+            self.add_stage_time(name, seconds)
+        for name, value in metrics.get("counters", {}).items():
+            self.count(name, value)
+        self.wall_time += metrics.get("wall_time_seconds", 0.0)
+        self.peak_rss_bytes = max(self.peak_rss_bytes, metrics.get("peak_rss_bytes", 0))
+
+    def to_dict(self) -> Dict:
+        return {
+            "wall_time_seconds": round(self.wall_time, 3),
+            "peak_rss_bytes": self.peak_rss_bytes,
+            "stages": {name: round(t, 3) for name, t in self.stages.items()},
+            "counters": dict(self.counters),
+        }
+
+
+@contextmanager
+def track_dataset(metrics: DatasetMetrics):
+    """Make `stage` and `count` record into `metrics` within the block."""
+    token = _current_metrics.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current_metrics.reset(token)
+
+
+@contextmanager
+def stage(name: str):
+    """Time a stage of the dataset that is being tracked, if any."""
+    metrics = _current_metrics.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if metrics is not None:
+            metrics.add_stage_time(name, time.perf_counter() - start)
+
+
+def count(name: str, value: int):
+    """Add to a counter of the dataset that is being tracked, if any."""
+    metrics = _current_metrics.get()
+    if metrics is not None:
+        metrics.count(name, value)
+
+
+@contextmanager
+def profile(name: str, enabled: bool = PROFILE):
+    """
+    Dump a cProfile of the block to '<report directory>/profiles/<name>.prof'.
+
+    Args:
+        name: The name of the profile, such as the matrix_id of the dataset.
+        enabled: Whether to profile. Defaults to the ANNDATA2RDF_PROFILE setting.
+    """
+    if not enabled:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profile_directory = os.path.join(get_report_directory(), "profiles")
+        os.makedirs(profile_directory, exist_ok=True)
+        profile_path = os.path.join(profile_directory, f"{name}.prof")
+        profiler.dump_stats(profile_path)
+        logger.info(f"Profile written to {profile_path}")
+
+
+class RunReport:
+    """Collects the stage timings of a run and the metrics of each dataset."""
+
+    def __init__(self, settings: Optional[Dict] = None):
+        """
+        Args:
+            settings: The configuration of the run, such as the mode and workers.
+        """
+        self.settings = settings or {}
+        self.started_at = time.strftime("%Y-%m-%dT%H:%M:%S%z")
+        self.stages: Dict[str, float] = {}
+        self.datasets: List[Dict] = []
+        self.skipped = 0
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a stage of the whole run, such as resolving the CxG datasets."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = round(time.perf_counter() - start, 3)
+
+    def add_dataset(self, result: Dict):
+        """Add the result of a job, with the metrics it carries, to the report."""
+        metrics = result.get("metrics") or {}
+        self.datasets.append(
+            {
+                "matrix_id": result["matrix_id"],
+                "status": result["status"],
+                "reason": result.get("reason"),
+                "wall_time_seconds": metrics.get("wall_time_seconds"),
+                "peak_rss_bytes": metrics.get("peak_rss_bytes"),
+                "stages": metrics.get("stages", {}),
+                **metrics.get("counters", {}),
+            }
+        )
+
+    def add_load(self, load_result: Dict):
+        """Add the triplestore load result of a dataset that is in the report."""
+        for dataset in self.datasets:
+            if dataset["matrix_id"] == load_result["matrix_id"]:
+                dataset["load"] = {
+                    key: value
+                    for key, value in load_result.items()
+                    if key != "matrix_id"
+                }
+
+    def to_dict(self) -> Dict:
+        return {
+            "started_at": self.started_at,
+            "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "wall_time_seconds": round(time.perf_counter() - self._started, 3),
+            "settings": self.settings,
+            "stages": self.stages,
+            "skipped": self.skipped,
+            "datasets": self.datasets,
+        }
+
+    def write(self, report_path: Optional[str] = None) -> str:
+        """
+        Atomically write the report as JSON.
+
+        Args:
+            report_path: The path of the report. Defaults to a time-stamped file in the
+                report directory.
+
+        Returns:
+            The path of the written report.
+        """
+        if report_path is None:
+            os.makedirs(get_report_directory(), exist_ok=True)
+            report_path = os.path.join(
+                get_report_directory(),
+                f"run_report_{time.strftime('%Y%m%dT%H%M%S')}.json",
+            )
+        tmp_path = f"{report_path}.tmp"
+        with open(tmp_path, "w") as report_file:
+            json.dump(self.to_dict(), report_file, indent=2)
+        os.replace(tmp_path, report_path)
+        logger.info(f"Run report written to {report_path}")
+        return report_path
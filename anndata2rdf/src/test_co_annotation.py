@@ -0,0 +1,113 @@
+import warnings
+
+import anndata
+import numpy as np
+import pandas as pd
+import pytest
+from pandasaurus_cxg.anndata_analyzer import AnndataAnalyzer
+
+from co_annotation import build_co_annotation_report, metadata_percentage_table
+
+
+def make_obs(n_obs: int, seed: int, missing: float = 0.0) -> pd.DataFrame:
+    """Nested author annotations with a few ambiguous and missing labels."""
+    rng = np.random.default_rng(seed)
+    fine = rng.integers(0, 40, n_obs)
+    broad = fine // 5
+    # Some fine clusters are split across broad clusters
+    broad = np.where((fine % 7 == 0) & (rng.random(n_obs) < 0.3), broad + 1, broad)
+    cell_type = np.where(broad < 4, broad // 2, broad)
+    obs = pd.DataFrame(
+        {
+            "fine": [f"fine {i}" for i in fine],
+            "fine_id": [f"C{i:03d}" for i in fine],
+            "broad": [f"broad {i}" for i in broad],
+            "free_text": [f"label {i % 11}" for i in rng.integers(0, 30, n_obs)],
+            "cell_type": [f"type {i}" for i in cell_type],
+        },
+        index=[str(i) for i in range(n_obs)],
+    )
+    if missing:
+        for column in ["fine", "fine_id", "broad"]:
+            obs.loc[rng.random(n_obs) < missing, column] = np.nan
+    return obs.astype("category")
+
+
+def reference_report(obs: pd.DataFrame, author_cell_type_list) -> pd.DataFrame:
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        analyzer = AnndataAnalyzer(
+            anndata.AnnData(obs=obs.copy()), list(author_cell_type_list)
+        )
+        return analyzer._generate_co_annotation_dataframe()
+
+
+@pytest.mark.parametrize(
+    "author_cell_type_list",
+    [
+        ["fine", "broad"],
+        ["broad", "fine", "fine_id", "free_text"],
+        ["fine", "missing_field"],
+    ],
+)
+@pytest.mark.parametrize("missing", [0.0, 0.01])
+def test_report_matches_anndata_analyzer(author_cell_type_list, missing):
+    obs = make_obs(5000, seed=len(author_cell_type_list), missing=missing)
+
+    expected = reference_report(obs, author_cell_type_list)
+    report = build_co_annotation_report(obs, author_cell_type_list + ["cell_type"])
+
+    pd.testing.assert_frame_equal(report, expected)
+
+
+def test_report_of_string_columns_matches_anndata_analyzer():
+    obs = make_obs(2000, seed=7).astype(object)
+
+    expected = reference_report(obs, ["fine", "broad"])
+    report = build_co_annotation_report(obs, ["fine", "broad", "cell_type"])
+
+    pd.testing.assert_frame_equal(report, expected)
+
+
+def test_large_contingency_tables_match(monkeypatch):
+    monkeypatch.setattr("co_annotation.CONTINGENCY_TABLE_MAX_SIZE", 0)
+    obs = make_obs(3000, seed=3, missing=0.01)
+
+    expected = reference_report(obs, ["fine", "broad"])
+    report = build_co_annotation_report(obs, ["fine", "broad", "cell_type"])
+
+    pd.testing.assert_frame_equal(report, expected)
+
+
+def test_metadata_percentages_match_value_counts():
+    obs = make_obs(5000, seed=5, missing=0.01)
+    obs["tissue"] = obs["free_text"].cat.add_categories("unused")
+    obs.loc[obs.index[::50], "tissue"] = np.nan
+
+    table = metadata_percentage_table(obs, ["fine", "broad"], ["tissue"])
+
+    expected = {
+        (author_field, cluster, label): percentage
+        for author_field in ["fine", "broad"]
+        for cluster in obs[author_field].dropna().unique()
+        for label, percentage in (
+            obs[obs[author_field] == cluster]["tissue"].value_counts(normalize=True)
+            * 100
+        )
+        .loc[lambda x: x != 0.0]
+        .items()
+    }
+    assert {
+        (row.author_field, row.author_value, row.metadata_value): row.percentage
+        for row in table.itertuples()
+    } == expected
+
+
+def test_metadata_percentages_skip_missing_author_fields():
+    obs = make_obs(500, seed=6)
+    obs["tissue"] = obs["free_text"]
+
+    table = metadata_percentage_table(obs, ["fine", "missing"], ["tissue"])
+
+    assert table.equals(metadata_percentage_table(obs, ["fine"], ["tissue"]))
+    assert metadata_percentage_table(obs, ["missing"], ["tissue"]).empty
@@ -0,0 +1,76 @@
+import time
+
+import pytest
+
+from csv_parser import fetch_cxg_dataset_versions, fetch_latest_cxg_dataset_links
+
+VERSIONS = [{"dataset_version_id": "v2"}]
+
+
+class StubSession:
+    """Answers every request with the VERSIONS response."""
+
+    def __init__(self):
+        self.requests = []
+
+    def get(self, url):
+        self.requests.append(url)
+        return self
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return VERSIONS
+
+
+@pytest.mark.parametrize(
+    "entry",
+    [
+        {"versions": [{"dataset_version_id": "v1"}]},
+        {"fetched_at": time.time()},
+        {"fetched_at": "yesterday", "versions": [{"dataset_version_id": "v1"}]},
+        [{"dataset_version_id": "v1"}],
+    ],
+)
+def test_malformed_cache_entry_is_refetched(entry):
+    cache = {"m1": entry}
+    session = StubSession()
+
+    versions = fetch_cxg_dataset_versions("m1", session=session, cache=cache)
+
+    assert versions == VERSIONS
+    assert len(session.requests) == 1
+    assert cache["m1"]["versions"] == VERSIONS
+
+
+def test_fresh_cache_entry_is_used():
+    cache = {"m1": {"fetched_at": time.time(), "versions": VERSIONS}}
+    session = StubSession()
+
+    assert fetch_cxg_dataset_versions("m1", session=session, cache=cache) == VERSIONS
+    assert session.requests == []
+
+
+def test_malformed_cache_entry_is_a_miss_offline():
+    cache = {"m1": {"versions": VERSIONS}}
+    assert fetch_cxg_dataset_versions("m1", cache=cache, offline=True) == VERSIONS
+    cache = {"m1": {"fetched_at": time.time()}}
+    assert fetch_cxg_dataset_versions("m1", cache=cache, offline=True) is None
+
+
+def test_failing_link_does_not_abort_the_other_links():
+    link = "https://cellxgene.cziscience.com/e/m1.cxg/"
+    url = "https://datasets.cellxgene.cziscience.com/m1.h5ad"
+    cache = {
+        "m1": {
+            "fetched_at": time.time(),
+            "versions": [{"assets": [{"filetype": "H5AD", "url": url}]}],
+        }
+    }
+
+    download_urls = fetch_latest_cxg_dataset_links(
+        ["malformed-link", link], cache=cache, offline=True
+    )
+
+    assert download_urls == {"malformed-link": None, link: url}
@@ -0,0 +1,66 @@
+import threading
+
+import download_scheduler
+from download_scheduler import (
+    DiskBudget,
+    add_download_sizes,
+    order_by_size,
+    project_peak_disk_bytes,
+)
+
+
+def test_download_waits_until_the_budget_is_released():
+    budget = DiskBudget(100)
+    assert budget.acquire(60)
+    assert not budget.acquire(50, timeout=0.05)
+
+    admitted = threading.Event()
+
+    def _download():
+        budget.acquire(50)
+        admitted.set()
+
+    thread = threading.Thread(target=_download)
+    thread.start()
+    assert not admitted.wait(0.1)
+    budget.release(60)
+    assert admitted.wait(1)
+    thread.join()
+    assert budget.reserved == 50
+
+
+def test_file_larger_than_the_budget_is_admitted_alone():
+    budget = DiskBudget(100)
+    assert budget.try_acquire(10)
+    assert not budget.try_acquire(500)
+    budget.release(10)
+    assert budget.try_acquire(500)
+    assert not budget.try_acquire(1)
+
+
+def test_projected_peak_follows_slots_and_budget():
+    sizes = [50, 40, 30, 20, 10]
+    assert project_peak_disk_bytes(sizes, budget=1000, slots=2) == 90
+    assert project_peak_disk_bytes(sizes, budget=1000, slots=3) == 120
+    assert project_peak_disk_bytes(sizes, budget=80, slots=3) == 70
+    assert project_peak_disk_bytes([200, 10], budget=80, slots=3) == 200
+
+
+def test_unknown_sizes_count_as_the_largest_file(monkeypatch, tmp_path):
+    sizes = {"a": 30, "b": None, "c": 70}
+    monkeypatch.setattr(
+        download_scheduler,
+        "get_remote_file_size",
+        lambda url, session=None: sizes[url],
+    )
+    downloaded = tmp_path / "d.h5ad"
+    downloaded.write_bytes(b"x" * 5)
+    jobs = [
+        {"matrix_id": url, "download_url": url, "h5ad_path": str(tmp_path / url)}
+        for url in sizes
+    ] + [{"matrix_id": "d", "download_url": "d", "h5ad_path": str(downloaded)}]
+
+    add_download_sizes(jobs)
+
+    assert [job["download_size"] for job in jobs] == [30, 70, 70, 5]
+    assert [job["matrix_id"] for job in order_by_size(jobs)] == ["b", "c", "a", "d"]
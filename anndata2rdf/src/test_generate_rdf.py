@@ -0,0 +1,52 @@
+from types import SimpleNamespace
+
+import pandas as pd
+from pandasaurus_cxg.graph_generator.graph_predicates import CLUSTER
+from rdflib import OWL, RDF, RDFS, Graph, Literal, Namespace, URIRef
+
+from generate_rdf import add_metadata_nodes
+
+NS = Namespace("http://example.org/")
+PATO_0000383 = URIRef("http://purl.obolibrary.org/obo/PATO_0000383")
+
+
+def make_graph_generator(obs: pd.DataFrame) -> SimpleNamespace:
+    """A stand-in for a GraphGenerator with one cluster per author label."""
+    graph = Graph()
+    for index, label in enumerate(obs["author"].unique()):
+        cluster = NS[f"cluster{index}"]
+        graph.add((cluster, RDF.type, URIRef(CLUSTER.get("iri"))))
+        graph.add((cluster, NS["author"], Literal(label)))
+    return SimpleNamespace(
+        ns=NS,
+        graph=graph,
+        ea=SimpleNamespace(
+            enricher_manager=SimpleNamespace(anndata=SimpleNamespace(obs=obs)),
+            analyzer_manager=SimpleNamespace(
+                all_cell_type_identifiers=["author", "cell_type"]
+            ),
+        ),
+    )
+
+
+def test_streamed_metadata_term_is_typed_once():
+    # Two labels of the same term, each occurring in both clusters
+    obs = pd.DataFrame(
+        {
+            "author": ["a", "a", "b", "b"],
+            "cell_type": ["T cell"] * 4,
+            "sex": ["female", "Female", "female", "Female"],
+            "sex_ontology_term_id": ["PATO:0000383"] * 4,
+        }
+    ).astype("category")
+    triples = []
+
+    add_metadata_nodes(make_graph_generator(obs), ["sex"], triples.append)
+
+    assert triples.count((PATO_0000383, RDF.type, OWL.Class)) == 1
+    assert triples.count((PATO_0000383, RDFS.label, Literal("female"))) == 1
+    assert triples.count((PATO_0000383, RDFS.label, Literal("Female"))) == 1
+    # Each cluster is still linked to the term through an axiom per label
+    axioms = [s for s, p, o in triples if p == RDF.type and o == OWL.Axiom]
+    assert len(axioms) == 4
+    assert len(triples) == len(set(triples))
@@ -0,0 +1,24 @@
+import anndata
+import pandas as pd
+
+from obs_loader import read_obs_columns
+
+
+def test_obs_columns_match_read_h5ad(tmp_path):
+    h5ad_path = str(tmp_path / "d.h5ad")
+    obs = pd.DataFrame(
+        {
+            "cell_type": pd.Categorical(["T cell", "B cell", "T cell", None]),
+            "n_genes": [10, 20, 30, 40],
+            "donor_age": pd.array([30, None, 52, 41], dtype="Int64"),
+            "is_primary_data": pd.array([True, None, False, True], dtype="boolean"),
+        },
+        index=[f"cell{i}" for i in range(4)],
+    )
+    anndata.AnnData(obs=obs).write_h5ad(h5ad_path)
+
+    columns = ["cell_type", "n_genes", "donor_age", "is_primary_data"]
+    read = read_obs_columns(h5ad_path, columns + ["missing"])
+
+    expected = anndata.read_h5ad(h5ad_path).obs[columns].reset_index(drop=True)
+    pd.testing.assert_frame_equal(read.reset_index(drop=True), expected)
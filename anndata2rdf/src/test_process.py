@@ -0,0 +1,79 @@
+import os
+import threading
+
+import process
+from download_scheduler import DiskBudget
+
+
+def _exit_without_result(*args):
+    os._exit(137)
+
+
+def _succeed(*args):
+    pass
+
+
+def make_jobs(tmp_path, count: int):
+    jobs = []
+    for index in range(count):
+        h5ad_path = tmp_path / f"d{index}.h5ad"
+        h5ad_path.write_bytes(b"h5ad")
+        jobs.append(
+            {"matrix_id": f"d{index}", "h5ad_path": str(h5ad_path), "download_size": 4}
+        )
+    return jobs
+
+
+def test_killed_worker_fails_its_dataset_in_the_pool(monkeypatch, tmp_path):
+    monkeypatch.setattr(process, "convert_dataset", _exit_without_result)
+    results = process.run_worker_pool(make_jobs(tmp_path, 1), memory_budget=1)
+    assert results[0]["status"] == "failed"
+    assert "exited with code 137" in results[0]["reason"]
+
+
+def test_pool_releases_only_the_disk_it_reserved(monkeypatch, tmp_path):
+    monkeypatch.setattr(process, "convert_dataset", _succeed)
+    budget = DiskBudget(10)
+    # Held outside the pool, so the jobs run one at a time without a reservation
+    assert budget.try_acquire(8)
+    results = process.run_worker_pool(
+        make_jobs(tmp_path, 2), workers=2, memory_budget=1, disk_budget=budget
+    )
+    assert [result["status"] for result in results] == ["succeeded", "succeeded"]
+    assert budget.reserved == 8
+
+
+def test_killed_worker_fails_its_dataset_in_the_pipeline(monkeypatch, tmp_path):
+    monkeypatch.setattr(process, "convert_downloaded_dataset", _exit_without_result)
+    jobs = make_jobs(tmp_path, 2)
+    results = process.run_pipeline(jobs, prefetch=1)
+    assert [result["status"] for result in results] == ["failed", "failed"]
+    assert "exited with code 137" in results[0]["reason"]
+    # The parent deletes the files the killed workers left behind
+    assert not any(os.path.exists(job["h5ad_path"]) for job in jobs)
+
+
+def test_pipeline_error_stops_the_producer(monkeypatch, tmp_path):
+    monkeypatch.setattr(process, "convert_downloaded_dataset", _succeed)
+    monkeypatch.setattr(process, "STOP_POLL_SECONDS", 0.05)
+
+    def _on_result(job, result):
+        raise ValueError("on_result failed")
+
+    errors = []
+
+    def _run():
+        try:
+            process.run_pipeline(
+                make_jobs(tmp_path, 5), prefetch=1, on_result=_on_result
+            )
+        except ValueError as e:
+            errors.append(e)
+
+    # The producer waits for a slot that the failed conversion loop never releases
+    thread = threading.Thread(target=_run, daemon=True)
+    thread.start()
+    thread.join(60)
+    assert not thread.is_alive()
+    assert len(errors) == 1
+    assert not [t for t in threading.enumerate() if t.name == "anndata2rdf-download"]
@@ -0,0 +1,136 @@
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import pull_anndata
+from pull_anndata import download_file
+
+CONTENT = os.urandom(3 * 1024 * 1024 + 123)
+
+
+class FlakyRangeHandler(BaseHTTPRequestHandler):
+    """Serves CONTENT with Range support and drops the connection of early GETs."""
+
+    # Number of GET requests that are disconnected after `disconnect_after` bytes
+    disconnects = 0
+    disconnect_after = 256 * 1024
+    supports_ranges = True
+    requests = []
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(CONTENT)))
+        if self.supports_ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+
+    def do_GET(self):
+        range_header = self.headers.get("Range")
+        with self.lock:
+            type(self).requests.append(range_header)
+            disconnect = type(self).disconnects > 0
+            type(self).disconnects -= 1
+        start, end = 0, len(CONTENT) - 1
+        match = re.match(r"bytes=(\d+)-(\d*)", range_header or "")
+        if match and self.supports_ranges:
+            start = int(match.group(1))
+            end = int(match.group(2)) if match.group(2) else end
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(CONTENT)}")
+        else:
+            self.send_response(200)
+        body = CONTENT[start : end + 1]
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if disconnect:
+            self.wfile.write(body[: self.disconnect_after])
+            self.wfile.flush()
+            self.close_connection = True
+            self.connection.shutdown(2)
+            return
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(pull_anndata, "RETRY_DELAY", 0)
+    monkeypatch.setattr(pull_anndata, "CHUNK_SIZE", 64 * 1024)
+    FlakyRangeHandler.disconnects = 0
+    FlakyRangeHandler.supports_ranges = True
+    FlakyRangeHandler.requests = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), FlakyRangeHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/dataset.h5ad"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def read(path):
+    with open(path, "rb") as file:
+        return file.read()
+
+
+def test_download_resumes_after_disconnects(server, tmp_path):
+    FlakyRangeHandler.disconnects = 3
+    target = str(tmp_path / "dataset.h5ad")
+
+    assert download_file(server, target)
+
+    assert read(target) == CONTENT
+    assert not os.path.exists(target + ".part")
+    # Every retry continues from the bytes received so far
+    assert [r.split("-")[0] for r in FlakyRangeHandler.requests[1:]] == [
+        f"bytes={n * FlakyRangeHandler.disconnect_after}" for n in range(1, 4)
+    ]
+
+
+def test_download_continues_partial_file_of_previous_run(server, tmp_path):
+    target = str(tmp_path / "dataset.h5ad")
+    with open(target + ".part", "wb") as part:
+        part.write(CONTENT[:1000])
+
+    assert download_file(server, target)
+
+    assert read(target) == CONTENT
+    assert FlakyRangeHandler.requests == [f"bytes=1000-{len(CONTENT) - 1}"]
+
+
+def test_download_restarts_when_server_ignores_ranges(server, tmp_path):
+    FlakyRangeHandler.supports_ranges = False
+    FlakyRangeHandler.disconnects = 1
+    target = str(tmp_path / "dataset.h5ad")
+
+    assert download_file(server, target)
+
+    assert read(target) == CONTENT
+
+
+def test_segmented_download_with_disconnects(server, tmp_path):
+    FlakyRangeHandler.disconnects = 2
+    target = str(tmp_path / "dataset.h5ad")
+
+    assert download_file(server, target, segments=4)
+
+    assert read(target) == CONTENT
+    assert sorted(os.listdir(tmp_path)) == ["dataset.h5ad"]
+
+
+def test_download_fails_after_max_retries_without_progress(server, tmp_path):
+    FlakyRangeHandler.disconnects = 100
+    FlakyRangeHandler.disconnect_after = 0
+    target = str(tmp_path / "dataset.h5ad")
+    try:
+        assert not download_file(server, target)
+    finally:
+        FlakyRangeHandler.disconnect_after = 256 * 1024
+
+    assert not os.path.exists(target)
+    assert len(FlakyRangeHandler.requests) == pull_anndata.MAX_RETRIES
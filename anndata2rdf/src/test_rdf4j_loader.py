@@ -0,0 +1,308 @@
+import gzip
+import itertools
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from rdflib import Graph
+from rdflib.compare import isomorphic
+
+from rdf4j_loader import TriplestoreLoader, iter_chunks
+from rdf_writer import StreamingRDFWriter
+
+REPOSITORY_PATH = "/rdf4j-server/repositories/obask"
+
+
+class RDF4JStandIn(BaseHTTPRequestHandler):
+    """Implements the transaction requests of the RDF4J REST API in memory."""
+
+    accepts_gzip = True
+    # Fail the ADD requests with these numbers (1-based, across all transactions)
+    failing_adds = set()
+    lock = threading.Lock()
+    add_counter = itertools.count(1)
+    transaction_ids = itertools.count(1)
+    transactions = {}
+    committed = []
+    rolled_back = []
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        if self.path != f"{REPOSITORY_PATH}/transactions":
+            return self._reply(404)
+        with self.lock:
+            transaction_id = str(next(self.transaction_ids))
+            self.transactions[transaction_id] = []
+        host, port = self.server.server_address
+        location = (
+            f"http://{host}:{port}{REPOSITORY_PATH}/transactions/{transaction_id}"
+        )
+        self._reply(201, {"Location": location})
+
+    def do_PUT(self):
+        url = urlparse(self.path)
+        transaction_id = url.path.rsplit("/", 1)[-1]
+        params = {name: values[0] for name, values in parse_qs(url.query).items()}
+        action = params["action"]
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with self.lock:
+            self.requests.append((action, dict(self.headers), params))
+            if transaction_id not in self.transactions:
+                return self._reply(404)
+            if action == "UPDATE":
+                self.transactions[transaction_id].append(("update", params["update"]))
+            elif action == "ADD":
+                if next(self.add_counter) in self.failing_adds:
+                    return self._reply(500)
+                if self.headers.get("Content-Encoding") == "gzip":
+                    if not self.accepts_gzip:
+                        return self._reply(415)
+                    body = gzip.decompress(body)
+                self.transactions[transaction_id].append(
+                    (self.headers["Content-Type"], body)
+                )
+            elif action == "COMMIT":
+                self.committed.append(self.transactions.pop(transaction_id))
+        self._reply(200)
+
+    def do_DELETE(self):
+        transaction_id = self.path.rsplit("/", 1)[-1]
+        with self.lock:
+            self.rolled_back.append(self.transactions.pop(transaction_id))
+        self._reply(204)
+
+
+@pytest.fixture
+def repository_url():
+    RDF4JStandIn.accepts_gzip = True
+    RDF4JStandIn.failing_adds = set()
+    RDF4JStandIn.add_counter = itertools.count(1)
+    RDF4JStandIn.transactions = {}
+    RDF4JStandIn.committed = []
+    RDF4JStandIn.rolled_back = []
+    RDF4JStandIn.requests = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), RDF4JStandIn)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}{REPOSITORY_PATH}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def write_graph(path, statements: int, dataset: str = "d") -> bytes:
+    lines = b"".join(
+        f"<http://example.org/{dataset}/{i}> <http://example.org/p> "
+        f'"value {i}" .\n'.encode()
+        for i in range(statements)
+    )
+    with gzip.open(path, "wb") as graph_file:
+        graph_file.write(lines)
+    return lines
+
+
+def loaded_data(transaction) -> bytes:
+    return b"".join(body for kind, body in transaction if kind != "update")
+
+
+def add_requests():
+    return [
+        (headers, params)
+        for action, headers, params in RDF4JStandIn.requests
+        if action == "ADD"
+    ]
+
+
+def test_graph_is_loaded_in_compressed_chunks_of_one_transaction(
+    repository_url, tmp_path
+):
+    graph_path = str(tmp_path / "m1__d1.nt.gz")
+    lines = write_graph(graph_path, 25)
+
+    with TriplestoreLoader(repository_url, chunk_statements=10) as loader:
+        result = loader.load_graph("m1", graph_path)
+
+    assert result["status"] == "succeeded"
+    assert result["statements"] == 25
+    assert len(RDF4JStandIn.committed) == 1
+    transaction = RDF4JStandIn.committed[0]
+    assert [body.count(b"\n") for _, body in transaction] == [10, 10, 5]
+    assert loaded_data(transaction) == lines
+    assert transaction[0][0].startswith("application/n-triples")
+    adds = [headers for headers, _ in add_requests()]
+    assert all(headers.get("Content-Encoding") == "gzip" for headers in adds)
+
+
+def test_blank_nodes_are_not_split_across_chunks(repository_url, tmp_path):
+    axioms = b"".join(
+        f"_:a{i} <http://www.w3.org/1999/02/22-rdf-syntax-ns#type> "
+        f"<http://www.w3.org/2002/07/owl#Axiom> .\n"
+        f'<http://example.org/d/{i}> <http://example.org/p> "value {i}" .\n'
+        f"_:a{i} <http://www.w3.org/2002/07/owl#annotatedSource> "
+        f"<http://example.org/cluster/{i}> .\n"
+        f'_:a{i} <http://example.org/percentage> "{i}.00" .\n'.encode()
+        for i in range(5)
+    )
+    # A restriction whose statements are far apart in the source graph
+    graph = Graph().parse(
+        data=(
+            b"<http://example.org/c> <http://www.w3.org/2000/01/rdf-schema#subClassOf> "
+            b"_:r .\n" + axioms + b"_:r <http://www.w3.org/2002/07/owl#onProperty> "
+            b"<http://example.org/q> .\n"
+        ).decode(),
+        format="nt",
+    )
+    graph_path = str(tmp_path / "m1__d1.nt.gz")
+    with StreamingRDFWriter(graph_path) as writer:
+        writer.add_graph(graph)
+
+    with TriplestoreLoader(repository_url, chunk_statements=4) as loader:
+        result = loader.load_graph("m1", graph_path)
+
+    assert result["status"] == "succeeded"
+    assert result["statements"] == 22
+    # RDF4J parses every request on its own, so each chunk has its own blank nodes
+    loaded = Graph()
+    for _, body in RDF4JStandIn.committed[0]:
+        loaded += Graph().parse(data=body.decode(), format="nt")
+    assert len(loaded) == 22
+    assert isomorphic(loaded, graph)
+
+
+def test_blank_node_groups_are_sent_as_they_are_read(tmp_path):
+    lines = b"".join(
+        f'<http://example.org/d/{i}> <http://example.org/p> "value {i}" .\n'
+        f"_:a{i} <http://www.w3.org/2002/07/owl#annotatedSource> "
+        f"<http://example.org/cluster/{i}> .\n"
+        f'_:a{i} <http://example.org/percentage> "{i}.00" .\n'.encode()
+        for i in range(100)
+    )
+    graph_path = str(tmp_path / "m1__d1.nt.gz")
+    with gzip.open(graph_path, "wb") as graph_file:
+        graph_file.write(lines)
+
+    chunks = [data for data, _ in iter_chunks(graph_path, 4)]
+
+    # The file is streamed in order, rather than holding back every blank node
+    assert b"".join(chunks) == lines
+    assert len(chunks) > 1
+    assert all(data.count(b"\n") <= 4 for data in chunks)
+    assert all(data.count(b"_:a") % 2 == 0 for data in chunks)
+
+
+def test_failed_chunk_rolls_back_the_transaction(repository_url, tmp_path):
+    RDF4JStandIn.failing_adds = {2}
+    graph_path = str(tmp_path / "m1__d1.nt.gz")
+    write_graph(graph_path, 25)
+
+    with TriplestoreLoader(repository_url, chunk_statements=10) as loader:
+        result = loader.load_graph("m1", graph_path)
+
+    assert result["status"] == "failed"
+    assert "500" in result["reason"]
+    assert RDF4JStandIn.committed == []
+    assert len(RDF4JStandIn.rolled_back) == 1
+    assert RDF4JStandIn.transactions == {}
+
+
+def test_datasets_are_loaded_concurrently_in_separate_transactions(
+    repository_url, tmp_path
+):
+    expected = {}
+    for dataset in range(6):
+        graph_path = str(tmp_path / f"m{dataset}__d.nt.gz")
+        expected[graph_path] = write_graph(graph_path, 30, f"d{dataset}")
+
+    with TriplestoreLoader(repository_url, connections=3, chunk_statements=7) as loader:
+        futures = [loader.submit(f"m{i}", path) for i, path in enumerate(expected)]
+        results = [future.result() for future in futures]
+
+    assert all(result["status"] == "succeeded" for result in results)
+    assert sorted(loaded_data(t) for t in RDF4JStandIn.committed) == sorted(
+        expected.values()
+    )
+
+
+def test_uncompressed_chunks_are_sent_if_gzip_is_not_accepted(repository_url, tmp_path):
+    RDF4JStandIn.accepts_gzip = False
+    graph_path = str(tmp_path / "m1__d1.nt.gz")
+    lines = write_graph(graph_path, 25)
+
+    with TriplestoreLoader(repository_url, chunk_statements=10) as loader:
+        result = loader.load_graph("m1", graph_path)
+        assert not loader.compress
+
+    assert result["status"] == "succeeded"
+    assert loaded_data(RDF4JStandIn.committed[0]) == lines
+    adds = [headers for headers, _ in add_requests()]
+    # Only the first chunk was sent compressed
+    assert [headers.get("Content-Encoding") for headers in adds] == [
+        "gzip",
+        None,
+        None,
+        None,
+    ]
+
+
+def test_rdf_xml_graph_is_loaded_as_a_single_chunk(repository_url, tmp_path):
+    graph_path = tmp_path / "m1__d1.owl"
+    graph_path.write_bytes(b"<rdf:RDF></rdf:RDF>")
+
+    assert list(iter_chunks(str(graph_path), 10)) == [(b"<rdf:RDF></rdf:RDF>", None)]
+    with TriplestoreLoader(repository_url) as loader:
+        result = loader.load_graph("m1", str(graph_path))
+
+    assert result["status"] == "succeeded"
+    content_type, body = RDF4JStandIn.committed[0][0]
+    assert content_type.startswith("application/rdf+xml")
+    assert body == b"<rdf:RDF></rdf:RDF>"
+
+
+def test_new_dataset_version_replaces_its_graph_in_one_transaction(
+    repository_url, tmp_path
+):
+    graph_path = str(tmp_path / "m1__d2.nt.gz")
+    lines = write_graph(graph_path, 25)
+
+    with TriplestoreLoader(repository_url, chunk_statements=10) as loader:
+        result = loader.load_graph(
+            "m1", graph_path, "urn:cl_kg:dataset:m1:d2", ["urn:cl_kg:dataset:m1:d1"]
+        )
+
+    assert result["status"] == "succeeded"
+    assert len(RDF4JStandIn.committed) == 1
+    transaction = RDF4JStandIn.committed[0]
+    assert transaction[0] == (
+        "update",
+        "CLEAR SILENT GRAPH <urn:cl_kg:dataset:m1:d1> ;\n"
+        "CLEAR SILENT GRAPH <urn:cl_kg:dataset:m1:d2>",
+    )
+    assert loaded_data(transaction) == lines
+    assert all(
+        params["context"] == "<urn:cl_kg:dataset:m1:d2>" for _, params in add_requests()
+    )
+
+
+def test_n_quads_are_loaded_without_a_context(repository_url, tmp_path):
+    graph_path = str(tmp_path / "m1__d1.nq.gz")
+    write_graph(graph_path, 5)
+
+    with TriplestoreLoader(repository_url) as loader:
+        result = loader.load_graph("m1", graph_path, "urn:cl_kg:dataset:m1:d1")
+
+    assert result["status"] == "succeeded"
+    assert RDF4JStandIn.committed[0][0] == (
+        "update",
+        "CLEAR SILENT GRAPH <urn:cl_kg:dataset:m1:d1>",
+    )
+    assert all("context" not in params for _, params in add_requests())
@@ -0,0 +1,201 @@
+import argparse
+import gzip
+import json
+import logging
+import os
+import random
+import sys
+import time
+from typing import Dict, List, Optional
+
+import requests
+
+BENCHMARK_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCHMARK_DIRECTORY), "src"))
+
+from benchmark_term_retrieval import OWL_CLASS, RDF_TYPE, RDFS_LABEL  # noqa: E402
+from benchmark_term_retrieval import load_fixture, scratch_endpoint  # noqa: E402
+from gene_node_unifier.gene_node_unifier import build_gene_node_mapping  # noqa: E402
+from utils import translator_utils  # noqa: E402
+from utils.iri_rewriter import rewrite_iris  # noqa: E402
+from utils.translator_utils import PREFIXES, RO_0003000  # noqa: E402
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+RO_0002292 = "http://purl.obolibrary.org/obo/RO_0002292"  # expresses
+CLUSTER_NAMESPACE = "http://example.org/cl_kg/cluster/"
+# The Ensembl nodes unified per request by the per-entity path
+LEGACY_BATCH_SIZE = 1000
+
+
+def write_fixture(
+    file_path: str,
+    genes: int = 20_000,
+    clusters: int = 5_000,
+    links_per_cluster: int = 20,
+    seed: int = 0,
+):
+    """
+    Write a gzip-compressed N-Triples fixture of Ensembl gene nodes with statements as
+    subject, such as their type, label and protein, and as object of cluster links.
+
+    Parameters:
+      file_path: The path of the '.nt.gz' fixture.
+      genes: The number of Ensembl gene nodes.
+      clusters: The number of clusters linking to genes.
+      links_per_cluster: The number of genes each cluster expresses.
+      seed: The random seed.
+    """
+    rng = random.Random(seed)
+    with gzip.open(file_path, "wt", encoding="utf-8", compresslevel=1) as fixture:
+        for i in range(genes):
+            gene = f"{PREFIXES['ensembl']}ENSG{i:011d}"
+            fixture.write(f"<{gene}> <{RDF_TYPE}> <{OWL_CLASS}> .\n")
+            fixture.write(f'<{gene}> <{RDFS_LABEL}> "gene {i}" .\n')
+            fixture.write(
+                f"<{gene}> <{RO_0003000}> <{PREFIXES['uniprot']}P{i:07d}> .\n"
+            )
+        for i in range(clusters):
+            cluster = f"{CLUSTER_NAMESPACE}{i}"
+            fixture.write(f"<{cluster}> <{RDF_TYPE}> <{OWL_CLASS}> .\n")
+            for gene in rng.sample(range(genes), min(links_per_cluster, genes)):
+                fixture.write(
+                    f"<{cluster}> <{RO_0002292}> "
+                    f"<{PREFIXES['ensembl']}ENSG{gene:011d}> .\n"
+                )
+
+
+def get_update_dict(genes: int) -> Dict[str, List[str]]:
+    """The Node Normalizer output of the fixture genes, one NCBIGene node each."""
+    return {
+        f"ENSEMBL:ENSG{i:011d}": [f"NCBIGene:{i}", f"HGNC:{i}"] for i in range(genes)
+    }
+
+
+def legacy_update_gene_nodes(update_dict: Dict[str, List[str]]):
+    """The per-entity DELETE/INSERT ... UNION updates the unifier sent before."""
+    items = list(update_dict.items())
+    for start in range(0, len(items), LEGACY_BATCH_SIZE):
+        statements = []
+        for ensembl_id, ncbigene_ids in items[start : start + LEGACY_BATCH_SIZE]:
+            primary = ncbigene_ids[0]
+            extras = "".join(
+                f'\n          {primary} oio:hasDbXref "{xref}" .'
+                for xref in ncbigene_ids[1:]
+            )
+            statements.append(f"""DELETE {{
+          {ensembl_id} ?p ?o .
+          ?s2 ?p2 {ensembl_id} .
+        }}
+        INSERT {{
+          {primary} ?p ?o .
+          ?s2 ?p2 {primary} .
+          {primary} oio:hasDbXref "{ensembl_id}" .{extras}
+        }}
+        WHERE {{
+          {{ {ensembl_id} ?p ?o . }}
+          UNION
+          {{ ?s2 ?p2 {ensembl_id} . }}
+        }}""")
+        update = (
+            f"PREFIX ENSEMBL: <{PREFIXES['ensembl']}>\n"
+            f"PREFIX NCBIGene: <{PREFIXES['ncbigene']}>\n"
+            "PREFIX oio: <http://www.geneontology.org/formats/oboInOwl#>\n"
+            + " ;\n".join(statements)
+        )
+        response = requests.post(
+            f"{translator_utils.ENDPOINT_URL}/statements",
+            data=update,
+            headers={"Content-Type": "application/sparql-update"},
+        )
+        response.raise_for_status()
+
+
+def rewrite_gene_nodes(update_dict: Dict[str, List[str]]):
+    mapping, xrefs = build_gene_node_mapping(update_dict)
+    rewrite_iris(
+        mapping,
+        objects=True,
+        extra_triples=xrefs,
+        repository_url=translator_utils.ENDPOINT_URL,
+    )
+
+
+def count_statements(endpoint_url: str) -> Dict[str, int]:
+    """Count all statements, and those that still hold an Ensembl IRI."""
+    query = f"""
+    SELECT (COUNT(*) AS ?all) (SUM(?ensembl) AS ?left)
+    WHERE {{
+      ?s ?p ?o .
+      BIND(IF(STRSTARTS(STR(?s), "{PREFIXES['ensembl']}")
+              || STRSTARTS(STR(?o), "{PREFIXES['ensembl']}"), 1, 0) AS ?ensembl)
+    }}
+    """
+    response = requests.post(
+        endpoint_url,
+        data={"query": query},
+        headers={"Accept": "application/sparql-results+json"},
+    )
+    response.raise_for_status()
+    row = response.json()["results"]["bindings"][0]
+    return {
+        "statements": int(row["all"]["value"]),
+        "ensembl_statements": int(row["left"]["value"]),
+    }
+
+
+def parse_arguments(arguments: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the gene node unification updates on a local store."
+    )
+    parser.add_argument(
+        "--endpoint",
+        type=scratch_endpoint,
+        required=True,
+        help="The URL of a scratch RDF4J repository. Each run replaces its content "
+        "with the fixture.",
+    )
+    parser.add_argument("--fixture", default="iri_rewrite_fixture.nt.gz")
+    parser.add_argument("--genes", type=int, default=20_000)
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    return parser.parse_args(arguments)
+
+
+def main(arguments: Optional[List[str]] = None) -> int:
+    args = parse_arguments(arguments)
+    translator_utils.ENDPOINT_URL = args.endpoint
+    if not os.path.exists(args.fixture):
+        logger.info(f"Writing {args.fixture}...")
+        write_fixture(args.fixture, genes=args.genes)
+    update_dict = get_update_dict(args.genes)
+
+    methods = {"legacy": legacy_update_gene_nodes, "rewrite": rewrite_gene_nodes}
+    results = []
+    for method, unify in methods.items():
+        load_fixture(args.endpoint, args.fixture)
+        start = time.perf_counter()
+        unify(update_dict)
+        elapsed = time.perf_counter() - start
+        results.append(
+            {
+                "method": method,
+                "seconds": round(elapsed, 3),
+                **count_statements(args.endpoint),
+            }
+        )
+        print(
+            f"{method:<8} {elapsed:>8.2f}s {results[-1]['statements']:>10} statements "
+            f"{results[-1]['ensembl_statements']:>8} with Ensembl IRIs left"
+        )
+    if results[0]["statements"] != results[1]["statements"]:
+        logger.warning("The two methods left different numbers of statements.")
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump({"genes": args.genes, "results": results}, output_file, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
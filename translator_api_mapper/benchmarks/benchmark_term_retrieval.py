@@ -0,0 +1,176 @@
+import argparse
+import gzip
+import json
+import logging
+import os
+import random
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, Iterable, List, Optional
+
+import requests
+
+BENCHMARK_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCHMARK_DIRECTORY), "src"))
+
+from utils import translator_utils  # noqa: E402
+from utils.translator_utils import PREFIXES, iter_prefix_uris  # noqa: E402
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# The term query and JSON parsing the mappers used before streaming
+LEGACY_QUERY = """
+    SELECT DISTINCT ?s
+    WHERE {{
+      ?s a ?o. FILTER(contains(str(?s), "{prefix}"))
+    }}
+    """
+
+RDF_TYPE = "http://www.w3.org/1999/02/22-rdf-syntax-ns#type"
+OWL_CLASS = "http://www.w3.org/2002/07/owl#Class"
+RDFS_LABEL = "http://www.w3.org/2000/01/rdf-schema#label"
+# Typed subjects of the other namespaces of the KG, which the term queries must skip
+OTHER_NAMESPACES = [
+    "http://purl.obolibrary.org/obo/CL_",
+    "http://purl.obolibrary.org/obo/UBERON_",
+    "http://purl.obolibrary.org/obo/PR_",
+    "http://example.org/cl_kg/cluster/",
+]
+
+
+def write_fixture(
+    file_path: str,
+    uniprot: int = 30_000,
+    ensembl: int = 60_000,
+    ncbigene: int = 40_000,
+    other: int = 2_000_000,
+    seed: int = 0,
+):
+    """
+    Write a gzip-compressed N-Triples fixture with the term counts of a KG.
+
+    Every subject is typed and labelled, in random order, so the store cannot rely on
+    the insertion order.
+
+    Parameters:
+      file_path: The path of the '.nt.gz' fixture.
+      uniprot, ensembl, ncbigene: The number of subjects of each mapped prefix.
+      other: The number of subjects in other namespaces.
+      seed: The random seed.
+    """
+    rng = random.Random(seed)
+    subjects = (
+        [f"{PREFIXES['uniprot']}P{i:07d}" for i in range(uniprot)]
+        + [f"{PREFIXES['ensembl']}ENSG{i:011d}" for i in range(ensembl)]
+        + [f"{PREFIXES['ncbigene']}{i}" for i in range(ncbigene)]
+        + [f"{rng.choice(OTHER_NAMESPACES)}{i:07d}" for i in range(other)]
+    )
+    rng.shuffle(subjects)
+    with gzip.open(file_path, "wt", encoding="utf-8", compresslevel=1) as fixture:
+        for subject in subjects:
+            fixture.write(f"<{subject}> <{RDF_TYPE}> <{OWL_CLASS}> .\n")
+            fixture.write(f'<{subject}> <{RDFS_LABEL}> "{subject[-7:]}" .\n')
+
+
+def load_fixture(endpoint_url: str, file_path: str):
+    """Replace the content of the benchmark repository with the fixture."""
+    response = requests.delete(f"{endpoint_url}/statements")
+    response.raise_for_status()
+    with gzip.open(file_path, "rb") as fixture:
+        response = requests.post(
+            f"{endpoint_url}/statements",
+            data=fixture,
+            headers={"Content-Type": "application/n-triples"},
+        )
+    response.raise_for_status()
+
+
+def legacy_prefix_uris(prefix: str) -> List[str]:
+    response = requests.post(
+        translator_utils.ENDPOINT_URL,
+        data={"query": LEGACY_QUERY.format(prefix=prefix)},
+        headers={"Accept": "application/sparql-results+json"},
+    )
+    response.raise_for_status()
+    return [row["s"]["value"] for row in response.json()["results"]["bindings"]]
+
+
+def measure(retrieve: Callable[[str], Iterable[str]], prefix: str) -> Dict:
+    """Time a retrieval and trace the peak memory it allocates."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    count = sum(1 for _ in retrieve(prefix))
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"terms": count, "seconds": round(elapsed, 3), "peak_memory_bytes": peak}
+
+
+def scratch_endpoint(endpoint_url: str) -> str:
+    """
+    Checks that an --endpoint argument is not the KG repository, since the benchmarks
+    replace the content of the repository they run on.
+    """
+    if endpoint_url.rstrip("/") == translator_utils.ENDPOINT_URL.rstrip("/"):
+        raise argparse.ArgumentTypeError(
+            f"{endpoint_url} is the KG repository. Use a scratch repository."
+        )
+    return endpoint_url
+
+
+def parse_arguments(arguments: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the retrieval of the mapped terms from a local store."
+    )
+    parser.add_argument(
+        "--endpoint",
+        type=scratch_endpoint,
+        required=True,
+        help="The URL of a scratch RDF4J repository. Loading the fixture replaces "
+        "its content.",
+    )
+    parser.add_argument("--fixture", default="term_retrieval_fixture.nt.gz")
+    parser.add_argument("--other-subjects", type=int, default=2_000_000)
+    parser.add_argument(
+        "--load", action="store_true", help="Write and load the fixture first."
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    return parser.parse_args(arguments)
+
+
+def main(arguments: Optional[List[str]] = None) -> int:
+    args = parse_arguments(arguments)
+    translator_utils.ENDPOINT_URL = args.endpoint
+    if args.load:
+        if not os.path.exists(args.fixture):
+            logger.info(f"Writing {args.fixture}...")
+            write_fixture(args.fixture, other=args.other_subjects)
+        logger.info(f"Loading {args.fixture} into {args.endpoint}...")
+        load_fixture(args.endpoint, args.fixture)
+
+    methods = {
+        "legacy": legacy_prefix_uris,
+        "streamed": iter_prefix_uris,
+    }
+    results = []
+    for name, prefix in PREFIXES.items():
+        for method, retrieve in methods.items():
+            runs = [measure(retrieve, prefix) for _ in range(args.repeat)]
+            best = min(runs, key=lambda run: run["seconds"])
+            results.append({"prefix": name, "method": method, **best})
+            print(
+                f"{name:<10} {method:<8} {best['terms']:>9} terms "
+                f"{best['seconds']:>8.2f}s {best['peak_memory_bytes'] / 1024**2:>9.1f} MB"
+            )
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump({"results": results}, output_file, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
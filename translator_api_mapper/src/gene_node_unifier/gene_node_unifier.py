@@ -1,14 +1,14 @@
+import json
 import logging
-from typing import Dict, List
+from typing import Dict, List, Tuple
 
-import requests
+from utils.identifier_index import IDENTIFIER_INDEX
+from utils.iri_rewriter import Triple, rewrite_iris
+from utils.mapping_checkpoint import get_batch_recorder
 from utils.translator_utils import (
-    ENDPOINT_URL,
-    PREFIXES,
-    build_sparql_query,
+    OIO_HAS_DB_XREF,
+    curie_to_uri,
     get_normalized_curies,
-    run_query,
-    uri_to_curie,
 )
 
 logging.basicConfig(level=logging.WARNING)
@@ -16,99 +16,78 @@ logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 
-def update_gene_nodes_batch(update_dict: Dict[str, List[str]]):
+def build_gene_node_mapping(
+    update_dict: Dict[str, List[str]],
+) -> Tuple[Dict[str, str], Dict[str, List[Triple]]]:
     """
-    Combines multiple SPARQL updates into one request.
+    Builds the IRI mapping of the Ensembl nodes to their NCBIGene nodes.
 
     Parameters:
       update_dict: A mapping of Ensembl identifiers to lists of NCBIGene identifiers
-                          (the first element will be used for the primary update, the rest
-                           will be inserted as additional hasDbXref values).
+                          (the first element will be used for the primary node, the
+                           Ensembl identifier and the rest are added as hasDbXref
+                           values).
+
+    Returns:
+      The mapping of Ensembl IRIs to primary IRIs, and the hasDbXref statements of
+      each primary node, keyed by Ensembl IRI.
     """
-    endpoint_url = f"{ENDPOINT_URL}/statements"
-    headers = {"Content-Type": "application/sparql-update"}
-
-    # Build the common prefix section
-    prefixes = f"""
-    PREFIX ENSEMBL: <{PREFIXES['ensembl']}>
-    PREFIX NCBIGene: <{PREFIXES['ncbigene']}>
-    PREFIX owl: <http://www.w3.org/2002/07/owl#>
-    PREFIX oio: <http://www.geneontology.org/formats/oboInOwl#>
+    mapping = {}
+    xrefs = {}
+    for ensembl_id, ncbigene_ids in update_dict.items():
+        ensembl_uri = curie_to_uri(ensembl_id)
+        primary_uri = curie_to_uri(ncbigene_ids[0])
+        if ensembl_uri is None or primary_uri is None:
+            logger.warning(f"Cannot unify {ensembl_id} with {ncbigene_ids[0]}.")
+            continue
+        mapping[ensembl_uri] = primary_uri
+        xrefs[ensembl_uri] = [
+            (f"<{primary_uri}>", f"<{OIO_HAS_DB_XREF}>", json.dumps(xref))
+            for xref in [ensembl_id] + ncbigene_ids[1:]
+        ]
+    return mapping, xrefs
+
+
+def normalize_ensembl_curies() -> Dict[str, List[str]]:
     """
+    Maps the Ensembl nodes of the KG to their equivalent identifiers.
 
-    update_statements = []
-    for ensembl_id, ncbigene_ids in update_dict.items():
-        # Primary NCBIGene id
-        primary = ncbigene_ids[0]
-
-        # Build additional hasDbXref triples for any extra IDs
-        extra_xrefs = ncbigene_ids[1:]
-        extra_triples = ""
-        if extra_xrefs:
-            extras = "\n".join(
-                f'          {primary} oio:hasDbXref "{xref}" .' for xref in extra_xrefs
-            )
-            extra_triples = "\n" + extras
-
-        stmt = f"""
-        DELETE {{
-          {ensembl_id} ?p ?o .
-          ?s2 ?p2 {ensembl_id} .
-        }}
-        INSERT {{
-          {primary} ?p ?o .
-          ?s2 ?p2 {primary} .
-          {primary} oio:hasDbXref "{ensembl_id}" .{extra_triples}
-        }}
-        WHERE {{
-          {{
-            {ensembl_id} ?p ?o .
-          }}
-          UNION
-          {{
-            ?s2 ?p2 {ensembl_id} .
-          }}
-        }}
-        """
-        update_statements.append(stmt.strip())
-
-    # Combine all updates with semicolon separators
-    full_query = prefixes + "\n" + " ;\n".join(update_statements)
-
-    try:
-        response = requests.post(endpoint_url, data=full_query, headers=headers)
-        if response.status_code == 204:
-            logger.info(f"Successfully updated a batch of {len(update_dict)} updates.")
-        else:
-            logger.error(
-                f"Batch update failed. Status Code: {response.status_code} - {response.text}"
-            )
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Batch update request failed: {e}")
+    Unified nodes leave the store, so a rerun, or a run resuming after a crash, only
+    normalizes the new Ensembl nodes and those earlier batches did not apply.
+    """
+    # Already loaded if uniprot_gene_mapper ran in the same process
+    ensembl_curie_list = IDENTIFIER_INDEX.curies("ensembl")
 
+    # get_normalized_curies sends the curies in concurrent chunks
+    return get_normalized_curies(
+        ensembl_curie_list, source_field="equivalent_identifiers"
+    )
 
-def gene_node_unifier():
-    ensembl_terms = run_query(build_sparql_query(PREFIXES['ensembl']))
-    ensembl_curie_list = uri_to_curie(ensembl_terms)
-
-    # Process the curies in batches to avoid API limitations
-    normalized_curie_dict = {}
-    batch_size = 20000
-    for start in range(0, len(ensembl_curie_list), batch_size):
-        batch = ensembl_curie_list[start : start + batch_size]
-        # batch_result = get_normalized_curies(batch, source_field="id", filter_keywords=["NCBIGene"])
-        batch_result = get_normalized_curies(
-            batch, source_field="equivalent_identifiers"
-        )
-        normalized_curie_dict.update(batch_result)
-    # Batch the SPARQL updates into groups and send them together
-    update_batch_size = 1000
-    update_items = list(normalized_curie_dict.items())
-    for i in range(0, len(update_items), update_batch_size):
-        batch_dict = dict(update_items[i : i + update_batch_size])
-        update_gene_nodes_batch(batch_dict)
+
+def unify_gene_nodes(normalized_curie_dict: Dict[str, List[str]]):
+    """
+    Replaces the Ensembl nodes of the KG with their NCBIGene nodes.
+
+    Parameters:
+      normalized_curie_dict: The output of normalize_ensembl_curies.
+    """
+    # Every statement of an Ensembl node, as subject or object, moves to the new node
+    mapping, xrefs = build_gene_node_mapping(normalized_curie_dict)
+    rewrite_iris(
+        mapping,
+        objects=True,
+        extra_triples=xrefs,
+        on_applied=get_batch_recorder("gene_node_unification"),
+    )
 
     logger.info("Gene node unification process completed.")
+
+
+def gene_node_unifier():
+    normalized_curie_dict = normalize_ensembl_curies()
+    unify_gene_nodes(normalized_curie_dict)
+    # The Ensembl nodes were replaced with NCBIGene nodes
+    IDENTIFIER_INDEX.invalidate("ensembl", "ncbigene")
     return normalized_curie_dict
 
 
@@ -1,10 +1,47 @@
-from gene_node_unifier.gene_node_unifier import gene_node_unifier
-from pr_uniprot_id_swapper.pr_uniprot_id_swapper import pr_uniprot_id_swapper
-from uniprot_gene_mapper.uniprot_gene_mapper import uniprot_gene_mapper
+from gene_node_unifier.gene_node_unifier import (
+    normalize_ensembl_curies,
+    unify_gene_nodes,
+)
+from pr_uniprot_id_swapper.pr_uniprot_id_swapper import (
+    fetch_pr_uniprot_pairs,
+    swap_pr_uniprot_ids,
+)
+from uniprot_gene_mapper.uniprot_gene_mapper import (
+    insert_gene_protein_links,
+    normalize_uniprot_curies,
+)
+from utils.step_runner import Step, run_steps
 
-# Swap CL PR term URIs with UniProtKB dbxref values CL_KG#53
-pr_uniprot_id_swapper()
-# Link from Proteins (uniprot) to Genes (Ensembl) CL_KG#73
-uniprot_gene_mapper()
-# Unify Genes (Ensembl) with NCBIGene nodes
-gene_node_unifier()
+# Steps that read or write the same namespaces run in this order, the others run
+# concurrently. The Ubergraph queries and the Ensembl normalization start at once.
+PIPELINE_STEPS = [
+    Step("pr_uniprot_pairs", fetch_pr_uniprot_pairs),
+    Step("ensembl_normalization", normalize_ensembl_curies, reads=["ensembl"]),
+    # Swap CL PR term URIs with UniProtKB dbxref values CL_KG#53
+    Step(
+        "pr_uniprot_swap",
+        swap_pr_uniprot_ids,
+        requires=["pr_uniprot_pairs"],
+        reads=["pr"],
+        writes=["pr", "uniprot"],
+    ),
+    # Link from Proteins (uniprot) to Genes (Ensembl) CL_KG#73
+    Step("uniprot_normalization", normalize_uniprot_curies, reads=["uniprot"]),
+    Step(
+        "gene_protein_links",
+        insert_gene_protein_links,
+        requires=["uniprot_normalization"],
+        reads=["ensembl", "ncbigene"],
+    ),
+    # Unify Genes (Ensembl) with NCBIGene nodes
+    Step(
+        "gene_node_unification",
+        unify_gene_nodes,
+        requires=["ensembl_normalization"],
+        reads=["ensembl"],
+        writes=["ensembl", "ncbigene"],
+    ),
+]
+
+if __name__ == "__main__":
+    run_steps(PIPELINE_STEPS)
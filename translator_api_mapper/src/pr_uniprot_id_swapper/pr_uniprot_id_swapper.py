@@ -1,15 +1,25 @@
+import json
 import logging
-from typing import List, Tuple
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
 
-import requests
 from SPARQLWrapper import JSON, SPARQLWrapper
-from utils.translator_utils import ENDPOINT_URL
+from pr_uniprot_id_swapper.ubergraph_snapshot import (
+    UBERGRAPH_ENDPOINT,
+    UBERGRAPH_SNAPSHOT_PATH,
+    query_snapshot,
+)
+from utils.identifier_index import IDENTIFIER_INDEX
+from utils.iri_rewriter import Triple, rewrite_iris
+from utils.mapping_checkpoint import get_batch_recorder
+from utils.translator_utils import OIO_HAS_DB_XREF, curie_to_uri
 
 logging.basicConfig(level=logging.WARNING)
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
-UBERGRAPH_ENDPOINT = "https://ubergraph.apps.renci.org/sparql"
+XSD_STRING = "http://www.w3.org/2001/XMLSchema#string"
 
 FIRST_QUERY = """
 PREFIX obo: <http://purl.obolibrary.org/obo/>
@@ -73,84 +83,92 @@ def extract_tuples(bindings, key_pr="pr", key_uniprot="uniprot"):
     ]
 
 
-def generate_rename_query(pr_iri: str, xref_curie: str) -> str:
+def build_swap_mapping(
+    pairs: List[Tuple[str, str]],
+) -> Tuple[Dict[str, str], Dict[Triple, Triple]]:
     """
-    Generates a SPARQL UPDATE that:
-      - deletes all triples for <pr_iri>
-      - reinserts them under the new UniProtKB IRI
-      (filtering out the old hasDbXref)
-    """
-    return f"""
-DELETE {{
-  <{pr_iri}> ?p ?o .
-}}
-INSERT {{
-  {xref_curie} ?p ?o .
-}}
-WHERE {{
-  <{pr_iri}> ?p ?o .
-}}"""
-
-
-def generate_xref_update_query(pr_iri: str, xref_curie: str) -> str:
+    Builds the IRI mapping of the PR terms to their UniProtKB nodes.
+
+    A PR term with several UniProtKB xrefs moves to the first one.
+
+    Returns:
+      The mapping of PR IRIs to UniProtKB IRIs, and the hasDbXref statements of the
+      UniProtKB nodes to replace, which point to the PR terms instead of themselves.
     """
-    Generates a SPARQL UPDATE that:
-      - deletes the old oio:hasDbXref "<xref_curie>"
-      - reinserts it as oio:hasDbXref "PR:<suffix>"
+    mapping: Dict[str, str] = {}
+    xref_swaps: Dict[Triple, Triple] = {}
+    for pr_iri, xref_curie in pairs:
+        uniprot_uri = curie_to_uri(xref_curie)
+        if uniprot_uri is None or pr_iri in mapping:
+            continue
+        mapping[pr_iri] = uniprot_uri
+        subject = f"<{uniprot_uri}>"
+        predicate = f"<{OIO_HAS_DB_XREF}>"
+        new_xref = (
+            subject,
+            predicate,
+            json.dumps(f"PR:{pr_iri.rsplit('_', 1)[-1]}"),
+        )
+        for literal in (
+            json.dumps(xref_curie),
+            f"{json.dumps(xref_curie)}^^<{XSD_STRING}>",
+        ):
+            xref_swaps[(subject, predicate, literal)] = new_xref
+    return mapping, xref_swaps
+
+
+def fetch_pr_uniprot_pairs() -> List[Tuple[str, str]]:
     """
-    pr_id = pr_iri.rsplit("_", 1)[-1]
-    new_xref = f"PR:{pr_id}"
-    return f"""
-DELETE {{
-  {xref_curie} oio:hasDbXref "{xref_curie}" .
-}}
-INSERT {{
-  {xref_curie} oio:hasDbXref "{new_xref}" .
-}}
-WHERE {{
-  {xref_curie} oio:hasDbXref "{xref_curie}" .
-}}"""
-
-
-def update_triples_batch(pairs: List[Tuple[str, str]]):
+    Queries Ubergraph for the (PR IRI, UniProtKB CURIE) pairs to swap. Reads nothing
+    from the local KG.
+
+    The local snapshot is queried if it exists, see ubergraph_snapshot. Otherwise both
+    queries are sent to the public endpoint at the same time.
     """
-    Updates triples
+    if UBERGRAPH_SNAPSHOT_PATH and os.path.exists(UBERGRAPH_SNAPSHOT_PATH):
+        first, second = query_snapshot([FIRST_QUERY, SECOND_QUERY])
+    else:
+        with ThreadPoolExecutor(2) as executor:
+            first, second = executor.map(run_query, [FIRST_QUERY, SECOND_QUERY])
+    return extract_tuples(first, key_pr="mpr") + extract_tuples(second)
+
+
+def swap_pr_uniprot_ids(pairs: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
     """
-    endpoint_url = f"{ENDPOINT_URL}/statements"
-    headers = {"Content-Type": "application/sparql-update"}
+    Swaps the PR nodes of the local KG with their UniProtKB xrefs.
+
+    Parameters:
+      pairs: The output of fetch_pr_uniprot_pairs.
 
-    prefixes = f"""
-    PREFIX PR: <http://purl.obolibrary.org/obo/PR_>
-    PREFIX UniProtKB: <https://identifiers.org/uniprot/>
-    PREFIX oio: <http://www.geneontology.org/formats/oboInOwl#>
+    Returns:
+      The pairs that were sent to the triplestore.
     """
-    update_statements = []
-    for pr_iri, xref_curie in pairs:
-        update_statements.append(generate_rename_query(pr_iri, xref_curie).strip())
-        update_statements.append(generate_xref_update_query(pr_iri, xref_curie).strip())
-
-    full_query = prefixes + "\n" + " ;\n".join(update_statements)
-    try:
-        response = requests.post(endpoint_url, data=full_query, headers=headers)
-        if response.status_code == 204:
-            logger.info(f"Successfully updated a batch of {len(pairs)} updates.")
-        else:
-            logger.error(
-                f"Batch update failed. Status Code: {response.status_code} - {response.text}"
-            )
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Batch update request failed: {e}")
+    # Only PR terms that are nodes of the local KG have triples to move. Swapped terms
+    # are no longer nodes, so a rerun skips the batches earlier runs applied.
+    all_tuples = [
+        (pr_iri, xref_curie)
+        for pr_iri, xref_curie in pairs
+        if IDENTIFIER_INDEX.contains_uri(pr_iri)
+    ]
+    logger.info(
+        f"{len(all_tuples)} of {len(pairs)} PR to UniProtKB swaps apply to the local KG."
+    )
+
+    # Only the statements of the PR terms as subject move to the UniProtKB nodes
+    mapping, xref_swaps = build_swap_mapping(all_tuples)
+    rewrite_iris(
+        mapping,
+        objects=False,
+        transform=lambda triple: xref_swaps.get(triple, triple),
+        on_applied=get_batch_recorder("pr_uniprot_swap"),
+    )
+    return all_tuples
 
 
 def pr_uniprot_id_swapper():
-    first = extract_tuples(run_query(FIRST_QUERY), key_pr="mpr")
-    second = extract_tuples(run_query(SECOND_QUERY))
-    all_tuples = first + second
-
-    update_batch_size = 1000
-    for i in range(0, len(all_tuples), update_batch_size):
-        batch_list = all_tuples[i : i + update_batch_size]
-        update_triples_batch(batch_list)
+    swap_pr_uniprot_ids(fetch_pr_uniprot_pairs())
+    # The swapped PR nodes are UniProtKB nodes now
+    IDENTIFIER_INDEX.invalidate("pr", "uniprot")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,231 @@
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+from SPARQLWrapper import JSON, SPARQLWrapper
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+UBERGRAPH_ENDPOINT = "https://ubergraph.apps.renci.org/sparql"
+CACHE_DIRECTORY = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache"
+)
+# The PR/CL subset of Ubergraph, as N-Quads. The swapper queries it instead of the
+# public endpoint when the file exists. Set to an empty string to always go remote.
+UBERGRAPH_SNAPSHOT_PATH = os.getenv(
+    "UBERGRAPH_SNAPSHOT_PATH", os.path.join(CACHE_DIRECTORY, "ubergraph_pr_cl.nq.gz")
+)
+
+# The PR terms that CL terms point to, which the swapper queries are restricted to
+LINKED_PR_TERMS = """
+    { SELECT DISTINCT ?pr WHERE {
+        ?pr rdfs:isDefinedBy obo:pr.owl .
+        ?cell rdfs:isDefinedBy obo:cl.owl .
+        ?cell ?r ?pr .
+    } }"""
+# Each query selects the statements of one part of the subset, with their graph
+SUBSET_QUERIES = {
+    "cell links": """
+    SELECT DISTINCT ?g ?s ?p ?o WHERE {
+      ?o rdfs:isDefinedBy obo:pr.owl .
+      ?s rdfs:isDefinedBy obo:cl.owl .
+      GRAPH ?g { ?s ?p ?o }
+    }""",
+    "definitions": f"""
+    SELECT DISTINCT ?g ?s ?p ?o WHERE {{
+      {{ {LINKED_PR_TERMS} BIND(?pr AS ?s) BIND(obo:pr.owl AS ?o) }}
+      UNION
+      {{ ?s rdfs:isDefinedBy obo:cl.owl . BIND(obo:cl.owl AS ?o) }}
+      BIND(rdfs:isDefinedBy AS ?p)
+      GRAPH ?g {{ ?s ?p ?o }}
+    }}""",
+    "subclasses": f"""
+    SELECT DISTINCT ?g ?s ?p ?o WHERE {{
+      {LINKED_PR_TERMS}
+      BIND(?pr AS ?o) BIND(rdfs:subClassOf AS ?p)
+      BIND(<http://reasoner.renci.org/nonredundant> AS ?g)
+      GRAPH ?g {{ ?s ?p ?o }}
+    }}""",
+    "taxa": f"""
+    SELECT DISTINCT ?g ?s ?p ?o WHERE {{
+      {LINKED_PR_TERMS}
+      GRAPH <http://reasoner.renci.org/nonredundant> {{ ?s rdfs:subClassOf ?pr }}
+      VALUES ?o {{ obo:NCBITaxon_9606 obo:NCBITaxon_10090 }}
+      BIND(obo:RO_0002160 AS ?p)
+      BIND(<http://reasoner.renci.org/redundant> AS ?g)
+      GRAPH ?g {{ ?s ?p ?o }}
+    }}""",
+    "xrefs": f"""
+    SELECT DISTINCT ?g ?s ?p ?o WHERE {{
+      {{ {LINKED_PR_TERMS} BIND(?pr AS ?s) }}
+      UNION
+      {{
+        {LINKED_PR_TERMS}
+        GRAPH <http://reasoner.renci.org/nonredundant> {{ ?s rdfs:subClassOf ?pr }}
+      }}
+      BIND(<http://www.geneontology.org/formats/oboInOwl#hasDbXref> AS ?p)
+      GRAPH ?g {{ ?s ?p ?o }}
+      FILTER(STRSTARTS(STR(?o), "UniProtKB"))
+    }}""",
+}
+SUBSET_PREFIXES = """
+PREFIX obo: <http://purl.obolibrary.org/obo/>
+PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+"""
+
+
+def _term(binding: Dict):
+    """Converts a SPARQL JSON result term to an rdflib term."""
+    from rdflib import BNode, Literal, URIRef
+
+    if binding["type"] == "uri":
+        return URIRef(binding["value"])
+    if binding["type"] == "bnode":
+        return BNode(binding["value"])
+    return Literal(
+        binding["value"], lang=binding.get("xml:lang"), datatype=binding.get("datatype")
+    )
+
+
+def extract_snapshot(
+    snapshot_path: str = UBERGRAPH_SNAPSHOT_PATH, endpoint: str = UBERGRAPH_ENDPOINT
+):
+    """
+    Extracts the PR/CL subset of Ubergraph that the swapper queries read, keeping the
+    named graph of every statement, and writes it as gzip-compressed N-Quads.
+
+    Parameters:
+      snapshot_path: The '.nq.gz' file to write.
+      endpoint: The Ubergraph SPARQL endpoint.
+    """
+    from rdflib import Dataset, URIRef
+
+    dataset = Dataset()
+    for name, query in SUBSET_QUERIES.items():
+        start = time.perf_counter()
+        sparql = SPARQLWrapper(endpoint)
+        sparql.setReturnFormat(JSON)
+        sparql.setQuery(SUBSET_PREFIXES + query)
+        bindings = sparql.query().convert()["results"]["bindings"]
+        for row in bindings:
+            graph = dataset.graph(URIRef(row["g"]["value"]))
+            graph.add((_term(row["s"]), _term(row["p"]), _term(row["o"])))
+        logger.info(
+            f"Extracted {len(bindings)} {name} statements in "
+            f"{time.perf_counter() - start:.1f}s."
+        )
+    os.makedirs(os.path.dirname(os.path.abspath(snapshot_path)), exist_ok=True)
+    temporary_path = f"{snapshot_path}.part"
+    with gzip.open(temporary_path, "wb") as snapshot_file:
+        dataset.serialize(snapshot_file, format="nquads")
+    os.replace(temporary_path, snapshot_path)
+    logger.info(f"Wrote the Ubergraph snapshot {snapshot_path}.")
+
+
+def get_snapshot_version(snapshot_path: str) -> str:
+    """Returns the SHA-256 of the snapshot file, which changes with its content."""
+    digest = hashlib.sha256()
+    with open(snapshot_path, "rb") as snapshot_file:
+        for block in iter(lambda: snapshot_file.read(1024**2), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_snapshot(snapshot_path: str):
+    """
+    Loads a snapshot into an embedded rdflib store. Its default graph is the union of
+    the named graphs, like the default graph of the Ubergraph endpoint.
+    """
+    from rdflib import Dataset
+
+    start = time.perf_counter()
+    dataset = Dataset(default_union=True)
+    opener = gzip.open if snapshot_path.endswith(".gz") else open
+    with opener(snapshot_path, "rb") as snapshot_file:
+        dataset.parse(snapshot_file, format="nquads")
+    logger.info(
+        f"Loaded {len(dataset)} Ubergraph snapshot statements in "
+        f"{time.perf_counter() - start:.1f}s."
+    )
+    return dataset
+
+
+def run_snapshot_query(dataset, query: str) -> List[Dict]:
+    """Runs a SELECT query on a snapshot and returns SPARQL JSON style bindings."""
+    result = dataset.query(query)
+    variables = [str(variable) for variable in result.vars]
+    return [
+        {
+            variable: {"value": str(value)}
+            for variable, value in zip(variables, row)
+            if value is not None
+        }
+        for row in result
+    ]
+
+
+def query_snapshot(
+    queries: List[str],
+    snapshot_path: str = UBERGRAPH_SNAPSHOT_PATH,
+    cache_directory: str = CACHE_DIRECTORY,
+) -> List[List[Dict]]:
+    """
+    Runs SELECT queries on the local Ubergraph snapshot.
+
+    The results are cached on disk, keyed by the snapshot version and the queries, so
+    the snapshot is only loaded when it or the queries changed.
+
+    Parameters:
+      queries: The SELECT queries.
+      snapshot_path: The snapshot written by extract_snapshot.
+      cache_directory: The directory of the cached results.
+
+    Returns:
+      The bindings of each query, in the format of SPARQLWrapper JSON results.
+    """
+    key = hashlib.sha256(get_snapshot_version(snapshot_path).encode())
+    for query in queries:
+        key.update(query.encode())
+    cache_path = os.path.join(
+        cache_directory, f"ubergraph_results_{key.hexdigest()[:16]}.json"
+    )
+    if os.path.exists(cache_path):
+        with open(cache_path) as cache_file:
+            logger.info(f"Using the cached Ubergraph snapshot results {cache_path}.")
+            return json.load(cache_file)
+
+    dataset = load_snapshot(snapshot_path)
+    results = [run_snapshot_query(dataset, query) for query in queries]
+    os.makedirs(cache_directory, exist_ok=True)
+    temporary_path = f"{cache_path}.part"
+    with open(temporary_path, "w") as cache_file:
+        json.dump(results, cache_file)
+    os.replace(temporary_path, cache_path)
+    return results
+
+
+def parse_arguments(arguments: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Extract the PR/CL subset of Ubergraph for pr_uniprot_id_swapper."
+    )
+    parser.add_argument("--output", default=UBERGRAPH_SNAPSHOT_PATH)
+    parser.add_argument("--endpoint", default=UBERGRAPH_ENDPOINT)
+    return parser.parse_args(arguments)
+
+
+def main(arguments: Optional[List[str]] = None) -> int:
+    args = parse_arguments(arguments)
+    extract_snapshot(args.output, args.endpoint)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,275 @@
+import itertools
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from rdflib import Graph
+from rdflib.compare import isomorphic
+
+from gene_node_unifier.gene_node_unifier import build_gene_node_mapping
+from pr_uniprot_id_swapper.pr_uniprot_id_swapper import XSD_STRING, build_swap_mapping
+from utils.iri_rewriter import rewrite_iris
+from utils.translator_utils import OIO_HAS_DB_XREF, PREFIXES
+
+REPOSITORY_PATH = "/rdf4j-server/repositories/obask"
+ENSEMBL = PREFIXES["ensembl"]
+NCBIGENE = PREFIXES["ncbigene"]
+UNIPROT = PREFIXES["uniprot"]
+PR = "http://purl.obolibrary.org/obo/PR_"
+CLUSTER = "http://example.org/cl_kg/cluster/"
+RO_0002292 = "http://purl.obolibrary.org/obo/RO_0002292"
+RDFS_LABEL = "http://www.w3.org/2000/01/rdf-schema#label"
+RDFS_SUBCLASS_OF = "http://www.w3.org/2000/01/rdf-schema#subClassOf"
+OWL_ON_PROPERTY = "http://www.w3.org/2002/07/owl#onProperty"
+
+
+class RDF4JStandIn(BaseHTTPRequestHandler):
+    """Implements the query and transaction requests of RDF4J on an rdflib graph."""
+
+    graph = Graph()
+    # Fail the UPDATE action of the transactions with these numbers (1-based)
+    failing_transactions = set()
+    lock = threading.Lock()
+    transaction_ids = itertools.count(1)
+    transactions = {}
+    committed = []
+    rolled_back = []
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, body=b"", content_type="text/plain", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_POST(self):
+        body = self._body()
+        if self.path == f"{REPOSITORY_PATH}/transactions":
+            with self.lock:
+                transaction_id = str(next(self.transaction_ids))
+                self.transactions[transaction_id] = []
+            host, port = self.server.server_address
+            location = (
+                f"http://{host}:{port}{REPOSITORY_PATH}/transactions/{transaction_id}"
+            )
+            return self._reply(201, headers={"Location": location})
+        query = parse_qs(body.decode())["query"][0]
+        with self.lock:
+            result = self.graph.query(query)
+        data = result.serialize(format="nt")
+        self._reply(200, data, "application/n-triples")
+
+    def do_PUT(self):
+        url = urlparse(self.path)
+        transaction_id = url.path.rsplit("/", 1)[-1]
+        action = parse_qs(url.query)["action"][0]
+        body = self._body().decode()
+        with self.lock:
+            operations = self.transactions[transaction_id]
+            if action == "UPDATE" and int(transaction_id) in self.failing_transactions:
+                return self._reply(500, b"update failed")
+            if action != "COMMIT":
+                operations.append((action, body))
+                return self._reply(204)
+            for operation, data in self.transactions.pop(transaction_id):
+                if operation == "ADD":
+                    self.graph.parse(data=data, format="nt")
+                elif operation == "DELETE":
+                    for triple in Graph().parse(data=data, format="nt"):
+                        self.graph.remove(triple)
+                else:
+                    self.graph.update(data)
+            self.committed.append(transaction_id)
+        self._reply(200)
+
+    def do_DELETE(self):
+        transaction_id = self.path.rsplit("/", 1)[-1]
+        with self.lock:
+            self.transactions.pop(transaction_id)
+            self.rolled_back.append(transaction_id)
+        self._reply(204)
+
+
+@pytest.fixture
+def repository_url():
+    RDF4JStandIn.graph = Graph()
+    RDF4JStandIn.failing_transactions = set()
+    RDF4JStandIn.transaction_ids = itertools.count(1)
+    RDF4JStandIn.transactions = {}
+    RDF4JStandIn.committed = []
+    RDF4JStandIn.rolled_back = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), RDF4JStandIn)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}{REPOSITORY_PATH}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def load(data: str) -> Graph:
+    RDF4JStandIn.graph = Graph().parse(data=data, format="nt")
+    return RDF4JStandIn.graph
+
+
+def legacy_gene_node_update(update_dict) -> str:
+    """The per-entity DELETE/INSERT ... UNION update the unifier sent before."""
+    statements = []
+    for ensembl_id, ncbigene_ids in update_dict.items():
+        old = f"<{ENSEMBL}{ensembl_id.split(':', 1)[1]}>"
+        new = f"<{NCBIGENE}{ncbigene_ids[0].split(':', 1)[1]}>"
+        xrefs = "".join(
+            f" {new} <{OIO_HAS_DB_XREF}> {json.dumps(xref)} ."
+            for xref in [ensembl_id] + ncbigene_ids[1:]
+        )
+        statements.append(
+            f"DELETE {{ {old} ?p ?o . ?s2 ?p2 {old} . }} "
+            f"INSERT {{ {new} ?p ?o . ?s2 ?p2 {new} .{xrefs} }} "
+            f"WHERE {{ {{ {old} ?p ?o . }} UNION {{ ?s2 ?p2 {old} . }} }}"
+        )
+    return " ;\n".join(statements)
+
+
+GENE_GRAPH = f"""
+<{ENSEMBL}ENSG1> <{RDFS_LABEL}> "gene 1" .
+<{ENSEMBL}ENSG2> <{RDFS_LABEL}> "gene 2" .
+<{ENSEMBL}ENSG1> <http://example.org/interacts> <{ENSEMBL}ENSG2> .
+<{CLUSTER}1> <{RO_0002292}> <{ENSEMBL}ENSG1> .
+<{CLUSTER}1> <{RO_0002292}> <{ENSEMBL}ENSG2> .
+<{ENSEMBL}ENSG1> <{RDFS_SUBCLASS_OF}> _:restriction .
+_:restriction <{OWL_ON_PROPERTY}> <{RO_0002292}> .
+_:axiom <http://www.w3.org/2002/07/owl#annotatedTarget> <{ENSEMBL}ENSG2> .
+_:axiom <http://example.org/percentage> "40.00" .
+"""
+UPDATE_DICT = {
+    "ENSEMBL:ENSG1": ["NCBIGene:1", "HGNC:1"],
+    "ENSEMBL:ENSG2": ["NCBIGene:2"],
+    # Not a node of the graph, so nothing is written for it
+    "ENSEMBL:ENSG3": ["NCBIGene:3"],
+}
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, 10])
+def test_gene_node_rewrite_matches_the_per_entity_update(repository_url, batch_size):
+    expected = Graph().parse(data=GENE_GRAPH, format="nt")
+    expected.update(legacy_gene_node_update(UPDATE_DICT))
+    graph = load(GENE_GRAPH)
+
+    mapping, xrefs = build_gene_node_mapping(UPDATE_DICT)
+    applied = rewrite_iris(
+        mapping,
+        objects=True,
+        extra_triples=xrefs,
+        batch_size=batch_size,
+        repository_url=repository_url,
+    )
+
+    assert applied == 3
+    assert isomorphic(graph, expected)
+    assert not [term for triple in graph for term in triple if ENSEMBL in str(term)]
+
+
+def test_statement_linking_two_old_iris_is_rewritten_once(repository_url):
+    graph = load(f"<{ENSEMBL}ENSG1> <http://example.org/p> <{ENSEMBL}ENSG2> .\n")
+
+    rewrite_iris(
+        {f"{ENSEMBL}ENSG1": f"{NCBIGENE}1", f"{ENSEMBL}ENSG2": f"{NCBIGENE}2"},
+        repository_url=repository_url,
+    )
+
+    assert sorted(graph.serialize(format="nt").split("\n")) == [
+        "",
+        f"<{NCBIGENE}1> <http://example.org/p> <{NCBIGENE}2> .",
+    ]
+
+
+def test_blank_node_statements_are_rewritten_in_the_store(repository_url):
+    graph = load(f"""
+<{ENSEMBL}ENSG1> <{RDFS_SUBCLASS_OF}> _:restriction .
+_:restriction <{OWL_ON_PROPERTY}> <{RO_0002292}> .
+_:axiom <http://www.w3.org/2002/07/owl#annotatedTarget> <{ENSEMBL}ENSG1> .
+""")
+
+    rewrite_iris({f"{ENSEMBL}ENSG1": f"{NCBIGENE}1"}, repository_url=repository_url)
+
+    expected = Graph().parse(
+        data=f"""
+<{NCBIGENE}1> <{RDFS_SUBCLASS_OF}> _:restriction .
+_:restriction <{OWL_ON_PROPERTY}> <{RO_0002292}> .
+_:axiom <http://www.w3.org/2002/07/owl#annotatedTarget> <{NCBIGENE}1> .
+""",
+        format="nt",
+    )
+    assert isomorphic(graph, expected)
+
+
+@pytest.mark.parametrize("datatype", ["", f"^^<{XSD_STRING}>"])
+def test_pr_swap_replaces_the_uniprot_xref(repository_url, datatype):
+    graph = load(f"""
+<{PR}000001> <{RDFS_LABEL}> "protein 1" .
+<{PR}000001> <{OIO_HAS_DB_XREF}> "UniProtKB:Q1"{datatype} .
+<{CLUSTER}1> <http://example.org/has_marker> <{PR}000001> .
+""")
+    mapping, xref_swaps = build_swap_mapping([(f"{PR}000001", "UniProtKB:Q1")])
+
+    rewrite_iris(
+        mapping,
+        objects=False,
+        transform=lambda triple: xref_swaps.get(triple, triple),
+        repository_url=repository_url,
+    )
+
+    expected = Graph().parse(
+        data=f"""
+<{UNIPROT}Q1> <{RDFS_LABEL}> "protein 1" .
+<{UNIPROT}Q1> <{OIO_HAS_DB_XREF}> "PR:000001" .
+<{CLUSTER}1> <http://example.org/has_marker> <{PR}000001> .
+""",
+        format="nt",
+    )
+    assert isomorphic(graph, expected)
+
+
+def test_failed_batch_is_rolled_back_and_the_next_one_applied(repository_url):
+    data = f"""
+<{ENSEMBL}ENSG1> <{RDFS_LABEL}> "gene 1" .
+<{ENSEMBL}ENSG2> <{RDFS_LABEL}> "gene 2" .
+<{ENSEMBL}ENSG3> <{RDFS_LABEL}> "gene 3" .
+"""
+    graph = load(data)
+    RDF4JStandIn.failing_transactions = {2}
+    applied_batches = []
+
+    applied = rewrite_iris(
+        {f"{ENSEMBL}ENSG{i}": f"{NCBIGENE}{i}" for i in (1, 2, 3)},
+        batch_size=1,
+        repository_url=repository_url,
+        on_applied=lambda batch, statements: applied_batches.append(batch),
+    )
+
+    assert applied == 2
+    assert RDF4JStandIn.committed == ["1", "3"]
+    assert RDF4JStandIn.rolled_back == ["2"]
+    assert RDF4JStandIn.transactions == {}
+    assert applied_batches == [
+        {f"{ENSEMBL}ENSG1": f"{NCBIGENE}1"},
+        {f"{ENSEMBL}ENSG3": f"{NCBIGENE}3"},
+    ]
+    expected = Graph().parse(
+        data=f"""
+<{NCBIGENE}1> <{RDFS_LABEL}> "gene 1" .
+<{ENSEMBL}ENSG2> <{RDFS_LABEL}> "gene 2" .
+<{NCBIGENE}3> <{RDFS_LABEL}> "gene 3" .
+""",
+        format="nt",
+    )
+    assert isomorphic(graph, expected)
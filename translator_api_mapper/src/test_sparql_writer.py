@@ -0,0 +1,167 @@
+import gzip
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import utils.sparql_writer
+from utils.sparql_writer import WRITE_MIN_BATCH_SIZE, SPARQLWriter
+
+REPOSITORY_PATH = "/rdf4j-server/repositories/obask"
+
+
+class StatementsStandIn(BaseHTTPRequestHandler):
+    """Implements the statements request of the RDF4J REST API in memory."""
+
+    accepts_gzip = True
+    # Answer this many requests with 503 before accepting any
+    busy_requests = 0
+    # Seconds each request takes
+    delay = 0.0
+    lock = threading.Lock()
+    statements = []
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, body=b""):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if self.path != f"{REPOSITORY_PATH}/statements":
+            return self._reply(404)
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        encoding = self.headers.get("Content-Encoding")
+        time.sleep(self.delay)
+        with self.lock:
+            self.requests.append(encoding)
+            if self.busy_requests > 0:
+                StatementsStandIn.busy_requests -= 1
+                return self._reply(503, b"busy")
+        if encoding == "gzip":
+            if not self.accepts_gzip:
+                return self._reply(415, b"unsupported encoding")
+            body = gzip.decompress(body)
+        lines = body.decode().splitlines()
+        # A statement the parser rejects fails its whole request
+        if any("bad" in line for line in lines):
+            return self._reply(400, b"parse error")
+        with self.lock:
+            self.statements.extend(lines)
+        self._reply(204)
+
+
+@pytest.fixture
+def repository_url(monkeypatch):
+    monkeypatch.setattr(utils.sparql_writer, "WRITE_BACKOFF_SECONDS", 0.01)
+    StatementsStandIn.accepts_gzip = True
+    StatementsStandIn.busy_requests = 0
+    StatementsStandIn.delay = 0.0
+    StatementsStandIn.statements = []
+    StatementsStandIn.requests = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), StatementsStandIn)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}{REPOSITORY_PATH}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def make_statements(count: int):
+    return [
+        f'<http://example.org/s{i}> <http://example.org/p> "value {i}" .'
+        for i in range(count)
+    ]
+
+
+def test_rejected_statement_is_isolated_from_its_batch(repository_url):
+    statements = make_statements(1000)
+    statements[537] = "<http://example.org/bad> <http://example.org/p> bad ."
+    accepted = []
+
+    writer = SPARQLWriter(repository_url, batch_size=1000, on_written=accepted.extend)
+    with writer:
+        writer.add_all(statements)
+
+    assert writer.rejected == [statements[537]]
+    assert writer.failed == 0
+    assert writer.written == 999
+    assert sorted(StatementsStandIn.statements) == sorted(
+        statements[:537] + statements[538:]
+    )
+    assert sorted(accepted) == sorted(StatementsStandIn.statements)
+    assert writer.batch_size < 1000
+
+
+def test_uncompressed_batches_are_sent_if_gzip_is_not_accepted(repository_url):
+    StatementsStandIn.accepts_gzip = False
+    statements = make_statements(300)
+
+    with SPARQLWriter(repository_url, batch_size=100, max_in_flight=1) as writer:
+        writer.add_all(statements)
+
+    assert not writer.compress
+    assert writer.written == 300
+    assert StatementsStandIn.statements == statements
+    # The first batch is sent compressed once, the following ones plain
+    assert StatementsStandIn.requests == ["gzip", None, None, None]
+
+
+def test_compression_is_kept_once_the_server_accepted_it(repository_url):
+    with SPARQLWriter(repository_url, batch_size=100, max_in_flight=1) as writer:
+        writer.add_all(make_statements(300))
+
+    assert writer.compress
+    assert StatementsStandIn.requests == ["gzip"] * 3
+
+
+def test_busy_store_is_retried(repository_url):
+    StatementsStandIn.busy_requests = 2
+
+    with SPARQLWriter(repository_url, batch_size=100, max_in_flight=1) as writer:
+        writer.add_all(make_statements(100))
+
+    assert writer.written == 100
+    assert writer.failed == 0
+    assert len(StatementsStandIn.requests) == 3
+
+
+def test_batch_failing_after_the_retries_is_not_split(repository_url):
+    StatementsStandIn.busy_requests = 10**6
+
+    with SPARQLWriter(repository_url, batch_size=200, max_in_flight=1) as writer:
+        writer.add_all(make_statements(200))
+
+    assert writer.written == 0
+    assert writer.failed == 200
+    assert writer.rejected == []
+    assert len(StatementsStandIn.requests) == utils.sparql_writer.WRITE_MAX_RETRIES + 1
+
+
+def test_batch_size_grows_while_requests_are_fast(repository_url):
+    with SPARQLWriter(
+        repository_url, batch_size=100, max_in_flight=1, target_seconds=10
+    ) as writer:
+        writer.add_all(make_statements(1500))
+
+    assert writer.written == 1500
+    # The size doubles after each full batch that finished in time
+    assert writer.batch_size >= 400
+    assert len(StatementsStandIn.requests) < 15
+
+
+def test_batch_size_shrinks_while_requests_are_slow(repository_url):
+    StatementsStandIn.delay = 0.2
+
+    with SPARQLWriter(
+        repository_url, batch_size=800, max_in_flight=1, target_seconds=0.05
+    ) as writer:
+        writer.add_all(make_statements(1600))
+
+    assert writer.written == 1600
+    assert WRITE_MIN_BATCH_SIZE <= writer.batch_size < 800
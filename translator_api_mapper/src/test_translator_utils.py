@@ -0,0 +1,68 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import pytest
+from rdflib import Graph
+
+import utils.translator_utils
+from utils.translator_utils import PREFIXES, iter_prefix_uris
+
+REPOSITORY_PATH = "/rdf4j-server/repositories/obask"
+RDF_TYPE = "http://www.w3.org/1999/02/22-rdf-syntax-ns#type"
+
+
+class QueryStandIn(BaseHTTPRequestHandler):
+    """Answers single-variable SPARQL queries on an rdflib graph with a TSV result."""
+
+    graph = Graph()
+    queries = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        query = parse_qs(body.decode())["query"][0]
+        self.queries.append(query)
+        rows = [f"<{row[0]}>\n" for row in self.graph.query(query)]
+        data = "".join(["?s\n"] + rows).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/tab-separated-values")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture
+def endpoint(monkeypatch):
+    QueryStandIn.graph = Graph()
+    QueryStandIn.queries = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), QueryStandIn)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(
+        utils.translator_utils,
+        "ENDPOINT_URL",
+        f"http://127.0.0.1:{httpd.server_address[1]}{REPOSITORY_PATH}",
+    )
+    yield
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_prefix_uris_are_retrieved_with_one_query(endpoint):
+    uniprot = [f"{PREFIXES['uniprot']}P{i}" for i in range(5)]
+    # Contains the UniProt prefix, but does not start with it
+    other = f"http://example.org/{PREFIXES['uniprot']}P0"
+    QueryStandIn.graph.parse(
+        data="".join(
+            f"<{uri}> <{RDF_TYPE}> <http://www.w3.org/2002/07/owl#Class> .\n"
+            for uri in uniprot + [other]
+        ),
+        format="nt",
+    )
+
+    assert sorted(iter_prefix_uris(PREFIXES["uniprot"])) == sorted(uniprot)
+    assert len(QueryStandIn.queries) == 1
+    assert "ORDER BY" not in QueryStandIn.queries[0]
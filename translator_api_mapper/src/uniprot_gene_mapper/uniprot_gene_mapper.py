@@ -1,109 +1,114 @@
+import functools
 import logging
-from typing import List
-
-import requests
-from utils.translator_utils import (
-    BATCH_SIZE,
-    ENDPOINT_URL,
-    PREFIXES,
-    RO_0003000,
-    build_sparql_query,
-    get_normalized_curies,
-    run_query,
-    uri_to_curie,
-)
+from typing import Dict, List, Optional
+
+from utils.identifier_index import IDENTIFIER_INDEX
+from utils.mapping_checkpoint import MappingCheckpoint, get_mapping_checkpoint
+from utils.sparql_writer import WRITE_BATCH_SIZE, SPARQLWriter
+from utils.translator_utils import RO_0003000, curie_to_uri, get_normalized_curies
 
 logging.basicConfig(level=logging.WARNING)
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+GENE_PROTEIN_LINKS_STEP = "gene_protein_links"
 
-def insert_triples_in_batch(triples: List[str]):
-    """Inserts a batch of RDF triples into the RDF4J repository."""
-    endpoint_url = f"{ENDPOINT_URL}/statements"
 
-    headers = {"Content-Type": "application/sparql-update"}
-    if not triples:
-        return
+def normalize_uniprot_curies() -> Dict[str, List[str]]:
+    """Maps the UniProtKB nodes of the KG to their Ensembl and NCBIGene identifiers."""
+    uniprot_curie_list = IDENTIFIER_INDEX.curies("uniprot")
+    return get_normalized_curies(
+        uniprot_curie_list,
+        source_field="equivalent_identifiers",
+        filter_keywords=["NCBIGene", "ENSEMBL"],
+    )
 
-    # Use the prefix variables in the SPARQL INSERT query
-    insert_query = f"""
-    PREFIX RO: <http://purl.obolibrary.org/obo/RO_>
-    PREFIX ensembl: <{PREFIXES['ensembl']}>
-    PREFIX uniprot: <{PREFIXES['uniprot']}>
 
-    INSERT DATA {{
-        {' '.join(triples)}
-    }}
+def record_links(checkpoint: MappingCheckpoint, statements: List[str]):
+    """Records link statements the triplestore accepted in the mapping checkpoint."""
+    checkpoint.record_batch(
+        GENE_PROTEIN_LINKS_STEP, dict.fromkeys(statements), len(statements)
+    )
+
+
+def add_new_links(
+    writer: SPARQLWriter,
+    checkpoint: Optional[MappingCheckpoint],
+    statements: List[str],
+) -> int:
     """
+    Queues the link statements that earlier runs did not write.
 
-    try:
-        response = requests.post(endpoint_url, data=insert_query, headers=headers)
+    Returns:
+      The number of statements that earlier runs wrote.
+    """
+    if checkpoint is None:
+        writer.add_all(statements)
+        return 0
+    written = checkpoint.lookup(GENE_PROTEIN_LINKS_STEP, statements)
+    writer.add_all(statement for statement in statements if statement not in written)
+    return len(written)
 
-        if response.status_code == 204:
-            logger.info(f"Successfully inserted {len(triples)} triples.")
-        else:
-            logger.error(
-                f"Failed to insert triples. Status Code: {response.status_code}"
-            )
 
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Request failed: {e}")
+def insert_gene_protein_links(normalized_curie_dict: Dict[str, List[str]]):
+    """
+    Links the gene nodes of the KG to the proteins they produce.
 
+    The links written by earlier runs are recorded in the mapping checkpoint, and only
+    the new ones are sent to the triplestore.
 
-def uniprot_gene_mapper():
-    # Retrieve UniProt and Ensembl terms
-    uniprot_terms = run_query(build_sparql_query(PREFIXES["uniprot"]))
-    uniprot_curie_list = uri_to_curie(uniprot_terms)
-    ensembl_terms = run_query(build_sparql_query(PREFIXES["ensembl"]))
-    ncbigene_terms = run_query(build_sparql_query(PREFIXES["ncbigene"]))
-    gene_curie_list = uri_to_curie(ensembl_terms) + uri_to_curie(ncbigene_terms)
-
-    # Get mappings
-    normalized_curie_dict = get_normalized_curies(
-        uniprot_curie_list,
-        source_field="equivalent_identifiers",
-        filter_keywords=["NCBIGene", "ENSEMBL"],
-    )
+    Parameters:
+      normalized_curie_dict: The output of normalize_uniprot_curies.
+    """
+    IDENTIFIER_INDEX.load("ensembl", "ncbigene")
 
-    triples_batch = []
+    checkpoint = get_mapping_checkpoint()
+    on_written = (
+        functools.partial(record_links, checkpoint) if checkpoint is not None else None
+    )
+    writer = SPARQLWriter(on_written=on_written)
+    # Looked up in the checkpoint a batch at a time
+    statements = []
+    skipped = 0
     ensembl_count = 0
     ncbigene_count = 0
     ensembl_missing_count = 0
     ncbigene_missing_count = 0
 
     for uni, gene_list in normalized_curie_dict.items():
+        uniprot_uri = curie_to_uri(uni)
         for gene_curie in gene_list:
             # Convert the CURIE back to a full URI using the prefix variables
+            gene_uri = curie_to_uri(gene_curie)
             if gene_curie.startswith("ENSEMBL:"):
-                gene_uri = gene_curie.replace("ENSEMBL:", PREFIXES["ensembl"])
                 ensembl_count += 1
             elif gene_curie.startswith("NCBIGene:"):
-                gene_uri = gene_curie.replace("NCBIGene:", PREFIXES["ncbigene"])
                 ncbigene_count += 1
-            uniprot_uri = uni.replace("UniProtKB:", PREFIXES["uniprot"])
-
-            if gene_curie in gene_curie_list:
-                triple = f"<{gene_uri}> <{RO_0003000}> <{uniprot_uri}> ."
-                triples_batch.append(triple)
 
-                # Insert in batches
-                if len(triples_batch) >= BATCH_SIZE:
-                    insert_triples_in_batch(triples_batch)
-                    triples_batch = []
+            if IDENTIFIER_INDEX.contains_curie(gene_curie):
+                statements.append(f"<{gene_uri}> <{RO_0003000}> <{uniprot_uri}> .")
+                if len(statements) >= WRITE_BATCH_SIZE:
+                    skipped += add_new_links(writer, checkpoint, statements)
+                    statements = []
 
             elif "ENSG" in gene_curie:
                 ensembl_missing_count += 1
             elif "NCBIGene" in gene_curie:
                 ncbigene_missing_count += 1
+    skipped += add_new_links(writer, checkpoint, statements)
 
-    # Insert remaining triples (if any)
-    if triples_batch:
-        insert_triples_in_batch(triples_batch)
+    # Sends the remaining triples and reports the write rate
+    writer.close()
 
+    if checkpoint is not None:
+        logger.info(f"Skipped {skipped} links that earlier runs wrote.")
     logger.info(f"Out of {ensembl_count} ENSEMBL IDs, {ensembl_missing_count} are missing")
     logger.info(f"Out of {ncbigene_count} NCBIGene IDs, {ncbigene_missing_count} are missing")
 
 
+def uniprot_gene_mapper():
+    insert_gene_protein_links(normalize_uniprot_curies())
+
+
 if __name__ == "__main__":
     uniprot_gene_mapper()
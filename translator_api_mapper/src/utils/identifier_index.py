@@ -0,0 +1,84 @@
+import logging
+import sys
+import threading
+from typing import Callable, Dict, Iterable, List, Set
+
+from utils.translator_utils import CURIE_PREFIXES, PREFIXES, iter_prefix_uris
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+_NAMES_BY_CURIE_PREFIX = {
+    curie_prefix: name for name, curie_prefix in CURIE_PREFIXES.items()
+}
+
+
+class IdentifierIndex:
+    """
+    The node sets of the PREFIXES namespaces in the triplestore, loaded on first use.
+
+    Each namespace is stored as a set of interned local identifiers, such as 'P12345'
+    for 'https://identifiers.org/uniprot/P12345', so membership checks of CURIEs and
+    URIs are O(1) and do not build the full URI. Steps that add or remove nodes of a
+    namespace invalidate it, and the next lookup loads it again. Steps running in
+    threads share the index, and each namespace is loaded by one of them.
+    """
+
+    def __init__(self, load_uris: Callable[[str], Iterable[str]] = iter_prefix_uris):
+        """
+        Parameters:
+          load_uris: Yields the node URIs of a namespace, given its prefix.
+        """
+        self._load_uris = load_uris
+        self._local_ids: Dict[str, Set[str]] = {}
+        self._locks = {name: threading.Lock() for name in PREFIXES}
+
+    def local_ids(self, name: str) -> Set[str]:
+        """Returns the local identifiers of a namespace, loading them if needed."""
+        local_ids = self._local_ids.get(name)
+        if local_ids is not None:
+            return local_ids
+        with self._locks[name]:
+            local_ids = self._local_ids.get(name)
+            if local_ids is None:
+                namespace = PREFIXES[name]
+                start = len(namespace)
+                local_ids = {
+                    sys.intern(uri[start:]) for uri in self._load_uris(namespace)
+                }
+                self._local_ids[name] = local_ids
+                logger.info(f"Indexed {len(local_ids)} {CURIE_PREFIXES[name]} nodes.")
+        return local_ids
+
+    def load(self, *names: str):
+        """Loads the node sets of namespaces ahead of the lookups."""
+        for name in names:
+            self.local_ids(name)
+
+    def invalidate(self, *names: str):
+        """Forgets the node sets of namespaces whose nodes changed."""
+        for name in names:
+            self._local_ids.pop(name, None)
+
+    def contains_curie(self, curie: str) -> bool:
+        curie_prefix, _, local_id = curie.partition(":")
+        name = _NAMES_BY_CURIE_PREFIX.get(curie_prefix)
+        return name is not None and local_id in self.local_ids(name)
+
+    def contains_uri(self, uri: str) -> bool:
+        for name, namespace in PREFIXES.items():
+            if uri.startswith(namespace):
+                return uri[len(namespace) :] in self.local_ids(name)
+        return False
+
+    def curies(self, name: str) -> List[str]:
+        """Returns the CURIEs of the nodes of a namespace, sorted."""
+        curie_prefix = CURIE_PREFIXES[name]
+        return [
+            f"{curie_prefix}:{local_id}" for local_id in sorted(self.local_ids(name))
+        ]
+
+
+# Shared by the mapper steps of a pipeline run, so each namespace is queried once
+IDENTIFIER_INDEX = IdentifierIndex()
@@ -0,0 +1,204 @@
+import logging
+import os
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import requests
+from utils.rdf4j_transaction import RDF4JTransaction, TriplestoreError
+from utils.translator_utils import ENDPOINT_URL, REQUEST_TIMEOUT
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Entities rewritten per export and transaction
+REWRITE_BATCH_SIZE = int(os.getenv("REWRITE_BATCH_SIZE", "5000"))
+
+# A statement as its three N-Triples terms, such as ('<s>', '<p>', '"label"@en')
+Triple = Tuple[str, str, str]
+
+
+def build_export_query(iris: List[str], objects: bool = True) -> str:
+    """
+    Builds the CONSTRUCT query of the statements whose subject, or object, is one of
+    the IRIs.
+
+    Statements that link them to blank nodes are left out, because blank nodes cannot
+    be deleted by value. build_blank_node_update rewrites those in the store.
+    """
+    values = " ".join(f"<{iri}>" for iri in iris)
+    object_branch = (
+        f"""
+      UNION
+      {{ VALUES ?o {{ {values} }} ?s ?p ?o . FILTER(!isBlank(?s)) }}"""
+        if objects
+        else ""
+    )
+    return f"""
+    CONSTRUCT {{ ?s ?p ?o }}
+    WHERE {{
+      {{ VALUES ?s {{ {values} }} ?s ?p ?o . FILTER(!isBlank(?o)) }}{object_branch}
+    }}
+    """
+
+
+def build_blank_node_update(mapping: Dict[str, str], objects: bool = True) -> str:
+    """Builds the SPARQL update that rewrites the IRIs in statements with blank nodes."""
+    values = " ".join(f"(<{old}> <{new}>)" for old, new in mapping.items())
+    updates = [f"""
+    DELETE {{ ?old ?p ?o }} INSERT {{ ?new ?p ?o }}
+    WHERE {{ VALUES (?old ?new) {{ {values} }} ?old ?p ?o . FILTER(isBlank(?o)) }}"""]
+    if objects:
+        updates.append(f"""
+    DELETE {{ ?s ?p ?old }} INSERT {{ ?s ?p ?new }}
+    WHERE {{ VALUES (?old ?new) {{ {values} }} ?s ?p ?old . FILTER(isBlank(?s)) }}""")
+    return " ;".join(updates)
+
+
+def parse_ntriples_line(line: str) -> Optional[Triple]:
+    """Splits an N-Triples statement into its terms. Only the object may hold spaces."""
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+    subject, predicate, rest = line.split(None, 2)
+    return subject, predicate, rest[: rest.rindex(".")].rstrip()
+
+
+def serialize_triples(triples: Iterable[Triple]) -> bytes:
+    return "".join(f"{s} {p} {o} .\n" for s, p, o in triples).encode("utf-8")
+
+
+def export_triples(
+    iris: List[str],
+    objects: bool = True,
+    session: Optional[requests.Session] = None,
+    repository_url: str = ENDPOINT_URL,
+) -> Iterator[Triple]:
+    """
+    Yields the statements of the IRIs as N-Triples terms, parsed line by line as the
+    result streams in.
+    """
+    http = session if session is not None else requests
+    with http.post(
+        repository_url,
+        data={"query": build_export_query(iris, objects)},
+        headers={"Accept": "application/n-triples"},
+        stream=True,
+        timeout=REQUEST_TIMEOUT,
+    ) as response:
+        response.raise_for_status()
+        response.encoding = "utf-8"
+        for line in response.iter_lines(decode_unicode=True):
+            triple = parse_ntriples_line(line)
+            if triple is not None:
+                yield triple
+
+
+def rewrite_triples(
+    triples: Iterable[Triple], mapping: Dict[str, str], objects: bool = True
+) -> Tuple[Set[Triple], Set[Triple]]:
+    """
+    Rewrites the IRIs of statements from a mapping table.
+
+    Parameters:
+      triples: The exported statements.
+      mapping: A mapping of old IRIs to new IRIs.
+      objects: Whether to rewrite objects as well as subjects.
+
+    Returns:
+      The statements to remove and the statements to add. Statements that hold none of
+      the old IRIs are in neither set. A statement exported twice, such as one linking
+      two old IRIs, is rewritten once.
+    """
+    terms = {f"<{old}>": f"<{new}>" for old, new in mapping.items()}
+    removed: Set[Triple] = set()
+    added: Set[Triple] = set()
+    for triple in triples:
+        subject, predicate, obj = triple
+        new_subject = terms.get(subject, subject)
+        new_object = terms.get(obj, obj) if objects else obj
+        if new_subject != subject or new_object != obj:
+            removed.add(triple)
+            added.add((new_subject, predicate, new_object))
+    return removed, added
+
+
+def apply_rewrite(
+    removed: Set[Triple],
+    added: Set[Triple],
+    mapping: Dict[str, str],
+    objects: bool = True,
+    session: Optional[requests.Session] = None,
+    repository_url: str = ENDPOINT_URL,
+):
+    """
+    Removes and adds the rewritten statements, and rewrites the statements with blank
+    nodes, in a single transaction.
+    """
+    with RDF4JTransaction(session, repository_url) as transaction:
+        if removed:
+            transaction.remove(serialize_triples(removed))
+        if added:
+            transaction.add(serialize_triples(added))
+        transaction.update(build_blank_node_update(mapping, objects))
+
+
+def rewrite_iris(
+    mapping: Dict[str, str],
+    objects: bool = True,
+    extra_triples: Optional[Dict[str, List[Triple]]] = None,
+    transform: Optional[Callable[[Triple], Triple]] = None,
+    batch_size: int = REWRITE_BATCH_SIZE,
+    repository_url: str = ENDPOINT_URL,
+    on_applied: Optional[Callable[[Dict[str, str], int], None]] = None,
+) -> int:
+    """
+    Replaces IRIs in the triplestore, computing the change locally.
+
+    For each batch of entities, their statements are exported in one streaming query,
+    rewritten in Python, and applied as one remove-set and one add-set in a single
+    transaction, instead of one DELETE/INSERT pattern per entity. A batch that fails
+    is rolled back and logged, and the next batch goes on.
+
+    Parameters:
+      mapping: A mapping of old IRIs to new IRIs.
+      objects: Whether to rewrite the statements that hold an old IRI as object too.
+      extra_triples: Statements to add for an old IRI, if the store holds any of its
+                     statements, such as xrefs of the new node.
+      transform: A function applied to each rewritten statement before it is added.
+      batch_size: The number of entities per export and transaction.
+      repository_url: The URL of the RDF4J repository.
+      on_applied: Called with the mapping of each committed batch and the number of
+                  statements it removed and added, such as to checkpoint it.
+
+    Returns:
+      The number of entities whose batch was applied.
+    """
+    items = [(old, new) for old, new in mapping.items() if old != new]
+    applied = 0
+    with requests.Session() as session:
+        for start in range(0, len(items), batch_size):
+            batch = dict(items[start : start + batch_size])
+            try:
+                exported = list(
+                    export_triples(list(batch), objects, session, repository_url)
+                )
+                removed, added = rewrite_triples(exported, batch, objects)
+                if transform is not None:
+                    added = {transform(triple) for triple in added}
+                if extra_triples:
+                    present = {term for triple in exported for term in triple}
+                    for old in batch:
+                        if f"<{old}>" in present:
+                            added.update(extra_triples.get(old, []))
+                apply_rewrite(removed, added, batch, objects, session, repository_url)
+            except (requests.exceptions.RequestException, TriplestoreError) as e:
+                logger.error(f"Rewriting a batch of {len(batch)} IRIs failed: {e}")
+                continue
+            applied += len(batch)
+            if on_applied is not None:
+                on_applied(batch, len(removed) + len(added))
+            logger.info(
+                f"Rewrote {len(batch)} IRIs: removed {len(removed)} and added "
+                f"{len(added)} statements."
+            )
+    return applied
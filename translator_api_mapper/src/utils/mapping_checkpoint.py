@@ -0,0 +1,252 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterable, Optional
+
+import requests
+from utils.translator_utils import ENDPOINT_URL, REQUEST_TIMEOUT
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+MAPPING_CHECKPOINT_PATH = os.getenv(
+    "MAPPING_CHECKPOINT_PATH",
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        "cache",
+        "mapping_checkpoint.sqlite",
+    ),
+)
+# Set to false to map every node again on each run
+MAPPING_CHECKPOINT_ENABLED = os.getenv("MAPPING_CHECKPOINT", "true").lower() == "true"
+
+# A statement in its own graph ties the checkpoint to the content of the store. If the
+# store is rebuilt from scratch, the marker is gone and the checkpoint starts over.
+MARKER_GRAPH = "urn:cl_kg:mapping_checkpoint"
+MARKER_PREDICATE = "urn:cl_kg:mapping_checkpoint_id"
+
+# SQLite limits the number of host parameters of a statement
+LOOKUP_CHUNK_SIZE = 900
+
+
+class MappingCheckpoint:
+    """
+    A log of the nodes the mapper steps already mapped, and of the batches they applied.
+
+    A step records each batch once the store committed it, along with the result of
+    every node of the batch, such as the IRI it was rewritten to or the statement it
+    wrote. A rerun, or a run resuming after a crash, skips the recorded nodes and
+    processes only the new or unmapped ones. Steps in several threads may share it.
+    """
+
+    def __init__(self, path: str = MAPPING_CHECKPOINT_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS mapped_nodes (
+                    step TEXT NOT NULL,
+                    node TEXT NOT NULL,
+                    result TEXT,
+                    batch INTEGER NOT NULL,
+                    PRIMARY KEY (step, node)
+                ) WITHOUT ROWID
+                """)
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS applied_batches (
+                    batch INTEGER PRIMARY KEY,
+                    step TEXT NOT NULL,
+                    nodes INTEGER NOT NULL,
+                    statements INTEGER NOT NULL,
+                    applied_at REAL NOT NULL
+                )
+                """)
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value TEXT)"
+            )
+
+    def __enter__(self) -> "MappingCheckpoint":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def close(self):
+        self.connection.close()
+
+    def get_metadata(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT value FROM metadata WHERE key = ?", (key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def reset(self, store_marker: str):
+        """Forgets every mapped node and batch, for a store with a new marker."""
+        with self._lock, self.connection:
+            self.connection.execute("DELETE FROM mapped_nodes")
+            self.connection.execute("DELETE FROM applied_batches")
+            self.connection.execute(
+                "INSERT OR REPLACE INTO metadata (key, value) VALUES ('store_marker', ?)",
+                (store_marker,),
+            )
+
+    def lookup(self, step: str, nodes: Iterable[str]) -> Dict[str, Any]:
+        """
+        Looks up the recorded results of nodes.
+
+        Returns:
+          A dictionary mapping each node the step already mapped to its result.
+        """
+        nodes = list(nodes)
+        results: Dict[str, Any] = {}
+        with self._lock:
+            for start in range(0, len(nodes), LOOKUP_CHUNK_SIZE):
+                chunk = nodes[start : start + LOOKUP_CHUNK_SIZE]
+                placeholders = ", ".join("?" * len(chunk))
+                rows = self.connection.execute(
+                    f"SELECT node, result FROM mapped_nodes "
+                    f"WHERE step = ? AND node IN ({placeholders})",
+                    (step, *chunk),
+                )
+                for node, result in rows:
+                    results[node] = json.loads(result) if result is not None else None
+        return results
+
+    def record_batch(self, step: str, results: Dict[str, Any], statements: int = 0):
+        """
+        Records a batch the store committed, and the result of each of its nodes, in a
+        single transaction.
+
+        Parameters:
+          step: The name of the step.
+          results: A mapping of the nodes of the batch to their JSON-serialisable
+                   results, None if there is nothing to keep.
+          statements: The number of statements the batch changed.
+        """
+        with self._lock, self.connection:
+            batch = self.connection.execute(
+                "INSERT INTO applied_batches (step, nodes, statements, applied_at) "
+                "VALUES (?, ?, ?, ?)",
+                (step, len(results), statements, time.time()),
+            ).lastrowid
+            self.connection.executemany(
+                """
+                INSERT INTO mapped_nodes (step, node, result, batch) VALUES (?, ?, ?, ?)
+                ON CONFLICT (step, node) DO UPDATE SET
+                    result = excluded.result, batch = excluded.batch
+                """,
+                (
+                    (
+                        step,
+                        node,
+                        json.dumps(result) if result is not None else None,
+                        batch,
+                    )
+                    for node, result in results.items()
+                ),
+            )
+
+    def count_batches(self, step: str) -> int:
+        with self._lock:
+            return self.connection.execute(
+                "SELECT COUNT(*) FROM applied_batches WHERE step = ?", (step,)
+            ).fetchone()[0]
+
+
+def _store_has_marker(store_marker: str, repository_url: str) -> bool:
+    query = (
+        f"ASK {{ GRAPH <{MARKER_GRAPH}> "
+        f'{{ <{MARKER_GRAPH}> <{MARKER_PREDICATE}> "{store_marker}" }} }}'
+    )
+    response = requests.post(
+        repository_url,
+        data={"query": query},
+        headers={"Accept": "application/sparql-results+json"},
+        timeout=REQUEST_TIMEOUT,
+    )
+    response.raise_for_status()
+    return response.json()["boolean"]
+
+
+def _write_store_marker(store_marker: str, repository_url: str):
+    update = (
+        f"DROP SILENT GRAPH <{MARKER_GRAPH}> ;\n"
+        f"INSERT DATA {{ GRAPH <{MARKER_GRAPH}> "
+        f'{{ <{MARKER_GRAPH}> <{MARKER_PREDICATE}> "{store_marker}" }} }}'
+    )
+    response = requests.post(
+        f"{repository_url}/statements",
+        data=update,
+        headers={"Content-Type": "application/sparql-update"},
+        timeout=REQUEST_TIMEOUT,
+    )
+    response.raise_for_status()
+
+
+def open_mapping_checkpoint(
+    path: str = MAPPING_CHECKPOINT_PATH, repository_url: str = ENDPOINT_URL
+) -> Optional[MappingCheckpoint]:
+    """
+    Opens the checkpoint of the store, or returns None if checkpoints are disabled or
+    the store cannot be checked.
+
+    If the store does not hold the marker of the checkpoint, such as after a rebuild
+    from scratch, the checkpoint is reset and a new marker is written.
+    """
+    if not MAPPING_CHECKPOINT_ENABLED:
+        return None
+    checkpoint = MappingCheckpoint(path)
+    try:
+        store_marker = checkpoint.get_metadata("store_marker")
+        if store_marker is None or not _store_has_marker(store_marker, repository_url):
+            store_marker = uuid.uuid4().hex
+            _write_store_marker(store_marker, repository_url)
+            checkpoint.reset(store_marker)
+            logger.info("Started a new mapping checkpoint for the store.")
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"Cannot check the mapping checkpoint, mapping every node: {e}")
+        checkpoint.close()
+        return None
+    return checkpoint
+
+
+_checkpoint_lock = threading.Lock()
+_checkpoint: Dict[str, Optional[MappingCheckpoint]] = {}
+
+
+def get_mapping_checkpoint() -> Optional[MappingCheckpoint]:
+    """Returns the checkpoint shared by the steps of this process, opened once."""
+    with _checkpoint_lock:
+        if "default" not in _checkpoint:
+            _checkpoint["default"] = open_mapping_checkpoint()
+        return _checkpoint["default"]
+
+
+def get_batch_recorder(step: str) -> Optional[Callable[[Dict[str, Any], int], None]]:
+    """
+    Returns the function that records the committed batches of a step in the shared
+    checkpoint, or None if there is no checkpoint. Logs what earlier runs applied.
+
+    Parameters:
+      step: The name of the step, such as 'gene_node_unification'.
+    """
+    checkpoint = get_mapping_checkpoint()
+    if checkpoint is None:
+        return None
+    logger.info(
+        f"Earlier runs of '{step}' applied {checkpoint.count_batches(step)} batches."
+    )
+
+    def record(results: Dict[str, Any], statements: int):
+        checkpoint.record_batch(step, results, statements)
+
+    return record
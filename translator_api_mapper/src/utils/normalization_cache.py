@@ -0,0 +1,136 @@
+import json
+import logging
+import os
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+NORMALIZATION_CACHE_PATH = os.getenv(
+    "NORMALIZATION_CACHE_PATH",
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        "cache",
+        "node_normalization.sqlite",
+    ),
+)
+# Set to false to always query the Node Normalizer
+NORMALIZATION_CACHE_ENABLED = os.getenv("NORMALIZATION_CACHE", "true").lower() == "true"
+# Cached results older than this are fetched again
+NORMALIZATION_CACHE_TTL_DAYS = float(os.getenv("NORMALIZATION_CACHE_TTL_DAYS", "30"))
+# Answer from the cache only, whatever the age of the results, without network access
+NORMALIZATION_OFFLINE = os.getenv("NORMALIZATION_OFFLINE", "false").lower() == "true"
+
+# SQLite limits the number of host parameters of a statement
+LOOKUP_CHUNK_SIZE = 900
+
+
+class NormalizationCache:
+    """
+    An on-disk cache of Node Normalizer results, keyed by CURIE.
+
+    The raw result of each CURIE is stored, including its equivalent_identifiers, so
+    callers can select any field from it. CURIEs the Node Normalizer does not know are
+    cached too, as a None result.
+    """
+
+    def __init__(
+        self,
+        path: str = NORMALIZATION_CACHE_PATH,
+        ttl_days: Optional[float] = NORMALIZATION_CACHE_TTL_DAYS,
+    ):
+        """
+        Parameters:
+          path: The SQLite database file. Its directory is created if missing.
+          ttl_days: The age after which a cached result is a miss. None never expires.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.ttl_seconds = ttl_days * 86400 if ttl_days is not None else None
+        # Concurrent pipeline steps write to the same database
+        self.connection = sqlite3.connect(path, timeout=30)
+        with self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS normalized_nodes (
+                    curie TEXT PRIMARY KEY,
+                    result TEXT,
+                    fetched_at REAL NOT NULL
+                ) WITHOUT ROWID
+                """)
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS normalized_nodes_fetched_at "
+                "ON normalized_nodes (fetched_at)"
+            )
+
+    def __enter__(self) -> "NormalizationCache":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def close(self):
+        self.connection.close()
+
+    def lookup(self, curies: List[str]) -> Dict[str, Optional[Dict]]:
+        """
+        Looks up the cached results of CURIEs.
+
+        Parameters:
+          curies: The CURIEs to look up.
+
+        Returns:
+          A dictionary mapping each CURIE with a fresh cached result to that result.
+          CURIEs that are missing or expired are left out.
+        """
+        oldest = time.time() - self.ttl_seconds if self.ttl_seconds is not None else 0
+        results: Dict[str, Optional[Dict]] = {}
+        for start in range(0, len(curies), LOOKUP_CHUNK_SIZE):
+            chunk = curies[start : start + LOOKUP_CHUNK_SIZE]
+            placeholders = ", ".join("?" * len(chunk))
+            rows = self.connection.execute(
+                f"SELECT curie, result FROM normalized_nodes "
+                f"WHERE curie IN ({placeholders}) AND fetched_at >= ?",
+                (*chunk, oldest),
+            )
+            for curie, result in rows:
+                results[curie] = json.loads(result) if result is not None else None
+        return results
+
+    def upsert(self, results: Iterable[Tuple[str, Optional[Dict]]]):
+        """
+        Stores Node Normalizer results in a single transaction.
+
+        Parameters:
+          results: Pairs of a CURIE and its raw result, None if it is unknown.
+        """
+        fetched_at = time.time()
+        with self.connection:
+            self.connection.executemany(
+                """
+                INSERT INTO normalized_nodes (curie, result, fetched_at)
+                VALUES (?, ?, ?)
+                ON CONFLICT (curie) DO UPDATE SET
+                    result = excluded.result, fetched_at = excluded.fetched_at
+                """,
+                (
+                    (
+                        curie,
+                        json.dumps(result) if result is not None else None,
+                        fetched_at,
+                    )
+                    for curie, result in results
+                ),
+            )
+
+
+def open_normalization_cache() -> Optional[NormalizationCache]:
+    """Opens the configured cache, or returns None if caching is disabled."""
+    if not NORMALIZATION_CACHE_ENABLED and not NORMALIZATION_OFFLINE:
+        return None
+    # An offline run replays whatever was cached, however old
+    ttl_days = None if NORMALIZATION_OFFLINE else NORMALIZATION_CACHE_TTL_DAYS
+    return NormalizationCache(NORMALIZATION_CACHE_PATH, ttl_days)
@@ -0,0 +1,95 @@
+import logging
+from typing import Dict, Optional
+
+import requests
+from utils.translator_utils import ENDPOINT_URL, REQUEST_TIMEOUT
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class TriplestoreError(Exception):
+    """Raised when the triplestore rejects a transaction request."""
+
+    def __init__(self, action: str, response: requests.Response):
+        self.status_code = response.status_code
+        super().__init__(
+            f"{action} failed with status {response.status_code}: {response.text[:500]}"
+        )
+
+
+class RDF4JTransaction:
+    """
+    An RDF4J REST API transaction, committed when the block ends without an error.
+
+    If the block raises, the transaction is rolled back, so the store never holds half
+    of a change.
+    """
+
+    def __init__(
+        self,
+        session: requests.Session,
+        repository_url: str = ENDPOINT_URL,
+        timeout: float = REQUEST_TIMEOUT,
+    ):
+        self.session = session
+        self.repository_url = repository_url.rstrip("/")
+        self.timeout = timeout
+        self.url = None
+
+    def __enter__(self) -> "RDF4JTransaction":
+        response = self.session.post(
+            f"{self.repository_url}/transactions", timeout=self.timeout
+        )
+        if response.status_code != 201:
+            raise TriplestoreError("Starting a transaction", response)
+        self.url = response.headers["Location"]
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self._send("COMMIT", "Committing the transaction")
+            return False
+        try:
+            response = self.session.delete(self.url, timeout=self.timeout)
+            if response.status_code != 204:
+                logger.error(f"Rolling back {self.url} failed: {response.status_code}")
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Rolling back {self.url} failed: {e}")
+        return False
+
+    def add(self, data: bytes, content_type: str = "application/n-triples"):
+        """Adds serialised statements to the default graph."""
+        headers = {"Content-Type": f"{content_type}; charset=utf-8"}
+        self._send("ADD", "Adding statements", data=data, headers=headers)
+
+    def remove(self, data: bytes, content_type: str = "application/n-triples"):
+        """Removes serialised statements from every graph that holds them."""
+        headers = {"Content-Type": f"{content_type}; charset=utf-8"}
+        self._send("DELETE", "Removing statements", data=data, headers=headers)
+
+    def update(self, update: str):
+        """
+        Executes a SPARQL update inside the transaction. It is sent as the request body,
+        since an update with a long VALUES block does not fit into a URL.
+        """
+        headers = {"Content-Type": "application/sparql-update; charset=utf-8"}
+        self._send(
+            "UPDATE",
+            "Updating statements",
+            data=update.encode("utf-8"),
+            headers=headers,
+        )
+
+    def _send(
+        self, action: str, description: str, params: Optional[Dict] = None, **kwargs
+    ):
+        response = self.session.put(
+            self.url,
+            params={"action": action, **(params or {})},
+            timeout=self.timeout,
+            **kwargs,
+        )
+        if response.status_code not in (200, 204):
+            raise TriplestoreError(description, response)
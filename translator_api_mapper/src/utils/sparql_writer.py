@@ -0,0 +1,248 @@
+import gzip
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Iterable, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from utils.translator_utils import ENDPOINT_URL, REQUEST_TIMEOUT, RETRY_STATUS_CODES
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Statements per request: the first batch, and the bounds of the adaptive size
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", "1000"))
+WRITE_MIN_BATCH_SIZE = 100
+WRITE_MAX_BATCH_SIZE = int(os.getenv("WRITE_MAX_BATCH_SIZE", "100000"))
+# Uncompressed bytes per request, whatever the batch size
+WRITE_MAX_PAYLOAD_BYTES = int(os.getenv("WRITE_MAX_PAYLOAD_BYTES", str(16 * 1024**2)))
+# The batch size follows the latency of the requests towards this duration
+WRITE_TARGET_SECONDS = float(os.getenv("WRITE_TARGET_SECONDS", "2"))
+WRITE_MAX_IN_FLIGHT = int(os.getenv("WRITE_MAX_IN_FLIGHT", "4"))
+# Retries of a busy or failed request, waiting 1, 2, 4 seconds
+WRITE_MAX_RETRIES = 3
+WRITE_BACKOFF_SECONDS = 1.0
+# Bodies are compressed for the transfer only, so speed matters more than size
+WRITE_COMPRESS_LEVEL = 1
+
+
+class WriteError(Exception):
+    """Raised when the triplestore rejects a batch of statements."""
+
+    def __init__(self, status_code: Optional[int], message: str):
+        self.status_code = status_code
+        super().__init__(message)
+
+
+class SPARQLWriter:
+    """
+    Writes N-Triples statements to an RDF4J repository in adaptively sized batches.
+
+    Each batch is added in its own request, which the store applies atomically, with
+    a bounded number of requests in flight. The batch size grows while requests finish
+    well within WRITE_TARGET_SECONDS and shrinks when they take longer, and a batch
+    never exceeds WRITE_MAX_PAYLOAD_BYTES. Busy and failed requests are retried with
+    backoff, and a batch still failing after the retries is counted as failed. A batch
+    the store rejects is split in halves and each half is sent again, down to the
+    single statements that are rejected, so one bad statement does not lose its whole
+    batch.
+    """
+
+    def __init__(
+        self,
+        repository_url: str = ENDPOINT_URL,
+        batch_size: int = WRITE_BATCH_SIZE,
+        max_in_flight: int = WRITE_MAX_IN_FLIGHT,
+        target_seconds: float = WRITE_TARGET_SECONDS,
+        max_payload_bytes: int = WRITE_MAX_PAYLOAD_BYTES,
+        compress: bool = True,
+        on_written: Optional[Callable[[List[str]], None]] = None,
+    ):
+        """
+        Parameters:
+          repository_url: The URL of the RDF4J repository.
+          batch_size: The number of statements of the first batch.
+          max_in_flight: The number of requests sent at the same time.
+          target_seconds: The request duration the batch size is adjusted towards.
+          max_payload_bytes: The maximum uncompressed size of a request body.
+          compress: Whether to gzip the bodies. It is turned off if the server does
+                    not accept compressed requests.
+          on_written: Called from the request threads with the statements of each
+                      batch the store accepted, such as to checkpoint them.
+        """
+        self.statements_url = f"{repository_url.rstrip('/')}/statements"
+        self.batch_size = batch_size
+        self.target_seconds = target_seconds
+        self.max_payload_bytes = max_payload_bytes
+        self.compress = compress
+        self.on_written = on_written
+        # Set once the server accepted a compressed request
+        self._compression_accepted = False
+        self.max_in_flight = max(max_in_flight, 1)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_in_flight)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.executor = ThreadPoolExecutor(self.max_in_flight)
+        self._lock = threading.Lock()
+        self._pending: List[Future] = []
+        self._batch: List[bytes] = []
+        self._batch_bytes = 0
+        self._start = time.perf_counter()
+        self.written = 0
+        self.requests = 0
+        self.failed = 0
+        self.rejected: List[str] = []
+
+    def __enter__(self) -> "SPARQLWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def add(self, statement: str):
+        """Queues an N-Triples statement, such as '<s> <p> <o> .'."""
+        line = statement.strip().encode("utf-8") + b"\n"
+        self._batch.append(line)
+        self._batch_bytes += len(line)
+        if (
+            len(self._batch) >= self.batch_size
+            or self._batch_bytes >= self.max_payload_bytes
+        ):
+            self.flush()
+
+    def add_all(self, statements: Iterable[str]):
+        for statement in statements:
+            self.add(statement)
+
+    def flush(self):
+        """Sends the queued statements, waiting while too many requests are in flight."""
+        if not self._batch:
+            return
+        batch = self._batch
+        self._batch = []
+        self._batch_bytes = 0
+        while len(self._pending) >= self.max_in_flight:
+            self._pending.pop(0).result()
+        self._pending.append(self.executor.submit(self._write, batch))
+
+    def close(self):
+        """Sends the remaining statements, waits for all requests and logs the rate."""
+        self.flush()
+        for future in self._pending:
+            future.result()
+        self._pending = []
+        self.executor.shutdown(wait=True)
+        self.session.close()
+        seconds = time.perf_counter() - self._start
+        rate = self.written / seconds if seconds > 0 else 0
+        logger.info(
+            f"Wrote {self.written} statements in {self.requests} requests and "
+            f"{seconds:.1f}s ({rate:.0f} statements/s), {len(self.rejected)} rejected "
+            f"and {self.failed} failed."
+        )
+        for statement in self.rejected[:10]:
+            logger.error(f"Rejected statement: {statement}")
+
+    def _write(self, batch: List[bytes]):
+        try:
+            self._post_with_retries(batch)
+        except WriteError as e:
+            if e.status_code is None or e.status_code in RETRY_STATUS_CODES:
+                with self._lock:
+                    self.failed += len(batch)
+                logger.error(f"Writing {len(batch)} statements failed: {e}")
+                return
+            if len(batch) == 1:
+                with self._lock:
+                    self.rejected.append(batch[0].decode("utf-8").strip())
+                logger.error(f"A statement was rejected: {e}")
+                return
+            # Smaller batches isolate the bad statements and are kinder to a busy store
+            with self._lock:
+                self.batch_size = max(len(batch) // 2, WRITE_MIN_BATCH_SIZE)
+            middle = len(batch) // 2
+            self._write(batch[:middle])
+            self._write(batch[middle:])
+            return
+        with self._lock:
+            self.written += len(batch)
+        if self.on_written is not None:
+            self.on_written([line.decode("utf-8").strip() for line in batch])
+
+    def _post_with_retries(self, batch: List[bytes]):
+        data = b"".join(batch)
+        for attempt in range(WRITE_MAX_RETRIES + 1):
+            start = time.perf_counter()
+            try:
+                response = self._post(data)
+            except requests.exceptions.RequestException as e:
+                status_code, message = None, f"{type(e).__name__}: {e}"
+            else:
+                if response.status_code in (200, 204):
+                    self._adapt(len(batch), time.perf_counter() - start)
+                    return
+                status_code = response.status_code
+                message = f"Status {status_code}: {response.text[:500]}"
+                if status_code not in RETRY_STATUS_CODES:
+                    raise WriteError(status_code, message)
+            if attempt < WRITE_MAX_RETRIES:
+                logger.warning(f"Writing {len(batch)} statements failed ({message}).")
+                time.sleep(WRITE_BACKOFF_SECONDS * 2**attempt)
+        raise WriteError(status_code, message)
+
+    def _post(self, data: bytes) -> requests.Response:
+        with self._lock:
+            self.requests += 1
+            compress = self.compress
+            fallback = not self._compression_accepted
+        headers = {"Content-Type": "application/n-triples; charset=utf-8"}
+        if not compress:
+            return self.session.post(
+                self.statements_url, data=data, headers=headers, timeout=REQUEST_TIMEOUT
+            )
+        response = self.session.post(
+            self.statements_url,
+            data=gzip.compress(data, compresslevel=WRITE_COMPRESS_LEVEL),
+            headers={**headers, "Content-Encoding": "gzip"},
+            timeout=REQUEST_TIMEOUT,
+        )
+        if response.status_code in (200, 204):
+            with self._lock:
+                self._compression_accepted = True
+        # A server that does not decode the request fails to parse or accept it
+        if not fallback or response.status_code not in (400, 415):
+            return response
+        with self._lock:
+            self.requests += 1
+        plain = self.session.post(
+            self.statements_url, data=data, headers=headers, timeout=REQUEST_TIMEOUT
+        )
+        if plain.status_code in (200, 204):
+            with self._lock:
+                if self.compress:
+                    logger.warning(
+                        "The triplestore does not accept compressed requests. "
+                        "Sending uncompressed batches."
+                    )
+                self.compress = False
+        return plain
+
+    def _adapt(self, batch_statements: int, seconds: float):
+        """Moves the batch size towards the size that takes target_seconds to write."""
+        with self._lock:
+            if batch_statements < self.batch_size:
+                # A short last batch says little about the store
+                return
+            if seconds < self.target_seconds / 2:
+                size = self.batch_size * 2
+            elif seconds > self.target_seconds:
+                size = int(self.batch_size * self.target_seconds / seconds)
+            else:
+                return
+            self.batch_size = min(max(size, WRITE_MIN_BATCH_SIZE), WRITE_MAX_BATCH_SIZE)
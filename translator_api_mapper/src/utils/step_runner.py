@@ -0,0 +1,138 @@
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List, Set
+
+from utils.identifier_index import IDENTIFIER_INDEX, IdentifierIndex
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Steps running at the same time
+STEP_CONCURRENCY = int(os.getenv("MAPPER_STEP_CONCURRENCY", "4"))
+
+
+class Step:
+    """
+    A pipeline step and the data it depends on.
+
+    A step reads the node sets of some namespaces of the identifier index and may
+    write, that is add or remove, nodes of some namespaces. Its function is called with
+    the results of the steps it requires, in order.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        run: Callable[..., Any],
+        requires: Iterable[str] = (),
+        reads: Iterable[str] = (),
+        writes: Iterable[str] = (),
+    ):
+        """
+        Parameters:
+          name: The unique name of the step.
+          run: The function of the step.
+          requires: The names of the steps whose results are passed to run.
+          reads: The namespaces whose node sets the step looks up.
+          writes: The namespaces whose nodes the step adds or removes.
+        """
+        self.name = name
+        self.run = run
+        self.requires = tuple(requires)
+        self.reads = tuple(reads)
+        self.writes = tuple(writes)
+
+
+def get_dependencies(steps: List[Step]) -> Dict[str, Set[str]]:
+    """
+    Derives the steps each step waits for.
+
+    Besides the steps it requires, a step waits for every earlier step that writes a
+    namespace it reads or writes, and for every earlier step that reads a namespace it
+    writes. The order of the list is the order in which conflicting steps run.
+
+    Raises:
+      ValueError: If a name is not unique, or a step requires a step that is not
+        listed before it.
+    """
+    dependencies: Dict[str, Set[str]] = {}
+    for position, step in enumerate(steps):
+        if step.name in dependencies:
+            raise ValueError(f"Duplicate step name '{step.name}'.")
+        missing = [name for name in step.requires if name not in dependencies]
+        if missing:
+            raise ValueError(
+                f"Step '{step.name}' requires {missing}, which are not listed before it."
+            )
+        accessed = set(step.reads) | set(step.writes)
+        dependencies[step.name] = set(step.requires) | {
+            earlier.name
+            for earlier in steps[:position]
+            if accessed & set(earlier.writes) or set(step.writes) & set(earlier.reads)
+        }
+    return dependencies
+
+
+def _run_step(step: Step, arguments: List[Any], index: IdentifierIndex) -> Any:
+    start = time.perf_counter()
+    # Snapshots are fetched once and shared until a step writes their namespace
+    index.load(*step.reads)
+    result = step.run(*arguments)
+    logger.info(f"Step '{step.name}' finished in {time.perf_counter() - start:.1f}s.")
+    return result
+
+
+def run_steps(
+    steps: List[Step],
+    max_workers: int = STEP_CONCURRENCY,
+    index: IdentifierIndex = IDENTIFIER_INDEX,
+) -> Dict[str, Any]:
+    """
+    Runs steps concurrently, each as soon as the steps it depends on have finished.
+
+    After a step finishes, only the namespaces it writes are invalidated in the index,
+    so the other snapshots stay shared. If a step fails, no further step starts, the
+    running ones are waited for, and the error is raised.
+
+    Parameters:
+      steps: The steps, in the order conflicting steps run.
+      max_workers: The number of steps running at the same time.
+      index: The identifier index the steps look up.
+
+    Returns:
+      A dictionary mapping each step name to the result of its function.
+    """
+    dependencies = get_dependencies(steps)
+    results: Dict[str, Any] = {}
+    pending = list(steps)
+    running: Dict[Future, Step] = {}
+    failure = None
+    with ThreadPoolExecutor(max(max_workers, 1)) as executor:
+        while pending or running:
+            if failure is None:
+                for step in list(pending):
+                    if len(running) >= max(max_workers, 1):
+                        break
+                    if dependencies[step.name] <= results.keys():
+                        arguments = [results[name] for name in step.requires]
+                        future = executor.submit(_run_step, step, arguments, index)
+                        running[future] = step
+                        pending.remove(step)
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                step = running.pop(future)
+                # The writes may be partial, so the snapshots are stale either way
+                index.invalidate(*step.writes)
+                try:
+                    results[step.name] = future.result()
+                except Exception as e:
+                    logger.error(f"Step '{step.name}' failed: {e}")
+                    failure = failure or e
+    if failure is not None:
+        raise failure
+    return results
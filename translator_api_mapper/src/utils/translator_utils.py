@@ -1,9 +1,17 @@
 import logging
 import os
-from typing import Dict, List, Optional
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
+import ijson
 import requests
-from SPARQLWrapper import JSON, SPARQLWrapper
+from requests.adapters import HTTPAdapter
+from utils.normalization_cache import (
+    NORMALIZATION_OFFLINE,
+    NormalizationCache,
+    open_normalization_cache,
+)
 
 logging.basicConfig(level=logging.WARNING)
 logger = logging.getLogger(__name__)
@@ -13,9 +21,29 @@ PREFIXES = {
     "uniprot": "https://identifiers.org/uniprot/",
     "ensembl": "http://identifiers.org/ensembl/",
     "ncbigene": "http://identifiers.org/ncbigene/",
+    "pr": "http://purl.obolibrary.org/obo/PR_",
+}
+# CURIE prefix of each namespace of PREFIXES, as used by the Translator API
+CURIE_PREFIXES = {
+    "uniprot": "UniProtKB",
+    "ensembl": "ENSEMBL",
+    "ncbigene": "NCBIGene",
+    "pr": "PR",
+}
+_NAMESPACES_BY_CURIE_PREFIX = {
+    curie_prefix: PREFIXES[name] for name, curie_prefix in CURIE_PREFIXES.items()
 }
 # Node Normalization Endpoint
 NODE_NORMALIZATION_URL = "https://nodenormalization-sri.renci.org/get_normalized_nodes"
+# CURIEs per Node Normalizer request, and requests in flight at the same time
+NORMALIZATION_CHUNK_SIZE = int(os.getenv("NORMALIZATION_CHUNK_SIZE", "1000"))
+NORMALIZATION_CONCURRENCY = int(os.getenv("NORMALIZATION_CONCURRENCY", "4"))
+# Retries of a chunk on 429 and 5xx responses, waiting 1, 2, 4... seconds unless the
+# response has a Retry-After header
+NORMALIZATION_MAX_RETRIES = 5
+NORMALIZATION_BACKOFF_SECONDS = 1.0
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+REQUEST_TIMEOUT = 300  # seconds
 # RDF4J local endpoint configuration
 # ENDPOINT_URL = os.getenv(
 #     "ENDPOINT_URL", "http://triplestore:8080/rdf4j-server/repositories/obask"
@@ -25,48 +53,257 @@ ENDPOINT_URL = os.getenv(
 )
 # RO Relation: Gene produces Protein
 RO_0003000 = "http://purl.obolibrary.org/obo/RO_0003000"
-
-BATCH_SIZE = 1000
-
-# Configure the SPARQL query endpoint
-sparql_query = SPARQLWrapper(ENDPOINT_URL)
-sparql_query.setReturnFormat(JSON)
+OIO_HAS_DB_XREF = "http://www.geneontology.org/formats/oboInOwl#hasDbXref"
 
 
 def build_sparql_query(prefix: str) -> str:
+    """
+    Builds the query of the typed subjects whose IRI starts with a prefix.
+
+    Parameters:
+      prefix: The IRI prefix, such as PREFIXES["uniprot"].
+    """
     return f"""
     SELECT DISTINCT ?s
-    WHERE {{ 
-      ?s a ?o. FILTER(contains(str(?s), "{prefix}"))
+    WHERE {{
+      ?s a ?o . FILTER(STRSTARTS(STR(?s), "{prefix}"))
     }}
     """
 
 
-def run_query(query: str) -> List[str]:
-    """Executes a SPARQL SELECT query and returns the results as a list of URIs."""
-    sparql_query.setQuery(query)
+def parse_tsv_term(term: str) -> str:
+    """Returns the IRI or the lexical value of a term of a SPARQL TSV result."""
+    if term.startswith("<") and term.endswith(">"):
+        return term[1:-1]
+    if term.startswith('"'):
+        return term[1 : term.rindex('"')]
+    return term
 
-    try:
-        results = sparql_query.query().convert()
-        return [result["s"]["value"] for result in results["results"]["bindings"]]
-    except Exception as e:
-        logger.error(f"An error occurred: {e}")
-        return []
 
+def iter_query_uris(
+    query: str, session: Optional[requests.Session] = None
+) -> Iterator[str]:
+    """
+    Executes a single-variable SPARQL SELECT query and yields its values as they arrive.
+
+    The result is requested as TSV and parsed row by row, so it is never held in
+    memory as a whole.
+    """
+    http = session if session is not None else requests
+    with http.post(
+        ENDPOINT_URL,
+        data={"query": query},
+        headers={"Accept": "text/tab-separated-values"},
+        stream=True,
+        timeout=REQUEST_TIMEOUT,
+    ) as response:
+        response.raise_for_status()
+        # SPARQL TSV is UTF-8 whether or not the Content-Type says so
+        response.encoding = response.encoding or "utf-8"
+        lines = response.iter_lines(decode_unicode=True)
+        # The first line names the variables
+        next(lines, None)
+        for line in lines:
+            if line:
+                yield parse_tsv_term(line.split("\t", 1)[0])
+
+
+def iter_prefix_uris(prefix: str) -> Iterator[str]:
+    """
+    Yields the typed subjects whose IRI starts with a prefix.
 
-def uri_to_curie(uri_list: List[str]) -> List[str]:
+    RDF4J cannot anchor the prefix filter to an index, so every query scans all typed
+    subjects. A single unsorted query scans them once, and its streamed result keeps
+    the client's memory bounded without paging. A failed query is logged and ends the
+    retrieval.
+
+    Parameters:
+      prefix: The IRI prefix, such as PREFIXES["uniprot"].
+    """
+    total = 0
+    with requests.Session() as session:
+        try:
+            for uri in iter_query_uris(build_sparql_query(prefix), session):
+                total += 1
+                yield uri
+        except requests.exceptions.RequestException as e:
+            logger.error(f"An error occurred: {e}")
+            return
+    logger.info(f"Retrieved {total} terms starting with '{prefix}'.")
+
+
+def uri_to_curie(uri_list: Iterable[str]) -> List[str]:
     """Converts RDF URIs to CURIEs for use with the Translator API."""
     curie_list = []
     for uri in uri_list:
-        if uri.startswith(PREFIXES["uniprot"]):
-            curie_list.append(f"UniProtKB:{uri.replace(PREFIXES['uniprot'], '')}")
-        elif uri.startswith(PREFIXES["ensembl"]):
-            curie_list.append(f"ENSEMBL:{uri.replace(PREFIXES['ensembl'], '')}")
-        elif uri.startswith(PREFIXES["ncbigene"]):
-            curie_list.append(f"NCBIGene:{uri.replace(PREFIXES['ncbigene'], '')}")
+        for name, namespace in PREFIXES.items():
+            if uri.startswith(namespace):
+                curie_list.append(f"{CURIE_PREFIXES[name]}:{uri[len(namespace):]}")
+                break
     return curie_list
 
 
+def curie_to_uri(curie: str) -> Optional[str]:
+    """Converts a CURIE of one of the PREFIXES namespaces to its URI, else None."""
+    curie_prefix, _, local_id = curie.partition(":")
+    namespace = _NAMESPACES_BY_CURIE_PREFIX.get(curie_prefix)
+    return namespace + local_id if namespace is not None else None
+
+
+def _retry_delay(response: Optional[requests.Response], attempt: int) -> float:
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after and retry_after.isdigit():
+        return float(retry_after)
+    return NORMALIZATION_BACKOFF_SECONDS * 2**attempt
+
+
+def _select_identifiers(
+    info: Optional[Dict], source_field: str, filter_keywords: Optional[List[str]]
+) -> List[str]:
+    """Extract the identifiers of `source_field` from a Node Normalizer result."""
+    if info is None or source_field not in info:
+        return []
+    data = info[source_field]
+    entries = [data] if isinstance(data, dict) else data or []
+    identifiers = []
+    for entry in entries:
+        ident = entry.get("identifier", "")
+        # If no filter list provided, accept everything, otherwise keep the identifier
+        # if any keyword matches
+        if not filter_keywords or any(kw in ident for kw in filter_keywords):
+            identifiers.append(ident)
+    return identifiers
+
+
+def _fetch_chunk(
+    session: requests.Session, chunk: List[str]
+) -> List[Tuple[str, Optional[Dict]]]:
+    """
+    Normalizes one chunk of CURIEs, retrying on rate limits and server errors.
+
+    The response is parsed as it arrives, one CURIE at a time, so it is never held in
+    memory as a whole.
+    """
+    for attempt in range(NORMALIZATION_MAX_RETRIES + 1):
+        response = None
+        try:
+            response = session.post(
+                NODE_NORMALIZATION_URL,
+                json={"curies": chunk},
+                stream=True,
+                timeout=REQUEST_TIMEOUT,
+            )
+            if response.status_code == 200:
+                response.raw.decode_content = True
+                return list(ijson.kvitems(response.raw, "", use_float=True))
+            if response.status_code not in RETRY_STATUS_CODES:
+                logger.error(
+                    f"Error fetching normalized CURIEs. Status code: "
+                    f"{response.status_code}"
+                )
+                return []
+            error = f"status code {response.status_code}"
+        except (requests.exceptions.RequestException, ijson.JSONError) as e:
+            error = str(e)
+        finally:
+            if response is not None:
+                response.close()
+        if attempt < NORMALIZATION_MAX_RETRIES:
+            delay = _retry_delay(response, attempt)
+            logger.warning(
+                f"Normalizing {len(chunk)} CURIEs failed ({error}). "
+                f"Retrying in {delay:.0f}s."
+            )
+            time.sleep(delay)
+    logger.error(
+        f"Error fetching normalized CURIEs for {len(chunk)} CURIEs after "
+        f"{NORMALIZATION_MAX_RETRIES} retries: {error}"
+    )
+    return []
+
+
+def _fetch_normalized_nodes(
+    curies: List[str], chunk_size: int, concurrency: int
+) -> Iterator[List[Tuple[str, Optional[Dict]]]]:
+    """Yields the raw results of CURIEs chunk by chunk, fetched concurrently."""
+    chunks = [
+        curies[start : start + chunk_size]
+        for start in range(0, len(curies), chunk_size)
+    ]
+    if not chunks:
+        return
+    workers = max(min(concurrency, len(chunks)), 1)
+    with requests.Session() as session, ThreadPoolExecutor(workers) as executor:
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        # Bound the finished chunks waiting to be consumed along with the requests
+        pending = []
+        for chunk in chunks:
+            pending.append(executor.submit(_fetch_chunk, session, chunk))
+            if len(pending) >= 2 * workers:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+    logger.info(f"Normalized {len(curies)} CURIEs in {len(chunks)} requests.")
+
+
+def iter_normalized_curies(
+    curie_list: List[str],
+    source_field: str,
+    filter_keywords: Optional[List[str]] = None,
+    chunk_size: int = NORMALIZATION_CHUNK_SIZE,
+    concurrency: int = NORMALIZATION_CONCURRENCY,
+    cache: Optional[NormalizationCache] = None,
+    offline: bool = NORMALIZATION_OFFLINE,
+) -> Iterator[Tuple[str, List[str]]]:
+    """
+    Normalizes CURIEs from the cache, and the misses in chunks sent concurrently over
+    a pooled session.
+
+    Duplicate CURIEs are looked up once. The raw results of the misses are stored in
+    the cache as they arrive. Chunks that still fail after the retries are logged and
+    skipped, so the results may be partial.
+
+    Parameters:
+      curie_list: List of CURIEs to normalize.
+      source_field: The key from the API response to extract identifiers from.
+      filter_keywords: Optional list of substrings to filter the identifier values.
+      chunk_size: The number of CURIEs per request.
+      concurrency: The number of requests in flight at the same time.
+      cache: The cache of Node Normalizer results, if any.
+      offline: Answer from the cache only. Misses are logged and left out.
+
+    Yields:
+      Each CURIE with normalized identifiers and the list of those identifiers, the
+      cached ones first.
+    """
+    unique_curies = list(dict.fromkeys(curie_list))
+    cached = cache.lookup(unique_curies) if cache is not None else {}
+    for curie, info in cached.items():
+        identifiers = _select_identifiers(info, source_field, filter_keywords)
+        if identifiers:
+            yield curie, identifiers
+    misses = [curie for curie in unique_curies if curie not in cached]
+    logger.info(
+        f"{len(cached)} of {len(unique_curies)} CURIEs found in the normalization "
+        f"cache."
+    )
+    if offline:
+        if misses:
+            logger.warning(
+                f"Offline mode: {len(misses)} CURIEs are not cached and are skipped."
+            )
+        return
+    for results in _fetch_normalized_nodes(misses, chunk_size, concurrency):
+        if cache is not None:
+            cache.upsert(results)
+        for curie, info in results:
+            identifiers = _select_identifiers(info, source_field, filter_keywords)
+            if identifiers:
+                yield curie, identifiers
+
+
 def get_normalized_curies(
     curie_list: List[str],
     source_field: str,
@@ -89,39 +326,13 @@ def get_normalized_curies(
       A dictionary mapping each input CURIE to a list of normalized identifier strings
       that contain *any* of the filter_keywords (or all identifiers if no keywords given).
     """
-    normalized_curies: Dict[str, List[str]] = {}
-    response = requests.post(NODE_NORMALIZATION_URL, json={"curies": curie_list})
-
-    if response.status_code != 200:
-        logger.error(
-            f"Error fetching normalized CURIEs. Status code: {response.status_code}"
+    cache = open_normalization_cache()
+    try:
+        return dict(
+            iter_normalized_curies(
+                curie_list, source_field, filter_keywords, cache=cache
+            )
         )
-        return normalized_curies
-
-    result_json = response.json()
-
-    def identifier_allowed(identifier: str) -> bool:
-        # If no filter list provided, accept everything
-        if not filter_keywords:
-            return True
-        # Otherwise keep if any keyword matches
-        return any(kw in identifier for kw in filter_keywords)
-
-    for curie in curie_list:
-        info = result_json.get(curie, {})
-        if info is None or source_field not in info:
-            continue
-
-        data = info[source_field]
-
-        if isinstance(data, dict):
-            ident = data.get("identifier", "")
-            if identifier_allowed(ident):
-                normalized_curies[curie] = [ident]
-        elif isinstance(data, list):
-            for id_dict in data:
-                ident = id_dict.get("identifier", "")
-                if identifier_allowed(ident):
-                    normalized_curies.setdefault(curie, []).append(ident)
-
-    return normalized_curies
+    finally:
+        if cache is not None:
+            cache.close()